@@ -0,0 +1,59 @@
+# -*- coding:utf8 -*-
+"""
+Conversion latency: fresh notsorest2html.py process vs nsr_client.py
+with running nsr_daemon.py
+"""
+import os
+import sys
+import time
+import signal
+import optparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run(cmd, env, repeat):
+    best = None
+    for _ in range(repeat):
+        stime = time.time()
+        subprocess.check_call(cmd, env=env, stdout=open(os.devnull, 'w'))
+        elapsed = time.time() - stime
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options] [POST]")
+    parser.add_option("-r", "--repeat", dest='repeat', type='int', default=5)
+    opts, posts = parser.parse_args(argv[1:])
+    post = posts[0] if posts else os.path.join(ROOT, 'posts', 'lxc.txt')
+
+    tmp_dir = tempfile.mkdtemp()
+    env = dict(os.environ, NSR_SOCKET=os.path.join(tmp_dir, 'nsr.sock'))
+    args = ['-o', os.path.join(tmp_dir, 'post.html'), post]
+
+    daemon = subprocess.Popen([sys.executable,
+                               os.path.join(ROOT, 'nsr_daemon.py')],
+                              env=env, stdout=subprocess.PIPE)
+    try:
+        daemon.stdout.readline()
+
+        fresh = run([sys.executable, os.path.join(ROOT, 'notsorest2html.py')]
+                        + args, env, opts.repeat)
+        client = run([sys.executable, os.path.join(ROOT, 'nsr_client.py')]
+                        + args, env, opts.repeat)
+    finally:
+        daemon.send_signal(signal.SIGINT)
+        daemon.wait()
+        for fname in os.listdir(tmp_dir):
+            os.unlink(os.path.join(tmp_dir, fname))
+        os.rmdir(tmp_dir)
+
+    print "fresh process   {0:8.1f} ms".format(fresh * 1000)
+    print "client + daemon {0:8.1f} ms".format(client * 1000)
+    print "speedup         {0:8.1f}x".format(fresh / client)
+
+if __name__ == "__main__":
+    main(sys.argv)
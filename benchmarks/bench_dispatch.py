@@ -0,0 +1,99 @@
+# -*- coding:utf8 -*-
+"""
+Block dispatch cost on a document with thousands of small blocks.
+
+'dispatch' resolves handler for every block - dispatch table lookup
+vs the old way, getattr for every wrapper and block type, inspect
+of handler arguments and new closure for highlighted blocks.
+'render' is full rendering of the document with caches disabled.
+"""
+import os
+import sys
+import time
+import inspect
+import optparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import corpus
+import notsorest2html
+from nsr_lexer import parse
+
+MIX = {'para': 4, 'header': 2, 'python': 2, 'shell': 1, 'xml': 1,
+       'hide': 1, 'center': 1}
+
+
+def legacy_lookup(html, tp):
+    "handler lookup, as it was done before dispatch table"
+    tp = tp.split('.')
+    for curr_tp in tp[:-1]:
+        getattr(html, 'on_open_' + curr_tp)
+        getattr(html, 'on_close_' + curr_tp)
+
+    name = tp[-1]
+    if name in html.highlighters_map:
+        lexer = html.get_lexer(name)
+        func = lambda code, line: (lexer, code, line)
+    elif name in ('text_h2', 'text_h3', 'text_h4'):
+        func = lambda text: (name, text)
+    else:
+        func = getattr(html, 'on_' + name)
+    return 'line' in inspect.getargspec(func).args
+
+
+def table_lookup(html, tp):
+    handler = html.handlers.get(tp)
+    if handler is None:
+        handler = html.handlers[tp] = html.resolve_handler(tp)
+    return handler
+
+
+def best_time(func, repeat):
+    best = None
+    for _ in range(repeat):
+        stime = time.time()
+        func()
+        elapsed = time.time() - stime
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("-n", "--blocks", dest='blocks', type='int',
+                      default=5000)
+    parser.add_option("-r", "--repeat", dest='repeat', type='int', default=5)
+    bopts, _ = parser.parse_args(argv[1:])
+
+    opts, _ = notsorest2html.get_option_parser().parse_args(['-n', '-c', ''])
+    styles = notsorest2html.load_styles(opts)
+    text = corpus.make_document(bopts.blocks, MIX)
+    types = [block.tp for block in parse(text)]
+
+    html = notsorest2html.BlogspotHTMLProvider(opts)
+
+    def run(lookup):
+        return lambda: [lookup(html, tp) for tp in types]
+
+    legacy = best_time(run(legacy_lookup), bopts.repeat)
+    table = best_time(run(table_lookup), bopts.repeat)
+
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        render = best_time(
+                    lambda: notsorest2html.render_text(text, opts, styles),
+                    bopts.repeat)
+    finally:
+        sys.stdout = stdout
+
+    print "blocks           {0:8}".format(len(types))
+    print "legacy dispatch  {0:8.2f} ms {1:6.2f} us/block".format(
+                    legacy * 1000, legacy * 1000000 / len(types))
+    print "table dispatch   {0:8.2f} ms {1:6.2f} us/block".format(
+                    table * 1000, table * 1000000 / len(types))
+    print "render           {0:8.2f} ms".format(render * 1000)
+
+if __name__ == "__main__":
+    main(sys.argv)
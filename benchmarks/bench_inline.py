@@ -0,0 +1,50 @@
+# -*- coding:utf8 -*-
+"""
+Inline markup throughput: single pass renderer vs regexp chain,
+on all text blocks of the posts
+"""
+import os
+import sys
+import time
+import optparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'tests'))
+
+from notsorest2html import escape_html
+from test_inline import make_provider, post_texts
+
+
+def bench(func, texts, repeat):
+    best = None
+    for _ in range(repeat):
+        stime = time.time()
+        for text in texts:
+            func(text)
+        elapsed = time.time() - stime
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("-r", "--repeat", dest='repeat', type='int', default=20)
+    opts, _ = parser.parse_args(argv[1:])
+
+    texts = list(post_texts())
+    size = sum(len(text) for text in texts)
+
+    provider = make_provider()
+    new = bench(provider.text_to_html, texts, opts.repeat)
+    old = bench(lambda text: provider.regex_inline(escape_html(text)),
+                texts, opts.repeat)
+
+    print "{0} text blocks, {1} chars".format(len(texts), size)
+    for name, elapsed in (("regexp chain", old), ("single pass", new)):
+        print "{0:<14} {1:8.2f} ms {2:8.2f} MB/s".format(
+                    name, elapsed * 1000, size / elapsed / 1024 / 1024)
+    print "speedup        {0:8.2f}x".format(old / new)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,76 @@
+# -*- coding:utf8 -*-
+"""
+Backref resolution on synthetic post with many links:
+one pass over placeholders vs str.replace per linklist entry
+"""
+import os
+import sys
+import time
+import optparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import notsorest2html
+from notsorest2html import BlogspotHTMLProvider, re_backref_mark
+
+
+def make_post(links, paras):
+    text = []
+    for para in range(paras):
+        text.append(u" ".join(u"text [link{0}] more text".format(
+                                    (para * 7 + pos) % links)
+                                        for pos in range(10)))
+        text.append(u"")
+
+    text.append(u"linklist:")
+    for link in range(links):
+        text.append(u"    link{0} http://example.com/{0}/".format(link))
+
+    return u"\n".join(text) + u"\n"
+
+
+def replace_each(provider, res):
+    "former finalize - one str.replace over the page per link"
+    res = re_backref_mark.sub(
+                lambda mobj: provider.HREF_PREFIX + mobj.group(1), res)
+    for name, val in provider.href_map.items():
+        res = res.replace(provider.HREF_PREFIX + name, val)
+    return res
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("-r", "--repeat", dest='repeat', type='int', default=5)
+    bopts, _ = parser.parse_args(argv[1:])
+
+    opts, _ = notsorest2html.get_option_parser().parse_args(['-n', '-c', ''])
+    styles = notsorest2html.load_styles(opts)
+
+    print "{0:>6} {1:>10} {2:>12} {3:>12} {4:>12}".format(
+                "links", "page KB", "render ms", "replace ms", "one pass ms")
+
+    for links in (100, 300, 1000):
+        provider = BlogspotHTMLProvider(opts)
+        provider.finalize = lambda: None
+
+        stime = time.time()
+        notsorest2html.not_so_rest_to_xxx(make_post(links, links // 2),
+                                          styles, provider)
+        render = time.time() - stime
+
+        page = provider.get_result()
+        times = []
+        for func in (lambda: replace_each(provider, page),
+                     lambda: provider.resolve_backrefs(page)):
+            stime = time.time()
+            for _ in range(bopts.repeat):
+                func()
+            times.append((time.time() - stime) / bopts.repeat)
+
+        print "{0:>6} {1:>10} {2:>12.2f} {3:>12.2f} {4:>12.2f}".format(
+                    links, len(page) // 1024, render * 1000,
+                    times[0] * 1000, times[1] * 1000)
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,72 @@
+# -*- coding:utf8 -*-
+"""
+Rendering of the largest posts with code blocks highlighted in
+sequence and by block pool (--block-jobs). Caches and lint are
+disabled, so highlighting is done every time.
+"""
+import os
+import sys
+import glob
+import time
+import optparse
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import notsorest2html
+
+
+def render_time(text, opts, styles, repeat):
+    best = None
+    res = None
+    for _ in range(repeat):
+        stime = time.time()
+        res = notsorest2html.render_text(text, opts, styles)
+        elapsed = time.time() - stime
+        best = elapsed if best is None else min(best, elapsed)
+    return best, res
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options] [POST...]")
+    parser.add_option("-j", "--jobs", dest='jobs', type='int',
+                      default=max(2, multiprocessing.cpu_count()))
+    parser.add_option("-r", "--repeat", dest='repeat', type='int', default=3)
+    parser.add_option("-n", "--posts", dest='posts', type='int', default=3,
+                      help="number of largest posts to render")
+    bopts, posts = parser.parse_args(argv[1:])
+
+    if not posts:
+        posts = sorted(glob.glob(os.path.join(ROOT, 'posts', '*.txt')),
+                       key=os.path.getsize)[::-1][:bopts.posts]
+
+    opts, _ = notsorest2html.get_option_parser().parse_args(['-n', '-c', ''])
+    styles = notsorest2html.load_styles(opts)
+
+    print "cpu count {0}, block jobs {1}".format(multiprocessing.cpu_count(),
+                                                 bopts.jobs)
+
+    stdout = sys.stdout
+    for fname in posts:
+        text = open(fname).read().decode('utf8')
+
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            opts.block_jobs = 1
+            seq, seq_res = render_time(text, opts, styles, bopts.repeat)
+            opts.block_jobs = bopts.jobs
+            par, par_res = render_time(text, opts, styles, bopts.repeat)
+        except Exception as exc:
+            sys.stdout = stdout
+            print "{0:<30} error: {1}".format(os.path.basename(fname), exc)
+            continue
+        finally:
+            sys.stdout = stdout
+
+        print "{0:<30} {1:8.1f} ms {2:8.1f} ms {3:6.2f}x{4}".format(
+                    os.path.basename(fname), seq * 1000, par * 1000,
+                    seq / par, "" if seq_res == par_res else " DIFFERENT")
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -0,0 +1,109 @@
+# -*- coding:utf8 -*-
+"""
+Peak memory of in-memory and streaming render on generated posts
+of growing size. Every render runs in a fresh subprocess. Fails, if
+peak memory of streaming render grows with the post size more, than
+by --max-growth
+"""
+import os
+import sys
+import resource
+import optparse
+import tempfile
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PARA = (u"Paragraph {0} with *bold*, ~italic~, ''code'' and [link{1}] " +
+        u"to http://example.com/{0}/ page.\n\n")
+CODE = u"python:\n    def func{0}(x):\n        return x * {0}\n\n"
+
+
+def make_post(paras):
+    text = [u"<---->\n\n"]
+    for num in range(paras):
+        text.append(PARA.format(num, num % 50))
+        if num % 10 == 0:
+            text.append(CODE.format(num))
+
+    text.append(u"linklist:\n")
+    for num in range(50):
+        text.append(u"    link{0} http://example.com/link/{0}\n".format(num))
+    return u"".join(text)
+
+
+def peak_rss():
+    """
+    peak RSS of the process in KiB. On linux ru_maxrss is kept over exec,
+    so it includes the memory of parent process, VmHWM doesn't
+    """
+    if os.path.exists('/proc/self/status'):
+        with open('/proc/self/status') as fd:
+            for line in fd:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def render(fname, stream):
+    "subprocess side - render post, print peak RSS in KiB"
+    import notsorest2html
+    argv = ['', '-n', '-c', '', '-o', fname + '.html', fname]
+    if stream:
+        argv.insert(1, '--stream')
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    notsorest2html.main(argv)
+    sys.stdout = stdout
+    print peak_rss()
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("-s", "--sizes", dest='sizes', default="2000,10000,40000",
+                      help="comma separated paragraph counts")
+    parser.add_option("-g", "--max-growth", dest='max_growth', type='float',
+                      default=1.2, help="allowed ratio of peak memory of " +
+                                        "streaming render of the largest " +
+                                        "and the smallest post")
+    opts, _ = parser.parse_args(argv[1:])
+
+    print "{0:>8} {1:>10} {2:>14} {3:>14}".format(
+                "paras", "html KB", "memory KB", "stream KB")
+
+    stream_rss = []
+    for paras in map(int, opts.sizes.split(',')):
+        fd, fname = tempfile.mkstemp(suffix='.txt')
+        try:
+            os.write(fd, make_post(paras).encode('utf8'))
+            os.close(fd)
+
+            rss = []
+            for stream in ('', 'stream'):
+                rss.append(int(subprocess.check_output(
+                            [sys.executable, __file__, '--render', fname,
+                             stream])))
+
+            stream_rss.append(rss[1])
+            size = os.stat(fname + '.html').st_size
+            print "{0:>8} {1:>10} {2:>14} {3:>14}".format(
+                        paras, size // 1024, rss[0], rss[1])
+        finally:
+            for path in (fname, fname + '.html'):
+                if os.path.exists(path):
+                    os.unlink(path)
+
+    growth = float(stream_rss[-1]) / stream_rss[0]
+    print "stream memory growth {0:.2f}, allowed {1:.2f}".format(
+                growth, opts.max_growth)
+    if growth > opts.max_growth:
+        print "ERROR: stream memory grows with the post size"
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == '--render':
+        render(sys.argv[2], sys.argv[3] == 'stream')
+    else:
+        sys.exit(main(sys.argv))
@@ -0,0 +1,156 @@
+# -*- coding:utf8 -*-
+"""
+Synthetic notsorest documents for benchmarks.
+
+Document is a random sequence of blocks, drawn with weights from mix -
+{block kind : weight}. Generation is deterministic for the given seed.
+Run as script to print a document.
+"""
+import sys
+import random
+import optparse
+
+DEFAULT_MIX = {'para': 10, 'header': 1, 'list': 2, 'linklist': 1,
+               'python': 4, 'shell': 1, 'xml': 1, 'hide': 1, 'center': 1}
+
+WORDS = (u"python функция object class generator closure декоратор list " +
+         u"dict module import lambda итератор thread socket pipe").split()
+
+
+def words(rand, count):
+    res = []
+    for _ in range(count):
+        word = rand.choice(WORDS)
+        markup = rand.random()
+        if markup < 0.05:
+            word = u"*{0}*".format(word)
+        elif markup < 0.08:
+            word = u"~{0}~".format(word)
+        elif markup < 0.11:
+            word = u"''{0}''".format(word)
+        elif markup < 0.13:
+            word = u"[link{0}]".format(rand.randrange(10))
+        elif markup < 0.15:
+            word = u"http://example.com/{0}/".format(word)
+        res.append(word)
+    return u" ".join(res)
+
+
+def para(rand):
+    lines = [words(rand, 12)]
+    for _ in range(rand.randint(0, 4)):
+        lines.append(words(rand, 12))
+    return u"\n".join(lines)
+
+
+def header(rand):
+    text = words(rand, 3).replace(u"*", u"")
+    return text + u"\n" + rand.choice(u"=-~") * len(text)
+
+
+def items(rand):
+    return u"\n".join(u"* " + words(rand, 8)
+                            for _ in range(rand.randint(2, 6)))
+
+
+def linklist(rand):
+    return u"linklist:\n" + u"\n".join(
+                u"    link{0} http://example.com/link/{0}".format(num)
+                        for num in range(10))
+
+
+def python_code(rand):
+    lines = []
+    for num in range(rand.randint(1, 4)):
+        name = u"func_{0}_{1}".format(num, rand.randrange(1000))
+        lines.append(u"def {0}(value, count=10):".format(name))
+        lines.append(u"    res = [value * i for i in range(count)]")
+        lines.append(u"    return {'name': '" + name + u"', 'res': res}")
+        lines.append(u"")
+    lines.append(u"result = {0}(1)".format(name))
+    return lines
+
+
+def block(tp, lines):
+    return tp + u":\n" + u"\n".join(
+                (u"    " + line) if line else u"" for line in lines)
+
+
+def python(rand, tp='python'):
+    return block(tp, python_code(rand))
+
+
+def shell(rand):
+    return block(u"shell", [u"$ ls -l /tmp | grep {0}".format(
+                                                    rand.choice(WORDS)),
+                           u"-rw-r--r-- 1 user user 42 Jan 1 00:00 file",
+                           u"$ echo $HOME",
+                           u"/home/user"])
+
+
+def xml(rand):
+    return block(u"xml", [u'<domain type="kvm">',
+                         u"    <name>{0}</name>".format(rand.choice(WORDS)),
+                         u"    <memory>{0}</memory>".format(
+                                                rand.randrange(1 << 20)),
+                         u"</domain>"])
+
+
+def hide(rand):
+    return python(rand, u"hide.python")
+
+
+def center(rand):
+    return python(rand, u"center.python")
+
+
+GENERATORS = {'para': para, 'header': header, 'list': items,
+              'linklist': linklist, 'python': python, 'shell': shell,
+              'xml': xml, 'hide': hide, 'center': center}
+
+
+def parse_mix(text):
+    "'para=10,python=2' -> {'para': 10, 'python': 2}"
+    mix = {}
+    for item in text.split(','):
+        name, weight = item.split('=')
+        if name not in GENERATORS:
+            raise ValueError("Unknown block kind {0!r}".format(name))
+        mix[name] = float(weight)
+    return mix
+
+
+def make_document(blocks, mix=None, seed=0):
+    "document with given number of blocks"
+    rand = random.Random(seed)
+    mix = sorted((mix or DEFAULT_MIX).items())
+    total = sum(weight for _, weight in mix)
+
+    res = [para(rand), u"<---->"]
+    for _ in range(blocks):
+        point = rand.random() * total
+        for name, weight in mix:
+            point -= weight
+            if point < 0:
+                break
+        res.append(GENERATORS[name](rand))
+
+    # every backref needs a target
+    res.append(linklist(rand))
+    return u"\n\n".join(res) + u"\n"
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("-n", "--blocks", dest='blocks', type='int',
+                      default=100)
+    parser.add_option("-m", "--mix", dest='mix', default=None,
+                      help="block weights, like 'para=10,python=2'")
+    parser.add_option("--seed", dest='seed', type='int', default=0)
+    opts, _ = parser.parse_args(argv[1:])
+
+    mix = parse_mix(opts.mix) if opts.mix else None
+    sys.stdout.write(make_document(opts.blocks, mix, opts.seed).encode('utf8'))
+
+if __name__ == "__main__":
+    main(sys.argv)
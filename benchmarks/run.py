@@ -0,0 +1,201 @@
+# -*- coding:utf8 -*-
+"""
+Converter benchmark suite.
+
+Times every stage of the converter separately - lex, parse, inline
+markup, highlighting, linting and full render - on synthetic documents
+of given sizes and on the real posts. Caches are disabled. Results are
+printed as JSON, to be compared between revisions.
+"""
+import os
+import sys
+import json
+import glob
+import time
+import platform
+import optparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import pygments
+
+import corpus
+import nsr_lint
+import notsorest2html
+from nsr_lexer import lex, parse
+
+
+class Corpus(object):
+    "documents with blocks, prepared for every stage"
+    def __init__(self, name, texts, opts, styles):
+        self.name = name
+        self.texts = [text.replace('\t', ' ' * 4) for text in texts]
+        self.chars = sum(len(text) for text in self.texts)
+
+        self.inline = []
+        self.code = []
+        self.snippets = []
+
+        provider = notsorest2html.BlogspotHTMLProvider
+        for num, text in enumerate(self.texts):
+            for tp, block in notsorest2html.typed_blocks(text, styles):
+                if tp.startswith('text') and block.data:
+                    self.inline.append(block.data)
+                elif tp == 'list':
+                    self.inline.extend(block.data)
+                elif tp in provider.highlighters_map:
+                    code = notsorest2html.deindent_snippet(block.data)
+                    self.code.append((code, provider.get_lexer(tp)))
+                    if tp == 'python' and '-' not in block.opts:
+                        self.snippets.append(((num, block.line),
+                                              (block.line, code)))
+
+    def info(self):
+        return {'documents': len(self.texts),
+                'chars': self.chars,
+                'text_blocks': len(self.inline),
+                'code_blocks': len(self.code),
+                'lint_snippets': len(self.snippets)}
+
+
+def stages(corpus_obj, opts, styles, with_lint):
+    "list of (stage name, function)"
+    def provider():
+        return notsorest2html.BlogspotHTMLProvider(opts)
+
+    def run_lex():
+        for text in corpus_obj.texts:
+            for _ in lex(text):
+                pass
+
+    def run_parse():
+        for text in corpus_obj.texts:
+            for _ in parse(text):
+                pass
+
+    def run_inline():
+        html = provider()
+        for text in corpus_obj.inline:
+            html.text_to_html(text)
+
+    def run_highlight():
+        html = provider()
+        for code, lexer in corpus_obj.code:
+            html.highlight(code, lexer)
+
+    def run_lint():
+        nsr_lint.lint_batch(corpus_obj.snippets)
+
+    def run_render():
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            for text in corpus_obj.texts:
+                notsorest2html.render_text(text, opts, styles)
+        finally:
+            sys.stdout = stdout
+
+    res = [('lex', run_lex), ('parse', run_parse), ('inline', run_inline),
+           ('highlight', run_highlight), ('render', run_render)]
+
+    if with_lint:
+        res.insert(4, ('lint', run_lint))
+    return res
+
+
+def measure(func, repeat):
+    times = []
+    for _ in range(repeat):
+        stime = time.time()
+        func()
+        times.append(time.time() - stime)
+    return times
+
+
+def run_corpus(corpus_obj, opts, styles, repeat, with_lint):
+    res = corpus_obj.info()
+    res['stages'] = {}
+
+    for name, func in stages(corpus_obj, opts, styles, with_lint):
+        times = measure(func, repeat)
+        best = min(times)
+        res['stages'][name] = {
+                'best': best,
+                'mean': sum(times) / len(times),
+                'chars_per_sec': corpus_obj.chars / best if best else None}
+    return res
+
+
+def posts_texts(opts, styles):
+    "real posts, which can be rendered"
+    res = []
+    stdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        for fname in sorted(glob.glob(os.path.join(ROOT, 'posts', '*.txt'))):
+            text = open(fname).read().decode('utf8')
+            try:
+                notsorest2html.render_text(text, opts, styles)
+            except Exception:
+                continue
+            res.append(text)
+    finally:
+        sys.stdout = stdout
+    return res
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("-s", "--sizes", dest='sizes', default="100,1000",
+                      help="comma separated block counts of synthetic " +
+                           "documents")
+    parser.add_option("-m", "--mix", dest='mix', default=None,
+                      help="block weights, like 'para=10,python=2'")
+    parser.add_option("--seed", dest='seed', type='int', default=0)
+    parser.add_option("-r", "--repeat", dest='repeat', type='int', default=3)
+    parser.add_option("--no-posts", dest='posts', default=True,
+                      action='store_false')
+    parser.add_option("--no-lint", dest='lint', default=True,
+                      action='store_false')
+    parser.add_option("-o", "--output", dest='output', default=None,
+                      help="write JSON to file instead of stdout")
+    bopts, _ = parser.parse_args(argv[1:])
+
+    opts, _ = notsorest2html.get_option_parser().parse_args(['-n', '-c', ''])
+    styles = notsorest2html.load_styles(opts)
+    mix = corpus.parse_mix(bopts.mix) if bopts.mix else None
+
+    corpora = []
+    for size in map(int, bopts.sizes.split(',')):
+        corpora.append(Corpus("synthetic-{0}".format(size),
+                              [corpus.make_document(size, mix, bopts.seed)],
+                              opts, styles))
+
+    if bopts.posts:
+        corpora.append(Corpus("posts", posts_texts(opts, styles), opts, styles))
+
+    if bopts.lint:
+        # pylint import and checkers loading are not a part of lint stage
+        nsr_lint.get_linter()
+
+    res = {'python': platform.python_version(),
+           'pygments': pygments.__version__,
+           'repeat': bopts.repeat,
+           'seed': bopts.seed,
+           'mix': mix or corpus.DEFAULT_MIX,
+           'corpora': {}}
+
+    for corpus_obj in corpora:
+        res['corpora'][corpus_obj.name] = run_corpus(corpus_obj, opts, styles,
+                                                     bopts.repeat, bopts.lint)
+
+    data = json.dumps(res, indent=1, sort_keys=True)
+    if bopts.output:
+        with open(bopts.output, 'w') as fd:
+            fd.write(data + "\n")
+    else:
+        print data
+
+if __name__ == "__main__":
+    main(sys.argv)
@@ -3,27 +3,23 @@
 import os
 import re
 import sys
-import uuid
+import copy
+import bisect
+import filecmp
 import inspect
-import warnings
-import traceback
-
-from pylint import lint
-import logilab.astng.builder
+import json
 
+import pygments
+import pygments.lexers
 from pygments import highlight
-from pygments.lexers import PythonLexer, \
-                            CLexer, \
-                            XmlLexer, \
-                            PythonTracebackLexer, \
-                            PythonConsoleLexer, \
-                            BashSessionLexer,\
-                            HaskellLexer, \
-                            BashLexer
-
 from pygments.formatters import HtmlFormatter
 
-from nsr_lexer import parse
+import nsr_profile
+from nsr_lexer import parse, lex, parse_lexems, iter_lines, block_begin_re, \
+                      CUT
+from nsr_cache import get_cache, make_key
+from nsr_lint import check_python_code, report_messages, lint_batch
+from nsr_exec import get_executor
 
 def deindent_snippet(snippet):
     snippet = snippet.replace('\t', ' ' * 4)
@@ -32,17 +28,16 @@ def deindent_snippet(snippet):
     return "\n".join(ln[min_l_spaces:] for ln in slines)
 
 def escape_html(text, esc_all=False):
-    html_escape_table = {
-        "&": "&amp;",
-        '"': "&quot;",
-        ">": "&gt;",
-        "<": "&lt;",
-    }
+    # '&' goes first, so it's not escaped twice
+    text = text.replace("&", "&amp;")
+    text = text.replace('"', "&quot;")
+    text = text.replace(">", "&gt;")
+    text = text.replace("<", "&lt;")
 
     if esc_all:
-        html_escape_table["'"] = '&#39;'
+        text = text.replace("'", "&#39;")
 
-    return "".join( html_escape_table.get(c, c) for c in text)
+    return text
 
 
 re_inline_code = re.compile(r"(?iu)''(.+?)''")
@@ -68,14 +63,136 @@ re_backref = re.compile(ur"""(?u)\[\s*([-, \w.|()'"]+?)\s*\]""")
 re_href = re.compile(r"(?u)(?P<name>\[\s*([- _\w/.()|]+)\s*\])?" +
                      r"(?P<proto>https?://)(?P<url>.*?)(?=\s|$)")
 
+# inline markers: (marker, open tag, close tag). None of the tags contains
+# any marker, so every marker kind is paired independently of others
+INLINE_MARKERS = (("*", "<b>", "</b>"),
+                  ("~", "<i>", "</i>"),
+                  ("--", "<s>", "</s>"),
+                  ("''", "<b>", "</b>"))
+
+# backref target placeholder - link name between two NUL chars.
+# Placeholders are resolved in single pass, when the page is finished
+BACKREF_MARK = u"\x00"
+re_backref_mark = re.compile(u"\x00([^\x00]*)\x00")
+
+re_link_start = re.compile(r"\[|https?://")
+re_word = re.compile(r"(?u)\w+")
+re_space = re.compile(r"(?u)\s")
+
+
+def pair_markers(text, mark):
+    """
+    yields (open_pos, close_pos) for every pair of marks in text - the
+    same pairs, as re.sub with '(?u)MARK(.+?)MARK' replaces
+    """
+    mlen = len(mark)
+    start = text.find(mark)
+    while start != -1:
+        end = text.find(mark, start + mlen + 1)
+        if end == -1:
+            return
+
+        # '.' don't match new line
+        if text.find('\n', start + mlen, end) == -1:
+            yield start, end
+            start = text.find(mark, end + mlen)
+        else:
+            start = text.find(mark, start + 1)
+
+
+def line_handler(func):
+    "handler(self, data, line) for on_xxx(self, data) or on_xxx(self, data, line)"
+    func = getattr(func, '__func__', func)
+    if 'line' in inspect.getargspec(func).args:
+        return func
+    return lambda self, data, line: func(self, data)
+
 
 class NotSoRESTHandler(object):
+    # {handler class : {block type : handler(self, data, line)}}
+    dispatch_tables = {}
+
     def __init__(self, opts):
         self.stream = []
+        self.out = None
         self.opts = opts
+        self.handlers = self.dispatch_table()
+
+    @classmethod
+    def dispatch_table(cls):
+        "block handlers of class, built on first use"
+        table = cls.dispatch_tables.get(cls)
+        if table is None:
+            table = cls.dispatch_tables[cls] = cls.build_dispatch_table()
+        return table
+
+    @classmethod
+    def build_dispatch_table(cls):
+        table = {}
+        for name in dir(cls):
+            if name.startswith('on_') and \
+                    not name.startswith(('on_open_', 'on_close_')):
+                table[name[3:]] = line_handler(getattr(cls, name))
+        return table
+
+    @classmethod
+    def resolve_handler(cls, tp):
+        "handler for compound type like 'hide.python' - wrappers + block"
+        wrappers = tp.split('.')
+        name = wrappers.pop()
+
+        handler = cls.dispatch_table().get(name)
+        if handler is None:
+            raise AttributeError("type %r has no handler for block %r" % (cls, name))
+
+        opens = [getattr(cls, 'on_open_' + wrapper).__func__
+                    for wrapper in wrappers]
+        closes = [getattr(cls, 'on_close_' + wrapper).__func__
+                    for wrapper in reversed(wrappers)]
+
+        def wrapped(self, data, line):
+            for func in opens:
+                func(self)
+            handler(self, data, line)
+            for func in closes:
+                func(self)
+        return wrapped
+
+    @classmethod
+    def register_block(cls, tp, func=None):
+        """
+        add handler func(self, data[, line]) for block type tp.
+        Can be used as decorator - @Handler.register_block('note')
+        """
+        if func is None:
+            return lambda func: cls.register_block(tp, func) or func
+        setattr(cls, 'on_' + tp, func)
+        cls.dispatch_tables.clear()
+
+    @classmethod
+    def register_wrapper(cls, tp, on_open, on_close):
+        "add wrapper type tp, used like 'tp.python'"
+        setattr(cls, 'on_open_' + tp, on_open)
+        setattr(cls, 'on_close_' + tp, on_close)
+        cls.dispatch_tables.clear()
 
     def write_raw(self, text):
-        self.stream.append(text)
+        if self.out is None:
+            self.stream.append(text)
+        else:
+            self.write_out(text)
+
+    def write_out(self, text):
+        if isinstance(text, unicode):
+            text = text.encode('utf8')
+        self.out.write(text)
+
+    def start_stream(self, out):
+        "write fragments directly to file-like out from now on"
+        self.out = out
+        for text in self.stream:
+            self.write_out(text)
+        self.stream = []
 
     def get_result(self):
         return "".join(self.stream)
@@ -89,22 +206,13 @@ class NotSoRESTHandler(object):
             self.start_style(block.style)
 
         self.block_opts = block.opts
+        self.block_line = block.line
 
-        tp = block.tp.split('.')
-
-        for curr_tp in tp[:-1]:
-            getattr(self, 'on_open_' + curr_tp)()
-
-        func = getattr(self, 'on_' + tp[-1])
-        args = inspect.getargspec(func).args
-
-        if 'line' in args:
-            func(block.data, line=block.line)
-        else:
-            func(block.data)
+        handler = self.handlers.get(block.tp)
+        if handler is None:
+            handler = self.handlers[block.tp] = self.resolve_handler(block.tp)
 
-        for curr_tp in tp[:-1][::-1]:
-            getattr(self, 'on_close_' + curr_tp)()
+        handler(self, block.data, block.line)
 
         if block.style is not None:
             self.end_style(block.style)
@@ -156,126 +264,250 @@ hide_show_func = """
 show_hide_block = ""
 
 
-class Reporter(object):
-    def __init__(self):
-        self.messages = []
+hide_show = u'<a hided_text="{hided_text}" ' + \
+            u'visible_text="{visible_text}" ' + \
+            u'style="border-bottom: 2px dotted #2020B0; ' + \
+                    u'color: #2020B0; font-style:italic; font-size: 90%" ' + \
+            u'class="hidder" objtohide="{hided_id}">{default_text}</a>'
 
-    def add_message(self, tp, params, message):
-        #print "I get message", tp, message
-        self.messages.append((tp, params, message))
+hide_show_span = '<span {default_style} id="{hided_id}">'
 
-    def display_results(self, *dt, **mp):
-        pass
+hide_show2 = u'<a hided_text="{hided_text}" ' + \
+             u'visible_text="{visible_text}" ' + \
+             u'style="border-bottom: 2px dotted #2020B0; ' + \
+                   u'color: #2020B0; font-style:italic; font-size: 90%" ' + \
+             u'class="dhidder" objtohide1="{hided_id1}" objtohide2="{hided_id2}" >{default_text}</a>'
 
+# --compact-code mode: every code block is written once, plain view
+# is built from highlighted one by browser on first toggle. Toggle script
+# doesn't need jQuery and is shared by all pages of the site
+
+# link class : [text, when block is hidden, text, when block is visible]
+TOGGLE_TEXTS = {'nsr-hide': [u"Показать код", u"Скрыть код"],
+                'nsr-plain': [u"С подсветкой синтаксиса",
+                              u"Без подсветки синтаксиса"]}
+
+TOGGLE_SCRIPT = u"""(function () {
+    var texts = %(texts)s;
+
+    var style = document.createElement('style');
+    style.appendChild(document.createTextNode(
+        'a.nsr-hide, a.nsr-plain {border-bottom: 2px dotted #2020B0; ' +
+        'color: #2020B0; font-style: italic; font-size: 90%%; ' +
+        'text-decoration: none}'));
+    document.getElementsByTagName('head')[0].appendChild(style);
+
+    function next_element(elem) {
+        do {
+            elem = elem.nextSibling;
+        } while (elem && (elem.nodeType != 1 || elem.tagName == 'BR'));
+        return elem;
+    }
 
-class Stdout_replacer(object):
-    def write(self, data):
-        pass
+    function plain_view(code) {
+        var plain = next_element(code);
+        if (plain && plain.className == 'nsr-raw')
+            return plain;
+
+        plain = document.createElement('pre');
+        plain.className = 'nsr-raw';
+        plain.style.fontFamily = 'courier';
+        plain.style.lineHeight = '100%%';
+        plain.style.display = 'none';
+        plain.appendChild(document.createTextNode(code.textContent));
+        code.parentNode.insertBefore(plain, code.nextSibling);
+        return plain;
+    }
 
+    document.addEventListener('click', function (event) {
+        var link = event.target;
+        if (link.tagName != 'A' || !texts.hasOwnProperty(link.className))
+            return;
 
-def check_python_code(code, line, use_lint=True, imp_mod=False):
+        var target = next_element(link);
+        var visible = target.style.display == 'none';
+        target.style.display = visible ? '' : 'none';
 
-    code = "# -*- coding:utf8 -*-\nfrom oktest import ok\n" + \
-           code.encode("utf8")
+        if (link.className == 'nsr-plain')
+            plain_view(target).style.display = visible ? 'none' : '';
 
-    try:
-        compile(code, "<opt_file>", 'exec')
-    except SyntaxError as err:
-        err.lineno += line - 2
-        err.args = (err.args[0],
-                    (err.args[1][0],
-                    err.args[1][1] + line - 2, err.args[1][2]))
-        raise err
+        link.firstChild.nodeValue = texts[link.className][visible ? 1 : 0];
+        event.preventDefault();
+    }, false);
+})();
+""" % {'texts': json.dumps(TOGGLE_TEXTS, sort_keys=True)}
 
-    with warnings.catch_warnings():
-        warnings.simplefilter("ignore")
-        dname = os.tmpnam()
+compact_toggle = u'<a class="{cls}" href="#">{text}</a><br>'
 
-    os.mkdir(dname)
-    fname = os.path.join(dname, "module.py")
+JQUERY_TAG = '<script type="text/javascript" ' + \
+             'src="http://ajax.googleapis.com/ajax/' + \
+             'libs/jquery/1.7.1/jquery.min.js"></script>\n'
 
-    open(fname, 'w').write(code)
 
-    try:
-        if use_lint:
-            rep = Reporter()
-
-            try:
-                stderr = sys.stderr
-                sys.stderr = Stdout_replacer()
-                logilab.astng.builder.MANAGER.astng_cache.clear()
-                rcfile = os.path.join(os.path.abspath(
-                                      os.path.dirname(__file__)), "pylintrc")
-                lint.Run([fname, '--rcfile=' + rcfile], rep, exit=False)
-                #lint.PyLinter( [fname], rep)
-            finally:
-                sys.stderr = stderr
-
-            for tp, data, msg in rep.messages:
-                if tp not in ('C0111',):
-                    if tp == 'W0611' and msg == "Unused import ok":
-                        continue
-                    print "Python block in line {0}: {1} {2}".format(
-                            line + data[3] - 2, # we add two lines to the top og the file
-                            tp, msg)
-
-        if imp_mod:
-            try:
-                sys.path.insert(0, dname)
-                import module
-            except:
-                traceback.print_exc()
-            finally:
-                del sys.path[0]
-                del sys.modules['module']
+def toggle_scripts(opts):
+    "scripts for code toggles, needed once per page, after all blocks"
+    if not getattr(opts, 'compact_code', False):
+        return hide_show_func
 
-    finally:
-        os.unlink(fname)
-        os.rmdir(dname)
+    if getattr(opts, 'toggle_script', None):
+        return '<script type="text/javascript" ' + \
+               'src="{0}"></script>'.format(opts.toggle_script)
 
-hide_show = u'<a hided_text="{hided_text}" ' + \
-            u'visible_text="{visible_text}" ' + \
-            u'style="border-bottom: 2px dotted #2020B0; ' + \
-                    u'color: #2020B0; font-style:italic; font-size: 90%" ' + \
-            u'class="hidder" objtohide="{hided_id}">{default_text}</a>'
+    return '<script type="text/javascript">' + TOGGLE_SCRIPT + '</script>'
 
-hide_show_span = '<span {default_style} id="{hided_id}">'
+# css class of highlighted blocks in css classes mode
+CSS_CLASS = 'highlight'
+
+
+class CompactHtmlFormatter(HtmlFormatter):
+    """
+    css classes formatter, which resolves token class like inline styles
+    mode does - tokens without style gets no span at all
+    """
+    def _get_css_classes(self, ttype):
+        styled = ttype
+        while styled not in self.ttype2class:
+            styled = styled.parent
+
+        if styled is ttype:
+            return HtmlFormatter._get_css_classes(self, ttype)
+        return self.ttype2class[styled]
+
+
+def formatter_class(css_classes):
+    return CompactHtmlFormatter if css_classes else HtmlFormatter
+
+
+def highlight_code(code, lexer_name, css_classes, formatter_opts):
+    "highlighted html for code, runs in block pool workers too"
+    lexer = getattr(pygments.lexers, lexer_name)
+    return highlight(code, lexer(),
+                     formatter_class(css_classes)(**formatter_opts))
+
+
+def split_snippet(code):
+    """
+    (code to highlight, code for plain view). Lines of dashes like
+    '#----' separate setup and teardown parts, which are not highlighted
+    """
+    splits = re.split(r"\n#----*\n", code)
+
+    if len(splits) == 1:
+        return code, code
+
+    if len(splits) != 3:
+        raise ValueError("Code block should have 0 or 2 '#----' lines")
+
+    return splits[1], "\n\n".join(splits)
+
+
+def highlight_stylesheet(style='default'):
+    "stylesheet for highlighted blocks in css classes mode"
+    return CompactHtmlFormatter(style=style, cssclass=CSS_CLASS)\
+                .get_style_defs('.' + CSS_CLASS)
 
-hide_show2 = u'<a hided_text="{hided_text}" ' + \
-             u'visible_text="{visible_text}" ' + \
-             u'style="border-bottom: 2px dotted #2020B0; ' + \
-                   u'color: #2020B0; font-style:italic; font-size: 90%" ' + \
-             u'class="dhidder" objtohide1="{hided_id1}" objtohide2="{hided_id2}" >{default_text}</a>'
 
 class BlogspotHTMLProvider(NotSoRESTHandler):
 
     HREF_PREFIX = "_a_href_"
 
+    # {block line : lint messages}, filled by batch lint stage
+    lint_results = None
+
+    # {block line : ExecResult} for 'ut' blocks
+    ut_results = None
+
+    # post file name, used in reports
+    fname = '<post>'
+
+    # {backref name : url} for links to other posts, from site link index
+    site_links = {}
+
+    # anchors of headings, referenced from other posts
+    anchors = frozenset()
+
+    # {image url : asset} for local images, from site asset index
+    assets = {}
+
+    # post title, from text_h1 header
+    title = None
+
+    # function, which returns {name : url} of post linklists, used
+    # in excerpt mode, if excerpt has backrefs to links below the cut
+    lookup_links = None
+
     def __init__(self, opts):
         self.refs = []
         self.href_map = {}
         self.backref_list = []
+
+        # backrefs without link, found while writing in stream mode
+        self.dangling_backrefs = set()
         self.found_splitter = False
+        self.used_ids = set()
+
+        # {highlight key : html or AsyncResult}, see prefetch_highlight
+        self.prefetched = {}
+
+        # process pool of prefetch_highlight, started on first cache miss
+        self.block_pool = None
 
         super(BlogspotHTMLProvider, self).__init__(opts)
 
+        self.highlight_cache = get_cache(opts, 'highlight')
+        self.lint_cache = get_cache(opts, 'lint')
+
+        pygments_style = getattr(opts, 'pygments_style', 'default')
+        self.css_classes = getattr(opts, 'css_classes', False)
+        self.compact_code = getattr(opts, 'compact_code', False)
+        self.excerpt = getattr(opts, 'excerpt', False)
+        self.run_ut = not self.excerpt and not getattr(opts, 'nout', False)
+        self.style_emitted = False
+
+        if self.css_classes:
+            self.formatter_opts = {'cssclass': CSS_CLASS,
+                                   'style': pygments_style}
+        else:
+            self.formatter_opts = {'noclasses': True,
+                                   'style': pygments_style}
+
         if self.opts.standalone:
             self.write_raw("<html><head>")
             self.write_raw('<meta http-equiv="Content-Type" content="text/html; charset=utf-8">')
+
+        stylesheet = getattr(opts, 'stylesheet', None)
+        if self.css_classes and stylesheet:
+            self.write_raw('<link rel="stylesheet" type="text/css" ' +
+                           'href="{0}">\n'.format(stylesheet))
+            self.style_emitted = True
+
+        if self.opts.standalone:
             self.write_raw("</head><body>")
 
+        if not self.compact_code and not self.excerpt:
+            self.write_raw(JQUERY_TAG)
 
-        self.write_raw('<script type="text/javascript" ' + \
-                       'src="http://ajax.googleapis.com/ajax/' + \
-                       'libs/jquery/1.7.1/jquery.min.js"></script>\n')
+    def write_out(self, text):
+        # in stream mode link targets are known before rendering
+        if BACKREF_MARK in text:
+            text = self.resolve_backrefs(text)
+        super(BlogspotHTMLProvider, self).write_out(text)
 
     def write_text(self, text):
         self.write_raw(self.text_to_html(text).replace('\n', ' '))
 
     def text_to_html(self, text):
-
         ntext = escape_html(text)
 
+        if not self.opts.old_inline_support:
+            res = self.render_inline(ntext)
+            if res is not None:
+                return res
+
+        return self.regex_inline(ntext)
+
+    def regex_inline(self, ntext):
+        "inline markup with sequential regexps, ntext should be escaped"
         ntext = re_bold.sub(r"<b>\1</b>", ntext)
         ntext = re_it.sub(r"<i>\1</i>", ntext)
         ntext = re_striked.sub(r"<s>\1</s>", ntext)
@@ -295,8 +527,139 @@ class BlogspotHTMLProvider(NotSoRESTHandler):
 
         return ntext
 
+    def render_inline(self, ntext):
+        """
+        single pass version of regex_inline (without old inline markup).
+        Returns None for texts, where links and markup are mixed in a way,
+        only regex_inline handles exactly - backref inside of url,
+        or empty url
+        """
+        tags = {}
+        for mark, open_tag, close_tag in INLINE_MARKERS:
+            mlen = len(mark)
+            for start, end in pair_markers(ntext, mark):
+                tags[start] = (open_tag, mlen)
+                tags[end] = (close_tag, mlen)
+
+        if len(tags) == 0 and '[' not in ntext and '://' not in ntext:
+            return ntext
+
+        tag_pos = sorted(tags)
+
+        def has_tags(start, end):
+            idx = bisect.bisect_left(tag_pos, start)
+            return idx < len(tag_pos) and tag_pos[idx] < end
+
+        def render(start, end):
+            res = []
+            idx = bisect.bisect_left(tag_pos, start)
+            while idx < len(tag_pos) and tag_pos[idx] < end:
+                curr = tag_pos[idx]
+                tag, mlen = tags[curr]
+                res.append(ntext[start:curr])
+                res.append(tag)
+                start = curr + mlen
+                idx += 1
+            res.append(ntext[start:end])
+            return "".join(res)
+
+        def backref_at(curr):
+            # markup inside brackets breaks backref
+            mobj = re_backref.match(ntext, curr)
+            if mobj is not None and not has_tags(curr, mobj.end()):
+                return mobj
+            return None
+
+        events = tag_pos + [mobj.start()
+                                for mobj in re_link_start.finditer(ntext)]
+        events.sort()
+
+        res = []
+        backrefs = []
+        refs = []
+        pos = 0
+
+        for curr in events:
+            if curr < pos:
+                # inside of already rendered link
+                continue
+
+            if curr in tags:
+                tag, mlen = tags[curr]
+                res.append(ntext[pos:curr])
+                res.append(tag)
+                pos = curr + mlen
+                continue
+
+            if ntext[curr] == '[':
+                mobj = backref_at(curr)
+                if mobj is not None:
+                    name, html = self.backref_html(mobj.group(1))
+                    backrefs.append(name)
+                    res.append(ntext[pos:curr])
+                    res.append(html)
+                    pos = mobj.end()
+                    continue
+
+                mobj = re_href.match(ntext, curr)
+                if mobj is None or mobj.group('name') is None or \
+                        has_tags(curr, mobj.start('proto')):
+                    continue
+            else:
+                mobj = re_href.match(ntext, curr)
+
+            url_start = mobj.end('proto')
+            space = re_space.search(ntext, url_start)
+            url_end = len(ntext) if space is None else space.start()
+
+            if url_end == url_start:
+                return None
+
+            bracket = ntext.find('[', url_start, url_end)
+            while bracket != -1:
+                if backref_at(bracket) is not None:
+                    return None
+                bracket = ntext.find('[', bracket + 1, url_end)
+
+            url, html = self.href_html(mobj.group('name'),
+                                       mobj.group('proto'),
+                                       render(url_start, url_end))
+            refs.append(url)
+            res.append(ntext[pos:curr])
+            res.append(html)
+            pos = url_end
+
+        res.append(ntext[pos:])
+
+        self.add_refs(backrefs, refs)
+
+        return "".join(res)
+
+    def element_id(self, *parts):
+        """
+        html id from post name, position and content of the element,
+        so the same post always gets the same ids. Post name keeps ids
+        unique on pages with many posts
+        """
+        post = os.path.basename(self.fname)
+        oid = make_key(post, *parts)[:32]
+
+        counter = 0
+        while oid in self.used_ids:
+            counter += 1
+            oid = make_key(post, counter, *parts)[:32]
+
+        self.used_ids.add(oid)
+        return oid
+
     def on_open_hide(self):
-        oid = str(uuid.uuid1()).replace("-", "")
+        if self.compact_code:
+            self.write_raw(compact_toggle.format(cls='nsr-hide',
+                                                 text=u"Показать код"))
+            self.write_raw('<span style="display:none">')
+            return
+
+        oid = self.element_id('hide', self.block_line)
         self.write_raw((hide_show + "<br>" + hide_show_span).format(
                                         hided_text=u"Показать код",
                                         visible_text=u"Скрыть код",
@@ -338,93 +701,229 @@ class BlogspotHTMLProvider(NotSoRESTHandler):
                        escape_html(block, esc_all=True) +
                         '</font></pre>')
 
+    def write_compact_code(self, hblock, code, raw):
+        self.write_raw(compact_toggle.format(cls='nsr-plain',
+                                    text=u"Без подсветки синтаксиса"))
+        self.write_raw(hblock.strip())
+
+        # plain view of splitted block can't be made from highlighted part
+        if raw != code:
+            self.write_raw('<pre class="nsr-raw" style="font-family:courier;' +
+                           'line-height:100%;display:none">' +
+                           escape_html(raw, esc_all=True) + '</pre>')
+
+    # pygments.lexers loads lexer module on first access to lexer class,
+    # so lexers are stored by name and loaded only if post uses them
     highlighters_map = {}
-    highlighters_map['python'] = PythonLexer
-    highlighters_map['c'] = CLexer
-    highlighters_map['xml'] = XmlLexer
-    highlighters_map['traceback'] = PythonTracebackLexer
-    highlighters_map['pyconsole'] = PythonConsoleLexer
-    highlighters_map['shell'] = BashSessionLexer
-    highlighters_map['haskell'] = HaskellLexer
-    highlighters_map['bash'] = BashLexer
-
-    def __getattr__(self, name):
-        # handle all syntax hightlited blocks
-        if name.startswith('on_'):
-            block = name[3:]
-            if block in self.highlighters_map:
-                lexer = self.highlighters_map[block]
-                def hliter(code, line):
-                    code = deindent_snippet(code)
-
-                    if block == 'python':
-                        opts = self.block_opts if self.block_opts is not None else tuple()
-
-                        use_lint = '-' not in opts
-                        imp_mod = 'ut' in opts
-
-                        if use_lint and self.opts.nolint:
-                            use_lint = False
-
-                        check_python_code(code, line, use_lint=use_lint, imp_mod=imp_mod)
-
-                    splits = re.split(r"\n#----*\n", code)
-
-                    if len(splits) == 1:
-                        code = raw = splits[0]
-                    elif len(splits) == 3:
-                        code = splits[1]
-                        raw = "\n\n".join(splits)
-
-                    hblock = highlight(code, lexer(), HtmlFormatter(noclasses=True))
-
-                    oid_code = str(uuid.uuid1()).replace("-", "")
-                    oid_raw = str(uuid.uuid1()).replace("-", "")
-
-                    self.write_raw(
-                        hide_show2.format(hided_text=u"С подсветкой синтаксиса",
-                                          visible_text=u"Без подсветки синтаксиса",
-                                          hided_id1=oid_code,
-                                          hided_id2=oid_raw,
-                                          default_text=u"Без подсветки синтаксиса"))
-
-                    self.write_raw("<br>")
-                    self.write_raw(hide_show_span.format(hided_id=oid_code, default_style=""))
-                    self.write_raw(hblock.strip())
-                    self.write_raw("</span>")
-
-                    self.write_raw(hide_show_span.format(hided_id=oid_raw,
-                                        default_style='style="line-height:100%;display:none"'))
-                    self.on_raw(raw)
-                    self.write_raw("</span>")
-
-                return hliter
-
-        if name in ('on_text_h2', 'on_text_h3', 'on_text_h4'):
-            def header(text):
-                hlevel = int(name[-1])
-                self.write_raw('<br><h{0}>'.format(hlevel))
-                self.write_text(text)
-                self.write_raw('</h{0}>'.format(hlevel))
-            return header
-
-        if name == 'on_text_h1':
-            return lambda x : None
-
-        raise AttributeError("type %r has no attribute %s" % (self.__class__, name))
+    highlighters_map['python'] = 'PythonLexer'
+    highlighters_map['c'] = 'CLexer'
+    highlighters_map['xml'] = 'XmlLexer'
+    highlighters_map['traceback'] = 'PythonTracebackLexer'
+    highlighters_map['pyconsole'] = 'PythonConsoleLexer'
+    highlighters_map['shell'] = 'BashSessionLexer'
+    highlighters_map['haskell'] = 'HaskellLexer'
+    highlighters_map['bash'] = 'BashLexer'
+
+    @classmethod
+    def get_lexer(cls, block):
+        return getattr(pygments.lexers, cls.highlighters_map[block])
+
+    def highlight_key(self, code, lexer_name):
+        return make_key(lexer_name,
+                        formatter_class(self.css_classes).__name__,
+                        sorted(self.formatter_opts.items()),
+                        pygments.__version__,
+                        code)
+
+    def highlight(self, code, lexer):
+        key = self.highlight_key(code, lexer.__name__)
+
+        hblock = self.prefetched.pop(key, None)
+        if hblock is not None:
+            if isinstance(hblock, unicode):
+                # cache hit, found by prefetch_highlight
+                return hblock
+            hblock = hblock.get()
+        else:
+            hblock = self.highlight_cache.get(key)
+            if hblock is not None:
+                return hblock.decode('utf8')
+
+            hblock = highlight_code(code, lexer.__name__, self.css_classes,
+                                    self.formatter_opts)
+
+        self.highlight_cache.put(key, hblock.encode('utf8'))
+        return hblock
+
+    def prefetch_highlight(self, blocks, jobs):
+        """
+        start highlighting of code blocks in pool of jobs processes,
+        blocks are (type, block). highlight() takes results in order.
+        Pool is started only if some block isn't in highlight cache
+        """
+        for tp, block in blocks:
+            if tp not in self.highlighters_map:
+                continue
+
+            code = split_snippet(deindent_snippet(block.data))[0]
+            lexer_name = self.highlighters_map[tp]
+            key = self.highlight_key(code, lexer_name)
+
+            if key in self.prefetched:
+                continue
+
+            hblock = self.highlight_cache.get(key)
+            if hblock is not None:
+                self.prefetched[key] = hblock.decode('utf8')
+            else:
+                if self.block_pool is None:
+                    import multiprocessing
+                    self.block_pool = multiprocessing.Pool(jobs)
+                self.prefetched[key] = self.block_pool.apply_async(
+                            highlight_code, (code, lexer_name, self.css_classes,
+                                             self.formatter_opts))
+
+    @classmethod
+    def build_dispatch_table(cls):
+        table = super(BlogspotHTMLProvider, cls).build_dispatch_table()
+
+        for tp in cls.highlighters_map:
+            table.setdefault(tp, code_handler(tp))
+
+        for level in (2, 3, 4):
+            table.setdefault('text_h{0}'.format(level), header_handler(level))
+
+        return table
+
+    @classmethod
+    def register_lexer(cls, tp, lexer_name):
+        "highlight blocks of type tp with pygments.lexers.<lexer_name>"
+        if 'highlighters_map' not in cls.__dict__:
+            cls.highlighters_map = dict(cls.highlighters_map)
+        cls.highlighters_map[tp] = lexer_name
+        cls.dispatch_tables.clear()
+
+    def write_header(self, text, level):
+        self.write_raw('<br><h{0}>'.format(level))
+
+        anchor = heading_anchor(text)
+        if anchor in self.anchors:
+            self.write_raw(u'<a name="{0}"></a>'.format(escape_html(anchor)))
+
+        self.write_text(text)
+        self.write_raw('</h{0}>'.format(level))
+
+    def highlight_block(self, block, code, line):
+        "syntax highlighted block of type 'block'"
+        lexer = self.get_lexer(block)
+        code = deindent_snippet(code)
+
+        if block == 'python':
+            opts = self.block_opts if self.block_opts is not None else tuple()
+
+            use_lint = '-' not in opts
+            imp_mod = 'ut' in opts and self.run_ut
+
+            if use_lint and self.opts.nolint:
+                use_lint = False
+
+            if use_lint and self.lint_results is not None:
+                use_lint = False
+                report_messages(self.lint_results.get(line, []), line)
+
+            with nsr_profile.span('check', 'lint', line=line,
+                                  lint=use_lint):
+                check_python_code(code, line, use_lint=use_lint,
+                                  cache=self.lint_cache)
+
+            if imp_mod:
+                self.report_ut(code, line)
+
+        code, raw = split_snippet(code)
+
+        with nsr_profile.span(lexer.__name__, 'highlight',
+                              line=line):
+            hblock = self.highlight(code, lexer)
+
+        if self.css_classes and not self.style_emitted:
+            # inline stylesheet once per page
+            self.write_raw('<style type="text/css">' +
+                           highlight_stylesheet(
+                                self.formatter_opts['style']) +
+                           '</style>\n')
+            self.style_emitted = True
+
+        if self.compact_code:
+            self.write_compact_code(hblock, code, raw)
+            return
+
+        oid_code = self.element_id('code', line, code)
+        oid_raw = self.element_id('raw', line, raw)
+
+        self.write_raw(
+            hide_show2.format(hided_text=u"С подсветкой синтаксиса",
+                              visible_text=u"Без подсветки синтаксиса",
+                              hided_id1=oid_code,
+                              hided_id2=oid_raw,
+                              default_text=u"Без подсветки синтаксиса"))
+
+        self.write_raw("<br>")
+        self.write_raw(hide_show_span.format(hided_id=oid_code, default_style=""))
+        self.write_raw(hblock.strip())
+        self.write_raw("</span>")
+
+        self.write_raw(hide_show_span.format(hided_id=oid_raw,
+                            default_style='style="line-height:100%;display:none"'))
+        self.on_raw(raw)
+        self.write_raw("</span>")
+
+    def report_ut(self, code, line):
+        if self.ut_results is None or line not in self.ut_results:
+            executor = get_executor(self.opts, get_cache(self.opts, 'ut'))
+            res = executor.run([(line, code)])[line]
+        else:
+            res = self.ut_results[line]
+
+        sys.stdout.write(res.report(self.fname, line).encode('utf8'))
 
     def on_text_h1(self, text):
         # skip main header for blogspot
-        pass
+        if self.title is None:
+            self.title = text.strip()
 
     def on_img(self, url):
         url = url.strip()
         iwith = self.block_opts.get('with','700')
-        if url.endswith('svg'):
+        asset = self.assets.get(url)
+        if asset is not None:
+            self.write_asset(asset, iwith)
+        elif url.endswith('svg'):
             self.write_raw('<object data="{0}" type="image/svg+xml"></object>'.format(url))
         else:
             self.write_raw('<br><img src="{0}" width="{1}" /><br>'.format(url, iwith))
 
+    def write_asset(self, asset, iwith):
+        "image with known size, so browser reserves space for it"
+        if asset['url'].endswith('.svg'):
+            self.write_raw('<object data="{0}" type="image/svg+xml" '
+                           'width="{1}" height="{2}"></object>'.format(
+                                asset['url'], asset['width'], asset['height']))
+            return
+
+        attrs = 'width="{0}"'.format(iwith)
+        if iwith.isdigit():
+            height = asset['height'] * int(iwith) / float(asset['width'])
+            attrs += ' height="{0}"'.format(int(round(height)))
+
+        if asset['srcset']:
+            srcset = asset['srcset'] + [[asset['url'], asset['width']]]
+            attrs += ' srcset="{0}" sizes="{1}px"'.format(
+                        ", ".join("{0} {1}w".format(vurl, width)
+                                    for vurl, width in srcset), iwith)
+
+        self.write_raw('<br><img src="{0}" {1} /><br>'.format(asset['url'],
+                                                              attrs))
+
     def do_href(self, ref_descr):
         self.write_raw(
             self.process_href(
@@ -442,26 +941,9 @@ class BlogspotHTMLProvider(NotSoRESTHandler):
         self.on_text(u"Ссылки:", no_para=True)
         self.write_raw("<br>")
 
-        for line in block.split('\n'):
-            line = line.strip()
-
-            if line == "":
-                continue
-
-            if 'http://' in line:
-                name, url = line.split('http://', 1)
-                name = name.strip()
-                url = "http://" + url
-            elif 'https://' in line:
-                name, url = line.split('https://', 1)
-                name = name.strip()
-                url = "https://" + url
-            else:
-                raise ValueError("Can't process linklist item {0!r}".format(line))
-
+        for name, url in linklist_items(block):
             self.write_raw('&nbsp;' * 10)
             if name:
-                name = name.replace(' ', '_')
                 self.href_map[name] = url
                 self.write_raw(u'<a name="{0}">'.format(escape_html(name)))
 
@@ -472,25 +954,25 @@ class BlogspotHTMLProvider(NotSoRESTHandler):
 
             self.write_raw('<br>')
 
-    def process_backref(self, ref_descr):
-        gr1 = ref_descr.group(1)
-
+    def backref_html(self, gr1):
+        "returns (link name, html) for backref"
         if '|' in gr1:
             name, text = gr1.split('|', 1)
         else:
             text = name = gr1
 
-        name = name.replace(' ', '_')
-
-        self.backref_list.append(name)
+        name = backref_name(name)
 
-        return u'<a href="{0}">{1}</a>'.format(self.HREF_PREFIX + name, text)
+        return name, u'<a href="{0}{1}{0}">{2}</a>'.format(BACKREF_MARK,
+                                                            name, text)
 
-    def process_href(self, mobj):
-        name = mobj.group('name')
-        g1 = mobj.group('proto')
-        g2 = mobj.group('url')
+    def process_backref(self, ref_descr):
+        name, html = self.backref_html(ref_descr.group(1))
+        self.add_refs([name], [])
+        return html
 
+    def href_html(self, name, g1, g2):
+        "returns (url, html) for link with name, protocol and url"
         if g2[-1] in '.,':
             add_symbol = g2[-1]
             g2 = g2[:-1]
@@ -505,42 +987,86 @@ class BlogspotHTMLProvider(NotSoRESTHandler):
             name = name[1:-1]
 
         url = g1 + g2
-        self.refs.append( url )
+        return url, u'<a href="{0}">{1}</a>{2}'.format(url, name, add_symbol)
 
-        return u'<a href="{0}">{1}</a>{2}'.format(url, name, add_symbol)
+    def process_href(self, mobj):
+        url, html = self.href_html(mobj.group('name'),
+                                   mobj.group('proto'),
+                                   mobj.group('url'))
+        self.add_refs([], [url])
+        return html
+
+    def add_refs(self, backrefs, refs):
+        """
+        remember backrefs and urls of text. In stream mode backrefs are
+        resolved on write, so nothing is kept and memory doesn't grow
+        with the post size
+        """
+        if self.out is None:
+            self.backref_list.extend(backrefs)
+            self.refs.extend(refs)
 
     def finalize(self):
-        if not self.found_splitter:
-            print "WARNING: no text splitter found!"
-
-        self.write_raw('<p style="text-indent:20px">')
-        self.write_raw(u'Исходники этого и других постов со скриптами лежат тут - ')
-        self.do_href("[github.com/koder-ua]https://github.com/koder-ua/python-lectures.")
-        self.write_raw(u' При использовании их, пожалуйста, ссылайтесь на ')
-        self.do_href("[koder-ua.blogspot.com]http://koder-ua.blogspot.com/.")
-        self.write_raw('</p>\n')
-        self.write_raw(hide_show_func)
-        self.write_raw("\n")
+        # excerpt has no footer and scripts, page of excerpts adds them
+        if not self.excerpt:
+            self.write_footer()
 
         if self.opts.standalone:
             self.write_raw("</body></html>")
 
-        res = self.get_result()
-
-        found_refs = set(self.href_map.keys())
-        used_refs = set(self.backref_list)
+        if self.out is not None:
+            # href_map is filled from linklists before rendering
+            diff = self.dangling_backrefs
+        else:
+            found_refs = set(self.href_map.keys())
+            used_refs = set(self.backref_list)
+            diff = used_refs - found_refs - set(self.site_links)
 
-        diff = used_refs - found_refs
+        if len(diff) != 0 and self.lookup_links is not None:
+            self.href_map.update(self.lookup_links())
+            diff -= set(self.href_map)
 
         if len(diff) != 0:
             print "ERROR: backerfs {0} have no links".format(
                         ",".join(i.encode('utf8') for i in diff))
 
-        for name, val in self.href_map.items():
-            res = res.replace(self.HREF_PREFIX + name, val)
+        if self.out is not None:
+            # everything is written already
+            return
+
+        res = self.get_result()
+
+        if len(self.backref_list) != 0:
+            res = self.resolve_backrefs(res)
 
         self.set_result([res])
 
+    def write_footer(self):
+        if not self.found_splitter:
+            print "WARNING: no text splitter found!"
+
+        self.write_raw('<p style="text-indent:20px">')
+        self.write_raw(u'Исходники этого и других постов со скриптами лежат тут - ')
+        self.do_href("[github.com/koder-ua]https://github.com/koder-ua/python-lectures.")
+        self.write_raw(u' При использовании их, пожалуйста, ссылайтесь на ')
+        self.do_href("[koder-ua.blogspot.com]http://koder-ua.blogspot.com/.")
+        self.write_raw('</p>\n')
+        self.write_raw(toggle_scripts(self.opts))
+        self.write_raw("\n")
+
+    def resolve_backrefs(self, res):
+        "replace backref placeholders with urls from linklists"
+        def resolve(mobj):
+            name = mobj.group(1)
+            url = self.href_map.get(name)
+            if url is None:
+                url = self.site_links.get(name)
+            if url is None:
+                self.dangling_backrefs.add(name)
+                url = self.HREF_PREFIX + name
+            return url
+        return re_backref_mark.sub(resolve, res)
+
 
 def debug_block(block):
     print block.type
@@ -555,20 +1081,174 @@ def debug_block(block):
     print "~~" * 50
     print
 
-def not_so_rest_to_xxx(text, styles, formatter):
+def linklist_items(block):
+    "yields (name, url) for every line of linklist block"
+    for line in block.split('\n'):
+        line = line.strip()
+
+        if line == "":
+            continue
+
+        if 'http://' in line:
+            name, url = line.split('http://', 1)
+            name = name.strip()
+            url = "http://" + url
+        elif 'https://' in line:
+            name, url = line.split('https://', 1)
+            name = name.strip()
+            url = "https://" + url
+        else:
+            raise ValueError("Can't process linklist item {0!r}".format(line))
+
+        yield name.replace(' ', '_'), url
+
+
+def backref_name(ref):
+    "link name of [name] or [name|text] backref"
+    return ref.split('|', 1)[0].replace(' ', '_')
+
 
-    text = text.replace('\t', ' ' * 4)
+def heading_anchor(text):
+    "anchor name for heading, which can be used in backref"
+    return u"_".join(re_word.findall(text))
 
+
+def typed_blocks(text, styles):
+    "yields (block type, block) with styles applied"
     for block in parse(text):
+        if block.tp in styles:
+            tp = styles[block.tp][0]
+        else:
+            tp = block.tp
+
+        yield tp.split('.')[-1], block
+
+
+def python_blocks(text, styles):
+    "yields (line, opts, code) for every python block"
+    for tp, block in typed_blocks(text, styles):
+        if tp == 'python':
+            yield block.line, block.opts, deindent_snippet(block.data)
+
+
+def link_targets(text, styles):
+    "{name : url} for all linklist blocks of the text"
+    href_map = {}
+    for tp, block in typed_blocks(text, styles):
+        if tp == 'linklist':
+            for name, url in linklist_items(block.data):
+                if name:
+                    href_map[name] = url
+    return href_map
+
+
+def scan_link_targets(text, styles):
+    """
+    {name : url} for all linklist blocks, found by line scan,
+    so errors in other parts of the text don't matter
+    """
+    href_map = {}
+    in_linklist = False
+
+    for line in iter_lines(text):
+        if in_linklist:
+            if line.strip() == "":
+                continue
+
+            if line[0] in ' \t':
+                try:
+                    items = list(linklist_items(line))
+                except ValueError:
+                    continue
+
+                for name, url in items:
+                    if name:
+                        href_map[name] = url
+                continue
+
+            in_linklist = False
+
+        bbre = block_begin_re.match(line)
+        if bbre is not None:
+            tp = bbre.group('btype')
+            if tp in styles:
+                tp = styles[tp][0]
+            in_linklist = tp.split('.')[-1] == 'linklist'
+
+    return href_map
+
+
+def lint_posts(texts, styles, opts):
+    """
+    lint python blocks of all texts in one pylint session
+    returns list of {block line : messages}, one dict per text.
+    Texts, which can't be parsed, gets None, as error would be
+    reported during rendering
+    """
+    snippets = []
+    res = []
+    for num, text in enumerate(texts):
+        try:
+            blocks = list(python_blocks(text, styles))
+        except Exception:
+            res.append(None)
+            continue
+
+        res.append({})
+        for line, block_opts, code in blocks:
+            if '-' not in block_opts:
+                snippets.append(((num, line), (line, code)))
+
+    results = lint_batch(snippets, get_cache(opts, 'lint'))
+
+    for (num, line), messages in results.items():
+        res[num][line] = messages
+    return res
+
+
+def run_ut_blocks(text, styles, opts):
+    """
+    execute all 'ut' python blocks of the text in parallel,
+    returns {block line : ExecResult} or None, if text can't be parsed
+    """
+    try:
+        snippets = [(line, code)
+                        for line, block_opts, code in python_blocks(text, styles)
+                            if 'ut' in block_opts]
+    except Exception:
+        return None
+
+    return get_executor(opts, get_cache(opts, 'ut')).run(snippets)
+
+
+def not_so_rest_to_xxx(text, styles, formatter):
+
+    if nsr_profile.enabled():
+        # lex and parse separately, to time them
+        with nsr_profile.span('lex', 'lex'):
+            lexems = list(lex(text))
+        with nsr_profile.span('parse', 'parse'):
+            blocks = list(parse_lexems(lexems))
+    else:
+        blocks = parse(text)
+
+    excerpt = getattr(formatter, 'excerpt', False)
+
+    for block in blocks:
 
         #debug_block(block)
 
+        if excerpt and block.tp == CUT:
+            # the rest of text is not even lexed
+            break
+
         if block.tp in styles:
             block.tp, block.style = styles[block.tp]
         else:
             style = None
 
-        formatter.process(block)
+        with nsr_profile.span(block.tp, 'block', line=block.line):
+            formatter.process(block)
 
     formatter.finalize()
     return formatter.get_result()
@@ -591,69 +1271,293 @@ def parse_style_file(fname):
     return res
 
 
-def main(argv=None):
+def get_option_parser():
     import optparse
 
-    argv = argv or sys.argv
-
     parser = optparse.OptionParser()
 
     parser.add_option("-s", "--style-files", dest='style_files', default='__def__')
     parser.add_option("-o", "--output-file", dest='output_file', default=None)
     parser.add_option("-f", "--format", dest='format', default='blogspot')
     parser.add_option("-n", "--nolint", dest='nolint', default=False, action='store_true')
+    parser.add_option("--no-ut", dest='nout', default=False,
+                        action='store_true',
+                        help="don't execute 'ut' python blocks")
     parser.add_option("-l", "--old-inline-support", dest='old_inline_support', default=False, action='store_true')
     parser.add_option("-a", "--standalone", dest='standalone', default=False,
                         action='store_true')
+    parser.add_option("-c", "--cache-dir", dest='cache_dir',
+                        default=os.path.join(os.path.dirname(
+                                    os.path.abspath(__file__)), '.nsr_cache'),
+                        help="cache directory, empty string disables cache")
+    parser.add_option("--css-classes", dest='css_classes', default=False,
+                        action='store_true',
+                        help="highlight code with css classes instead of " +
+                             "inline styles")
+    parser.add_option("--stylesheet", dest='stylesheet', default=None,
+                        help="url of highlight stylesheet for " +
+                             "--css-classes, inlined into page if not set")
+    parser.add_option("--compact-code", dest='compact_code', default=False,
+                        action='store_true',
+                        help="write every code block once, without jQuery, " +
+                             "plain text view is made by browser")
+    parser.add_option("--toggle-script", dest='toggle_script', default=None,
+                        help="url of code toggle script for " +
+                             "--compact-code, inlined into page if not set")
+    parser.add_option("--pygments-style", dest='pygments_style',
+                        default='default')
+    parser.add_option("--ut-timeout", dest='ut_timeout', type='float',
+                        default=10, help="timeout for 'ut' block, seconds")
+    parser.add_option("--ut-mem-limit", dest='ut_mem_limit', type='int',
+                        default=512, help="memory limit for 'ut' block, MiB")
+    parser.add_option("--ut-jobs", dest='ut_jobs', type='int', default=None,
+                        help="parallel 'ut' blocks, default - cpu count")
+    parser.add_option("--excerpt", dest='excerpt', default=False,
+                        action='store_true',
+                        help="render only part of post before the cut")
+    parser.add_option("--block-jobs", dest='block_jobs', type='int',
+                        default=1,
+                        help="highlight code blocks of post in BLOCK_JOBS " +
+                             "processes, pool is started on first " +
+                             "highlight cache miss")
+    parser.add_option("--cache-size", dest='cache_size', type='float',
+                        default=64, help="cache size limit per kind, MiB")
+    parser.add_option("--stream", dest='stream', default=False,
+                        action='store_true',
+                        help="write html to file while rendering, " +
+                             "instead of building it in memory")
+    parser.add_option("--profile", dest='profile', default=None,
+                        metavar="TRACE_FILE",
+                        help="write chrome trace of conversion to " +
+                             "TRACE_FILE and print slowest blocks")
+    parser.add_option("--profile-top", dest='profile_top', type='int',
+                        default=10)
+    return parser
+
+
+def style_file_names(opts):
+    res = []
+    if opts.style_files != '':
+        for style_fname in opts.style_files.split(':'):
+            if style_fname == '__def__':
+                style_fname = os.path.join(os.path.split(__file__)[0],
+                                           'notsores_styles.txt')
+            res.append(style_fname)
+    return res
 
-    opts, files = parser.parse_args(argv)
 
-    if len(files) < 2:
-        print "Error - no template files"
-        return 1
+def load_styles(opts):
+    styles = {}
 
-    if len(files) > 2:
-        print "Error - only one template file per call allowed"
-        return 1
+    # {new_style : (old_style, css)}
 
-    fname = files[1]
-    fc = open(fname).read().decode('utf8')
+    for style_fname in style_file_names(opts):
+        styles.update(parse_style_file(style_fname))
 
-    styles = {}
+    return styles
 
-    # {new_style : (old_style, css)}
 
-    if opts.style_files != '':
-        for style_fname in opts.style_files.split(':'):
-            if style_fname == '__def__':
-                style_fname = os.path.join(os.path.split(__file__)[0],
-                                           'notsores_styles.txt')
-            styles.update(parse_style_file(style_fname))
+def code_handler(tp):
+    return lambda self, code, line: self.highlight_block(tp, code, line)
 
-    formatters = {
-        'blogspot' : BlogspotHTMLProvider(opts)
-    }
 
-    if opts.format not in formatters:
-        print >>sys.stderr, "Unknown format {0!r} only '{1}'' formats are supported"\
-                    .format(opts.format, ",".join(formatters.keys()))
+def header_handler(level):
+    return lambda self, text, line: self.write_header(text, level)
+
+
+formatters = {
+    'blogspot' : BlogspotHTMLProvider
+}
+
+
+def write_if_changed(fname, data):
+    "write data to file, if file content differs. Returns True if written"
+    if os.path.exists(fname):
+        with open(fname, 'rb') as fd:
+            if fd.read() == data:
+                return False
+
+    with open(fname, 'wb') as fd:
+        fd.write(data)
+
+    return True
+
+
+def replace_if_changed(tmp_fname, fname):
+    """
+    move tmp_fname over fname, if content differs.
+    Returns True if replaced
+    """
+    if os.path.exists(fname) and filecmp.cmp(tmp_fname, fname, shallow=False):
+        return False
+
+    os.rename(tmp_fname, fname)
+    return True
+
+
+def render_text(fc, opts, styles, fname='<post>', lint_results=None,
+                out=None, links=None, assets=None):
+    """
+    lint, run 'ut' blocks and render post text, returns html.
+    If out is given, html is written to it, while rendering. fc is text
+    or, to keep memory flat in stream mode, PostFile.
+    links is (site links, anchors) from site link index, assets is
+    {image url : asset} from site asset index
+    """
+    formatter = formatters[opts.format](opts)
+    formatter.fname = fname
+
+    if links is not None:
+        formatter.site_links, formatter.anchors = links
+
+    if assets is not None:
+        formatter.assets = assets
+
+    if out is not None:
+        # backrefs are resolved, then written
+        formatter.href_map.update(link_targets(fc, styles))
+        formatter.start_stream(out)
+
+    jobs = block_jobs(opts)
+    try:
+        if jobs > 1:
+            # code is highlighted by pool, while 'ut', lint and prose
+            # are processed here
+            formatter.prefetch_highlight(typed_blocks(fc, styles), jobs)
+
+        if not getattr(opts, 'nout', False):
+            with nsr_profile.span('ut blocks', 'ut'):
+                formatter.ut_results = run_ut_blocks(fc, styles, opts)
+
+        if not opts.nolint:
+            if lint_results is None:
+                with nsr_profile.span('lint batch', 'lint'):
+                    lint_results = lint_posts([fc], styles, opts)[0]
+            formatter.lint_results = lint_results
+
+        return not_so_rest_to_xxx(fc, styles, formatter)
+    finally:
+        if formatter.block_pool is not None:
+            # workers exit after the last task. join or terminate would
+            # wait for pool handler threads, which poll every 0.1s
+            formatter.block_pool.close()
+
+
+def block_jobs(opts):
+    """
+    number of processes for highlighting of code blocks of one post,
+    1 if pool can't be used. Daemonic processes, like site build
+    workers, can't have children
+    """
+    jobs = getattr(opts, 'block_jobs', 1)
+    if jobs <= 1:
         return 1
+
+    import multiprocessing
+    if multiprocessing.current_process().daemon:
+        return 1
+    return jobs
+
+
+def render_excerpt(fc, opts, styles, fname='<post>', links=None,
+                   assets=None):
+    """
+    (title, html) of the part of post before the cut. Text after the cut
+    is not lexed, 'ut' blocks and lint are skipped. Html has no toggle
+    scripts, page with excerpts needs them once - see toggle_scripts
+    """
+    opts = copy.copy(opts)
+    opts.excerpt = True
+    opts.nolint = True
+
+    formatter = formatters[opts.format](opts)
+    formatter.fname = fname
+    formatter.lookup_links = lambda: scan_link_targets(fc, styles)
+
+    if links is not None:
+        formatter.site_links, formatter.anchors = links
+
+    if assets is not None:
+        formatter.assets = assets
+
+    html = not_so_rest_to_xxx(fc, styles, formatter)
+    return formatter.title, html
+
+
+class PostFile(object):
+    """
+    post text for stream mode - every pass over the text reads the file
+    line by line again, so whole text is never kept in memory
+    """
+    def __init__(self, fname):
+        self.fname = fname
+
+    def __iter__(self):
+        with open(self.fname, 'rb') as fd:
+            for line in fd:
+                yield line.decode('utf8')
+
+
+def convert_file(fname, opts, styles, res_fname=None, lint_results=None,
+                 links=None, assets=None):
+    if res_fname is None:
+        res_fname = os.path.splitext(fname)[0] + '.html'
+
+    if getattr(opts, 'excerpt', False):
+        fc = open(fname).read().decode('utf8')
+        res = render_excerpt(fc, opts, styles, fname, links, assets)[1]
+        write_if_changed(res_fname, res.encode("utf8"))
+    elif getattr(opts, 'stream', False):
+        tmp_fname = "{0}.{1}.tmp".format(res_fname, os.getpid())
+        try:
+            with open(tmp_fname, 'wb') as out:
+                render_text(PostFile(fname), opts, styles, fname,
+                            lint_results, out, links, assets)
+            replace_if_changed(tmp_fname, res_fname)
+        finally:
+            if os.path.exists(tmp_fname):
+                os.unlink(tmp_fname)
     else:
-        res = not_so_rest_to_xxx(fc, styles, formatters[opts.format])
+        fc = open(fname).read().decode('utf8')
+        res = render_text(fc, opts, styles, fname, lint_results,
+                          links=links, assets=assets)
+        write_if_changed(res_fname, res.encode("utf8"))
 
-        if opts.output_file is None:
-            res_fname = os.path.splitext(fname)[0] + '.html'
-        else:
-            res_fname = opts.output_file
+    return res_fname
 
-        open(res_fname, "w").write(res.encode("utf8"))
-        return 0
 
-if __name__ == "__main__":
-    sys.exit(main(sys.argv))
+def main(argv=None):
+    argv = argv or sys.argv
 
+    opts, files = get_option_parser().parse_args(argv)
 
+    if len(files) < 2:
+        print "Error - no template files"
+        return 1
 
+    if len(files) > 2:
+        print "Error - only one template file per call allowed"
+        return 1
 
+    styles = load_styles(opts)
 
+    if opts.format not in formatters:
+        print >>sys.stderr, "Unknown format {0!r} only '{1}'' formats are supported"\
+                    .format(opts.format, ",".join(formatters.keys()))
+        return 1
+
+    if opts.profile:
+        nsr_profile.enable()
+
+    try:
+        convert_file(files[1], opts, styles, opts.output_file)
+    finally:
+        if opts.profile:
+            nsr_profile.profiler.save(opts.profile)
+            nsr_profile.profiler.summary(opts.profile_top)
+            nsr_profile.disable()
+
+    return 0
 
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
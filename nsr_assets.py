@@ -0,0 +1,355 @@
+# -*- coding:utf8 -*-
+"""
+Image assets of the site.
+
+Images of 'img' blocks are looked up locally - by path, relative to
+post, or by file name of url in post 'media' directory, so
+'https://.../attribute.jpg' is served from posts/media/attribute.jpg.
+Images, which aren't found, are left as is.
+
+For every found image intrinsic size is read (png, gif, jpeg and svg
+headers are parsed here, no imaging library is needed) and a copy,
+named by hash of its content, is written to assets directory - such
+files never change and may be cached forever. Svg is optionally
+minified. If PIL is installed, downscaled variants are written for
+srcset.
+
+Results are cached in json file by hash of image content, so
+unchanged images are only read and hashed on next build.
+"""
+
+import os
+import re
+import json
+import struct
+import hashlib
+import urlparse
+from cStringIO import StringIO
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from notsorest2html import typed_blocks
+
+MEDIA_DIR = 'media'
+
+# length of content hash in file names
+HASH_LEN = 10
+
+# widths of downscaled variants, only smaller than image are written
+VARIANT_WIDTHS = (350, 700, 1400)
+VARIANT_FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG'}
+JPEG_QUALITY = 85
+
+PNG_SIGNATURE = '\x89PNG\r\n\x1a\n'
+
+# start of frame markers, which has image size
+JPEG_SOF = set(range(0xC0, 0xD0)) - set([0xC4, 0xC8, 0xCC])
+
+# markers without length
+JPEG_STANDALONE = set(range(0xD0, 0xDA)) | set([0x01])
+
+# css pixels in svg length unit
+SVG_UNITS = {'': 1.0, 'px': 1.0, 'pt': 4.0 / 3, 'pc': 16.0, 'in': 96.0,
+             'cm': 96 / 2.54, 'mm': 96 / 25.4}
+
+re_svg_root = re.compile(r"<svg\b[^>]*>", re.S)
+re_svg_length = re.compile(r"\s*([\d.]+)\s*([a-z]*)\s*$")
+re_svg_comment = re.compile(r"<!--.*?-->", re.S)
+re_svg_prolog = re.compile(r"<\?xml.*?\?>|<!DOCTYPE[^\[>]*(\[.*?\])?\s*>",
+                           re.S)
+re_svg_tag_space = re.compile(r">\s+<")
+
+
+def svg_attr(tag, name):
+    match = re.search(r"\s{0}\s*=\s*(['\"])(.*?)\1".format(name), tag, re.S)
+    return match.group(2) if match else None
+
+
+def svg_length(value):
+    "length in css pixels or None for relative and unknown units"
+    match = re_svg_length.match(value or '')
+    if match is None or match.group(2) not in SVG_UNITS:
+        return None
+    return int(round(float(match.group(1)) * SVG_UNITS[match.group(2)]))
+
+
+def svg_size(data):
+    match = re_svg_root.search(data)
+    if match is None:
+        return None
+
+    tag = match.group(0)
+    width = svg_length(svg_attr(tag, 'width'))
+    height = svg_length(svg_attr(tag, 'height'))
+    if width and height:
+        return width, height
+
+    view_box = (svg_attr(tag, 'viewBox') or '').replace(',', ' ').split()
+    if len(view_box) == 4:
+        return (int(round(float(view_box[2]))),
+                int(round(float(view_box[3]))))
+    return None
+
+
+def jpeg_size(data):
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != '\xff':
+            return None
+
+        marker = ord(data[pos + 1])
+        if marker == 0xFF:
+            # fill byte
+            pos += 1
+        elif marker in JPEG_STANDALONE:
+            pos += 2
+        elif marker in JPEG_SOF:
+            if pos + 9 > len(data):
+                return None
+            height, width = struct.unpack('>HH', data[pos + 5:pos + 9])
+            return width, height
+        else:
+            pos += 2 + struct.unpack('>H', data[pos + 2:pos + 4])[0]
+    return None
+
+
+def image_size(data):
+    "(width, height) of png, gif, jpeg or svg image data or None"
+    if data.startswith(PNG_SIGNATURE) and len(data) >= 24:
+        return struct.unpack('>II', data[16:24])
+
+    if data[:6] in ('GIF87a', 'GIF89a') and len(data) >= 10:
+        return struct.unpack('<HH', data[6:10])
+
+    if data.startswith('\xff\xd8'):
+        return jpeg_size(data)
+
+    if '<svg' in data[:4096]:
+        return svg_size(data)
+
+    return None
+
+
+def minify_svg(data):
+    "remove xml prolog, comments and whitespace between tags"
+    data = re_svg_prolog.sub('', data)
+    data = re_svg_comment.sub('', data)
+    return re_svg_tag_space.sub('><', data).strip()
+
+
+def hashed_name(fname, data, suffix=''):
+    "'name.<content hash>.ext'"
+    stem, ext = os.path.splitext(os.path.basename(fname))
+    return "{0}{1}.{2}{3}".format(stem, suffix,
+                                  hashlib.sha1(data).hexdigest()[:HASH_LEN],
+                                  ext.lower())
+
+
+def find_image(url, post_dir):
+    "local file for image url, or None"
+    candidates = []
+    path = urlparse.urlparse(url).path
+
+    if '://' not in url:
+        candidates.append(os.path.join(post_dir, path))
+    candidates.append(os.path.join(post_dir, MEDIA_DIR,
+                                   os.path.basename(path)))
+
+    for fname in candidates:
+        if os.path.isfile(fname):
+            return fname
+    return None
+
+
+def image_urls(text, styles):
+    "urls of 'img' blocks of post text"
+    return [block.data.strip() for tp, block in typed_blocks(text, styles)
+                if tp == 'img']
+
+
+def write_new(fname, data):
+    "content hashed files never change, existing file isn't read"
+    if os.path.exists(fname):
+        return False
+
+    tmp_fname = "{0}.{1}.tmp".format(fname, os.getpid())
+    with open(tmp_fname, 'wb') as fd:
+        fd.write(data)
+    os.rename(tmp_fname, fname)
+    return True
+
+
+def make_variants(fname, data, width):
+    "[(name, width, data)] of downscaled copies of image"
+    ext = os.path.splitext(fname)[1].lower()
+    if Image is None or ext not in VARIANT_FORMATS:
+        return []
+
+    image = Image.open(StringIO(data))
+    res = []
+    for vwidth in VARIANT_WIDTHS:
+        if vwidth >= width:
+            continue
+        vheight = max(1, int(round(image.size[1] * vwidth / float(width))))
+        out = StringIO()
+        image.resize((vwidth, vheight), Image.ANTIALIAS).save(
+                    out, VARIANT_FORMATS[ext], quality=JPEG_QUALITY,
+                    optimize=True)
+        res.append((hashed_name(fname, data, '-{0}w'.format(vwidth)),
+                    vwidth, out.getvalue()))
+    return res
+
+
+def process_image(fname, data, assets_dir, minify_svg_files, variants):
+    """
+    write hashed copy and variants of image to assets_dir. Returns info -
+    {'name', 'width', 'height', 'variants': [[name, width]]} or None,
+    if image size can't be found
+    """
+    size = image_size(data)
+    if size is None:
+        return None
+    width, height = size
+
+    if minify_svg_files and fname.lower().endswith('.svg'):
+        data = minify_svg(data)
+
+    name = hashed_name(fname, data)
+    write_new(os.path.join(assets_dir, name), data)
+
+    info = {'name': name, 'width': width, 'height': height, 'variants': []}
+    if variants:
+        for vname, vwidth, vdata in make_variants(fname, data, width):
+            write_new(os.path.join(assets_dir, vname), vdata)
+            info['variants'].append([vname, vwidth])
+    return info
+
+
+class AssetCache(object):
+    "{image path : [content key, info]} in json file"
+    def __init__(self, fname):
+        self.fname = fname
+        self.entries = {}
+
+        if os.path.exists(fname):
+            with open(fname) as fd:
+                self.entries = json.load(fd)
+
+    def get(self, src, key, assets_dir):
+        "cached info, if image is the same and all its files exist"
+        entry = self.entries.get(os.path.abspath(src))
+        if entry is None or entry[0] != key:
+            return None
+
+        info = entry[1]
+        if info is None:
+            return None
+
+        names = [info['name']] + [name for name, _ in info['variants']]
+        for name in names:
+            if not os.path.exists(os.path.join(assets_dir, name)):
+                return None
+        return info
+
+    def put(self, src, key, info):
+        self.entries[os.path.abspath(src)] = [key, info]
+
+    def save(self):
+        tmp_fname = self.fname + '.tmp'
+        with open(tmp_fname, 'w') as fd:
+            json.dump(self.entries, fd, indent=1, sort_keys=True)
+        os.rename(tmp_fname, self.fname)
+
+
+class AssetIndex(object):
+    """
+    {image url : asset} for every post, asset is
+    {'url', 'width', 'height', 'srcset': [[url, width]]}
+    """
+    def __init__(self, url_prefix):
+        self.url_prefix = url_prefix
+        self.posts = {}
+        self.processed = 0
+        self.cached = 0
+
+    def asset(self, info):
+        prefix = self.url_prefix
+        return {'url': prefix + info['name'],
+                'width': info['width'],
+                'height': info['height'],
+                'srcset': [[prefix + name, width]
+                                for name, width in info['variants']]}
+
+    def post_assets(self, fname):
+        return self.posts.get(os.path.abspath(fname))
+
+    def key(self, fname):
+        "hash of post assets, for build manifest"
+        data = json.dumps(self.post_assets(fname) or {}, sort_keys=True)
+        return hashlib.sha1(data).hexdigest()
+
+    def images(self):
+        "number of different images of all posts"
+        return len(set(asset['url'] for assets in self.posts.values()
+                                        for asset in assets.values()))
+
+
+def build_index(files, opts, styles, cache_fname):
+    """
+    process images of all posts to opts.assets_dir. Posts, which can't be
+    parsed, are skipped - error is reported by post build
+    """
+    assets_dir = opts.assets_dir
+    if not os.path.isdir(assets_dir):
+        os.makedirs(assets_dir)
+
+    minify = getattr(opts, 'minify_svg', False)
+    variants = getattr(opts, 'image_variants', False) and Image is not None
+    options_key = json.dumps([minify, variants, HASH_LEN, VARIANT_WIDTHS,
+                              JPEG_QUALITY])
+
+    cache = AssetCache(cache_fname)
+    index = AssetIndex(opts.assets_url)
+
+    # {image path : info}, images, used by many posts, are processed once
+    infos = {}
+
+    for fname in files:
+        with open(fname) as fd:
+            text = fd.read().decode('utf8')
+
+        try:
+            urls = image_urls(text, styles)
+        except Exception:
+            continue
+
+        assets = {}
+        for url in urls:
+            src = find_image(url, os.path.dirname(fname))
+            if src is None:
+                continue
+
+            if src not in infos:
+                with open(src, 'rb') as fd:
+                    data = fd.read()
+                key = hashlib.sha1(options_key + data).hexdigest()
+                info = cache.get(src, key, assets_dir)
+                if info is None:
+                    info = process_image(src, data, assets_dir, minify,
+                                         variants)
+                    cache.put(src, key, info)
+                    index.processed += 1
+                else:
+                    index.cached += 1
+                infos[src] = info
+
+            if infos[src] is not None:
+                assets[url] = index.asset(infos[src])
+
+        index.posts[os.path.abspath(fname)] = assets
+
+    cache.save()
+    return index
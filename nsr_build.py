@@ -0,0 +1,596 @@
+# -*- coding:utf8 -*-
+"""
+Whole-site build for notsorest posts.
+
+Heavy modules (pygments, pylint) are imported once in the parent
+process and inherited by the pool workers, so converting N posts
+pays interpreter start-up and import cost only once. Pygments lexers
+are loaded lazily, so lexers, used by the posts, are loaded before
+the pool is started - see warm_lexers.
+"""
+
+import os
+import sys
+import copy
+import glob
+import json
+import time
+import hashlib
+import traceback
+import multiprocessing
+from cStringIO import StringIO
+
+import nsr_feed
+import nsr_cache
+import nsr_links
+import nsr_assets
+import notsorest2html
+
+
+def collect_sources(patterns):
+    res = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '*.txt')
+
+        for fname in sorted(glob.glob(pattern)):
+            if fname not in res:
+                res.append(fname)
+    return res
+
+
+def output_name(fname, opts):
+    res_fname = os.path.splitext(os.path.basename(fname))[0] + '.html'
+
+    if opts.output_dir is None:
+        return os.path.join(os.path.dirname(fname), res_fname)
+    return os.path.join(opts.output_dir, res_fname)
+
+
+# modules, which content affects generated html
+CONVERTER_MODULES = ('notsorest2html', 'nsr_lexer', 'py_struct', 'nsr_lint',
+                     'nsr_pylint', 'nsr_exec', 'nsr_links', 'nsr_assets')
+
+# options, which affects generated html
+OUTPUT_OPTIONS = ('format', 'nolint', 'old_inline_support', 'standalone',
+                  'css_classes', 'stylesheet', 'pygments_style',
+                  'compact_code', 'toggle_script', 'excerpt')
+
+# stylesheet for --css-classes mode, shared by all posts of the site
+STYLESHEET_NAME = 'pygments.css'
+
+# code toggle script for --compact-code mode, shared by all posts
+TOGGLE_SCRIPT_NAME = 'nsr_toggle.js'
+
+
+
+def file_hash(fname):
+    with open(fname, 'rb') as fd:
+        return hashlib.sha1(fd.read()).hexdigest()
+
+
+def converter_files():
+    # some of modules are imported lazily, so they may be not loaded yet
+    dname = os.path.dirname(os.path.abspath(notsorest2html.__file__))
+    return [os.path.join(dname, mod_name + '.py')
+                for mod_name in CONVERTER_MODULES]
+
+
+def dependencies_hash(opts):
+    "hash of everything except the post itself, which may change output"
+    deps = hashlib.sha1()
+
+    deps_files = converter_files() + notsorest2html.style_file_names(opts)
+    deps_files.append(os.path.join(os.path.dirname(notsorest2html.__file__),
+                                   'pylintrc'))
+
+    for fname in deps_files:
+        deps.update(fname + ':' + file_hash(fname) + '\n')
+
+    for opt_name in OUTPUT_OPTIONS:
+        deps.update("{0}={1!r}\n".format(opt_name, getattr(opts, opt_name)))
+
+    return deps.hexdigest()
+
+
+class Manifest(object):
+    """
+    Build manifest - {source path : [input key, output path, output hash,
+    captured output]}. Output - lint and 'ut' reports - is replayed for
+    skipped posts, so rebuild doesn't hide existing warnings
+    """
+    def __init__(self, fname):
+        self.fname = fname
+        self.entries = {}
+
+        if os.path.exists(fname):
+            with open(fname) as fd:
+                self.entries = json.load(fd)
+
+    def input_key(self, src, deps_hash):
+        return hashlib.sha1(file_hash(src) + deps_hash).hexdigest()
+
+    def is_fresh(self, src, key, res_fname):
+        entry = self.entries.get(os.path.abspath(src))
+        if entry is None:
+            return False
+
+        old_key, old_res_fname, old_res_hash = entry[:3]
+        return old_key == key and \
+               old_res_fname == os.path.abspath(res_fname) and \
+               os.path.exists(res_fname) and \
+               file_hash(res_fname) == old_res_hash
+
+    def update(self, src, key, res_fname, output=''):
+        self.entries[os.path.abspath(src)] = [key,
+                                              os.path.abspath(res_fname),
+                                              file_hash(res_fname),
+                                              output.decode('utf8')]
+
+    def output(self, src):
+        "captured output of last build of src"
+        entry = self.entries.get(os.path.abspath(src))
+        if entry is None or len(entry) < 4:
+            return ''
+        return entry[3].encode('utf8')
+
+    def forget(self, src):
+        self.entries.pop(os.path.abspath(src), None)
+
+    def save(self):
+        tmp_fname = self.fname + '.tmp'
+        with open(tmp_fname, 'w') as fd:
+            json.dump(self.entries, fd, indent=1, sort_keys=True)
+        os.rename(tmp_fname, self.fname)
+
+
+_worker_opts = None
+_worker_styles = None
+
+
+def init_worker(opts):
+    global _worker_opts, _worker_styles
+    _worker_opts = opts
+    _worker_styles = notsorest2html.load_styles(opts)
+
+
+def build_one(task):
+    """
+    Convert one post in a worker, task is
+    (fname, lint_results, links, assets).
+    Returns (fname, ok, elapsed, captured_output, cache_stats)
+    """
+    fname, lint_results, links, assets = task
+    nsr_cache.reset_stats()
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    ok = True
+    stime = time.time()
+
+    try:
+        notsorest2html.convert_file(fname, _worker_opts, _worker_styles,
+                                    output_name(fname, _worker_opts),
+                                    lint_results, links, assets)
+    except Exception:
+        ok = False
+        traceback.print_exc(file=sys.stdout)
+    finally:
+        output = sys.stdout.getvalue()
+        sys.stdout = stdout
+
+    return fname, ok, time.time() - stime, output, nsr_cache.cache_stats()
+
+
+def lint_site(files, opts):
+    """
+    lint python blocks of all posts in single linter session,
+    returns {fname : lint results}
+    """
+    texts = []
+    for fname in files:
+        with open(fname) as fd:
+            texts.append(fd.read().decode('utf8'))
+
+    styles = notsorest2html.load_styles(opts)
+    return dict(zip(files, notsorest2html.lint_posts(texts, styles, opts)))
+
+
+def page_urls(opts):
+    "function, which returns url of post page, relative to site root"
+    return lambda fname: os.path.basename(output_name(fname, opts))
+
+
+def link_index(files, opts):
+    "site link index, posts are referenced by output file names"
+    styles = notsorest2html.load_styles(opts)
+    return nsr_links.build_index(files, styles, page_urls(opts))
+
+
+def asset_index(files, opts):
+    "process images of posts to opts.assets dir in output dir"
+    stime = time.time()
+    opts.assets_dir = os.path.join(opts.output_dir or '.', opts.assets)
+    opts.assets_url = opts.assets.replace(os.sep, '/').rstrip('/') + '/'
+    cache_fname = os.path.join(os.path.dirname(opts.manifest),
+                               '.nsr_assets.json')
+
+    assets = nsr_assets.build_index(files, opts,
+                                    notsorest2html.load_styles(opts),
+                                    cache_fname)
+    print ("Assets: {0} images, {1} processed, {2} cached " +
+           "in {3:.2f}s").format(assets.images(), assets.processed,
+                                 assets.cached, time.time() - stime)
+    return assets
+
+
+def warm_lexers(files, opts):
+    """
+    load and compile lexers of code blocks of files, so pool workers
+    inherit them. Returns set of used block types
+    """
+    styles = notsorest2html.load_styles(opts)
+    provider = notsorest2html.formatters[opts.format]
+    used = set()
+
+    for fname in files:
+        with open(fname) as fd:
+            text = fd.read().decode('utf8')
+
+        try:
+            for tp, _ in notsorest2html.typed_blocks(text, styles):
+                if tp in provider.highlighters_map:
+                    used.add(tp)
+        except Exception:
+            # error is reported by post build
+            continue
+
+    for tp in used:
+        # regexps of lexer are compiled on first instantiation
+        provider.get_lexer(tp)()
+    return used
+
+
+def build_site(files, opts, lint_results=None, links=None, assets=None):
+    "convert all files, returns list of build_one results"
+    lint_results = lint_results or {}
+    tasks = [(fname, lint_results.get(fname),
+              links.post_links(fname) if links is not None else None,
+              assets.post_assets(fname) if assets is not None else None)
+                for fname in files]
+
+    if opts.jobs == 1:
+        init_worker(opts)
+        return map(build_one, tasks)
+
+    warm_lexers(files, opts)
+    pool = multiprocessing.Pool(opts.jobs, init_worker, (opts,))
+    try:
+        return pool.map(build_one, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def write_output(output, out):
+    if output:
+        for line in output.rstrip('\n').split('\n'):
+            out.write("     | " + line + "\n")
+
+
+def report(results, wall_time, skipped=(), stats=(), out=sys.stdout,
+           list_skipped=True, skipped_output=None):
+    """
+    skipped_output is {fname : output of last build} for skipped posts.
+    Returns number of failed posts
+    """
+    failed = 0
+    skipped_output = skipped_output or {}
+
+    if list_skipped:
+        for fname in skipped:
+            out.write("{0:<4} {1:<50}\n".format("SKIP", fname))
+            write_output(skipped_output.get(fname), out)
+
+    for fname, ok, elapsed, output, _ in results:
+        out.write("{0:<4} {1:<50} {2:6.2f}s\n".format(
+                        "OK" if ok else "FAIL", fname, elapsed))
+        write_output(output, out)
+
+        if not ok:
+            failed += 1
+
+    with_output = len([fname for fname in skipped
+                            if skipped_output.get(fname)])
+
+    out.write(("{0} posts, {1} built, {2} skipped ({3} with warnings), " +
+               "{4} failed, total wall time {5:.2f}s\n").format(
+                    len(results) + len(skipped), len(results) - failed,
+                    len(skipped), with_output, failed, wall_time))
+
+    stats = nsr_cache.merge_stats([res[-1] for res in results] + list(stats))
+    for name, cstats in sorted(stats.items()):
+        out.write("{0} cache: {1[hits]} hits, {1[misses]} misses, "
+                  "{1[evicted]} evicted\n".format(name, cstats))
+
+    return failed
+
+
+def output_dirs(files, opts):
+    return set(os.path.dirname(output_name(fname, opts)) for fname in files)
+
+
+def write_stylesheet(files, opts):
+    "write shared highlight stylesheet to every output dir"
+    css = notsorest2html.highlight_stylesheet(opts.pygments_style)
+    for dname in output_dirs(files, opts):
+        notsorest2html.write_if_changed(os.path.join(dname, STYLESHEET_NAME),
+                                        css)
+
+
+def write_toggle_script(files, opts):
+    "write shared code toggle script to every output dir"
+    for dname in output_dirs(files, opts):
+        notsorest2html.write_if_changed(os.path.join(dname, TOGGLE_SCRIPT_NAME),
+                                        notsorest2html.TOGGLE_SCRIPT)
+
+
+def page_weight(files, opts, out=sys.stdout):
+    """
+    compare size of posts, rendered with inline styles, with css classes
+    + shared stylesheet and with css classes + compact code blocks
+    + shared stylesheet and toggle script
+    """
+    styles = notsorest2html.load_styles(opts)
+
+    inline_opts = copy.copy(opts)
+    inline_opts.css_classes = False
+    inline_opts.compact_code = False
+    # sizes don't depend on lint and 'ut' results
+    inline_opts.nolint = True
+    inline_opts.nout = True
+
+    classes_opts = copy.copy(inline_opts)
+    classes_opts.css_classes = True
+    classes_opts.stylesheet = STYLESHEET_NAME
+
+    compact_opts = copy.copy(classes_opts)
+    compact_opts.compact_code = True
+    compact_opts.toggle_script = TOGGLE_SCRIPT_NAME
+
+    variants = [inline_opts, classes_opts, compact_opts]
+
+    css_size = len(notsorest2html.highlight_stylesheet(opts.pygments_style))
+    script_size = len(notsorest2html.TOGGLE_SCRIPT.encode('utf8'))
+    totals = [0, 0, 0]
+
+    line = "{0:<40} {1:>10} {2:>10} {3:>10} {4:>7}\n"
+    out.write(line.format("post", "inline", "classes", "compact", "ratio"))
+
+    for fname in files:
+        text = open(fname).read().decode('utf8')
+        try:
+            sizes = [len(notsorest2html.render_text(
+                            text, variant_opts, styles, fname).encode('utf8'))
+                        for variant_opts in variants]
+        except Exception as exc:
+            out.write("{0:<40} error: {1}\n".format(os.path.basename(fname),
+                                                     exc))
+            continue
+
+        totals = [total + size for total, size in zip(totals, sizes)]
+        out.write(line.format(os.path.basename(fname), sizes[0], sizes[1],
+                              sizes[2], "{0:.2f}".format(
+                                    float(sizes[2]) / sizes[0])))
+
+    # shared assets are downloaded once per site
+    out.write(line.format(STYLESHEET_NAME, 0, css_size, css_size, ""))
+    out.write(line.format(TOGGLE_SCRIPT_NAME, 0, 0, script_size, ""))
+    totals[1] += css_size
+    totals[2] += css_size + script_size
+
+    out.write(line.format("total", totals[0], totals[1], totals[2],
+                          "{0:.2f}".format(float(totals[2]) /
+                                           max(totals[0], 1))))
+    out.write("compact code saves {0} bytes vs classes, {1} vs inline\n"
+                    .format(totals[1] - totals[2], totals[0] - totals[2]))
+
+
+def get_option_parser():
+    parser = notsorest2html.get_option_parser()
+    parser.set_usage("%prog [options] DIR|GLOB|FILE...")
+    parser.remove_option("--output-file")
+    parser.remove_option("--profile")
+    parser.remove_option("--profile-top")
+    parser.add_option("-d", "--output-dir", dest='output_dir', default=None)
+    parser.add_option("-j", "--jobs", dest='jobs', type='int',
+                        default=multiprocessing.cpu_count())
+    parser.add_option("-m", "--manifest", dest='manifest', default=None)
+    parser.add_option("-F", "--force", dest='force', default=False,
+                        action='store_true')
+    parser.add_option("-w", "--watch", dest='watch', default=False,
+                        action='store_true',
+                        help="rebuild posts, when they, code or " +
+                             "style files changes")
+    parser.add_option("--debounce", dest='debounce', type='float',
+                        default=0.1,
+                        help="seconds without changes before rebuild " +
+                             "in --watch mode")
+    parser.add_option("--page-weight", dest='page_weight', default=False,
+                        action='store_true',
+                        help="report page size with inline styles, " +
+                             "css classes and compact code, don't build")
+    parser.add_option("--search-index", dest='search_index', default=None,
+                        metavar="DIR",
+                        help="write search index of posts to DIR")
+    parser.add_option("--search-code", dest='search_code', default=False,
+                        action='store_true',
+                        help="add code blocks to search index")
+    parser.add_option("--search-shards", dest='search_shards', type='int',
+                        default=16, help="number of search index shards")
+    parser.add_option("--assets", dest='assets', default=None, metavar="DIR",
+                        help="write content hashed copies of local images " +
+                             "to DIR in output dir and set image sizes")
+    parser.add_option("--minify-svg", dest='minify_svg', default=False,
+                        action='store_true',
+                        help="minify svg images in --assets mode")
+    parser.add_option("--image-variants", dest='image_variants',
+                        default=False, action='store_true',
+                        help="write downscaled images for srcset in " +
+                             "--assets mode, needs PIL")
+    parser.add_option("--deploy", dest='deploy', default=None, metavar="DIR",
+                        help="write minified and precompressed copy of " +
+                             "output dir to DIR")
+    nsr_feed.add_feed_options(parser)
+    return parser
+
+
+def main(argv=None):
+    argv = argv or sys.argv
+
+    opts, patterns = get_option_parser().parse_args(argv[1:])
+
+    if len(patterns) == 0:
+        print "Error - no posts to build"
+        return 1
+
+    if opts.format not in notsorest2html.formatters:
+        print >>sys.stderr, "Unknown format {0!r}".format(opts.format)
+        return 1
+
+    files = collect_sources(patterns)
+    if len(files) == 0:
+        print "Error - no posts found in {0}".format(" ".join(patterns))
+        return 1
+
+    if opts.page_weight:
+        page_weight(files, opts)
+        return 0
+
+    if opts.deploy and opts.output_dir is None:
+        print "Error - --deploy requires --output-dir"
+        return 1
+
+    if opts.output_dir is not None and not os.path.isdir(opts.output_dir):
+        os.makedirs(opts.output_dir)
+
+    if opts.css_classes and opts.stylesheet is None:
+        opts.stylesheet = STYLESHEET_NAME
+        write_stylesheet(files, opts)
+
+    if opts.compact_code and opts.toggle_script is None:
+        opts.toggle_script = TOGGLE_SCRIPT_NAME
+        write_toggle_script(files, opts)
+
+    if opts.manifest is None:
+        opts.manifest = os.path.join(opts.output_dir or '.',
+                                     '.nsr_manifest.json')
+
+    if opts.image_variants and nsr_assets.Image is None:
+        print >>sys.stderr, "WARNING: PIL isn't installed, " + \
+                            "--image-variants is ignored"
+
+    if opts.watch:
+        import nsr_watch
+        return nsr_watch.watch(patterns, opts)
+
+    failed = build(files, opts)
+
+    return 1 if failed else 0
+
+
+def build(files, opts, forced=(), list_skipped=True):
+    """
+    lint and convert files, which output is stale, and
+    files from forced. Returns number of failed files
+    """
+    stime = time.time()
+    nsr_cache.reset_stats()
+
+    manifest = Manifest(opts.manifest)
+    deps_hash = dependencies_hash(opts)
+
+    # post is stale if links to other posts or from them change
+    links = link_index(files, opts)
+
+    # or if its images change
+    assets = None
+    if getattr(opts, 'assets', None):
+        assets = asset_index(files, opts)
+
+    keys = dict((fname, manifest.input_key(fname,
+                        deps_hash + links.key(fname) +
+                        (assets.key(fname) if assets is not None else '')))
+                    for fname in files)
+
+    if opts.force:
+        stale = files
+    else:
+        stale = [fname for fname in files
+                    if fname in forced or
+                       not manifest.is_fresh(fname, keys[fname],
+                                             output_name(fname, opts))]
+
+    skipped = [fname for fname in files if fname not in stale]
+
+    results = []
+    lint_stats = {}
+    if stale:
+        lint_results = None
+        if not opts.nolint:
+            lint_results = lint_site(stale, opts)
+            lint_stats = nsr_cache.cache_stats()
+
+        build_opts = copy.copy(opts)
+        build_opts.jobs = max(1, min(opts.jobs, len(stale)))
+        results = build_site(stale, build_opts, lint_results, links, assets)
+
+    for fname, ok, _, output, _ in results:
+        if ok:
+            manifest.update(fname, keys[fname], output_name(fname, opts),
+                            output)
+        else:
+            manifest.forget(fname)
+    manifest.save()
+
+    links.report()
+    failed = report(results, time.time() - stime, skipped, [lint_stats],
+                    list_skipped=list_skipped,
+                    skipped_output=dict((fname, manifest.output(fname))
+                                            for fname in skipped))
+
+    # posts, which are built now or before
+    built = [fname for fname in files
+                if os.path.abspath(fname) in manifest.entries]
+
+    if getattr(opts, 'search_index', None):
+        update_search_index([(fname, keys[fname]) for fname in built], opts)
+
+    if getattr(opts, 'feed', None) or getattr(opts, 'index_page', None):
+        stime = time.time()
+        count = nsr_feed.update_feed(built, opts, page_urls(opts), links)
+        print "Feed: {0} posts in {1:.2f}s".format(count, time.time() - stime)
+
+    if getattr(opts, 'deploy', None):
+        import nsr_deploy
+        nsr_deploy.deploy(opts.output_dir, opts.deploy, opts.jobs)
+
+    return failed
+
+
+def update_search_index(sources, opts):
+    "update search index with posts, sources are (fname, build key)"
+    import nsr_search
+
+    stime = time.time()
+    cache_fname = os.path.join(os.path.dirname(opts.manifest),
+                               '.nsr_search.json')
+    tokenized, written = nsr_search.update_index(
+                sources, opts, notsorest2html.load_styles(opts),
+                page_urls(opts), cache_fname)
+
+    print ("Search index: {0} posts, {1} tokenized, {2} files written " +
+           "in {3:.2f}s").format(len(sources), tokenized, written,
+                                 time.time() - stime)
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,186 @@
+# -*- coding:utf8 -*-
+"""
+Content-addressed on-disk cache.
+
+Every value is stored in its own file, named by the sha1 of the key.
+File mtime is used as the last access time, so the cache can be shared
+by many processes and evicted in LRU order without any index file.
+"""
+
+import os
+import errno
+import hashlib
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+# fraction of max_size, left after eviction
+EVICT_TO = 0.8
+
+
+def make_key(*parts):
+    key = hashlib.sha1()
+    for part in parts:
+        if isinstance(part, unicode):
+            part = part.encode('utf8')
+        elif not isinstance(part, str):
+            part = repr(part)
+        key.update(str(len(part)) + ':' + part)
+    return key.hexdigest()
+
+
+class DiskCache(object):
+    def __init__(self, root, max_size=DEFAULT_MAX_SIZE):
+        self.root = root
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+        # approximated current size, lazily computed on first put
+        self.size = None
+
+    def path(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key):
+        fname = self.path(key)
+        try:
+            with open(fname, 'rb') as fd:
+                data = fd.read()
+        except IOError as exc:
+            if exc.errno != errno.ENOENT:
+                raise
+            self.misses += 1
+            return None
+
+        try:
+            os.utime(fname, None)
+        except OSError:
+            # evicted by other process
+            pass
+
+        self.hits += 1
+        return data
+
+    def put(self, key, data):
+        fname = self.path(key)
+        dname = os.path.dirname(fname)
+
+        if not os.path.isdir(dname):
+            try:
+                os.makedirs(dname)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+        tmp_fname = "{0}.{1}.tmp".format(fname, os.getpid())
+        with open(tmp_fname, 'wb') as fd:
+            fd.write(data)
+        os.rename(tmp_fname, fname)
+
+        if self.size is None:
+            self.size = sum(size for _, size, _ in self.entries())
+        else:
+            self.size += len(data)
+
+        if self.size > self.max_size:
+            self.evict()
+
+    def entries(self):
+        "yields (path, size, atime) for all cached items"
+        if not os.path.isdir(self.root):
+            return
+
+        for dname in os.listdir(self.root):
+            dpath = os.path.join(self.root, dname)
+            if not os.path.isdir(dpath):
+                continue
+            for fname in os.listdir(dpath):
+                fpath = os.path.join(dpath, fname)
+                try:
+                    stat = os.stat(fpath)
+                except OSError:
+                    continue
+                yield fpath, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        "remove least recently used items, until size fits into EVICT_TO"
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        limit = self.max_size * EVICT_TO
+
+        for fpath, fsize, _ in entries:
+            if size <= limit:
+                break
+            try:
+                os.unlink(fpath)
+            except OSError:
+                continue
+            size -= fsize
+            self.evicted += 1
+
+        self.size = size
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evicted': self.evicted}
+
+
+class NullCache(object):
+    "used then caching is disabled"
+    hits = misses = evicted = 0
+
+    def get(self, key):
+        return None
+
+    def put(self, key, data):
+        pass
+
+    def stats(self):
+        return {'hits': 0, 'misses': 0, 'evicted': 0}
+
+
+caches = {}
+
+
+def get_cache(opts, name):
+    """
+    return cache for namespace 'name', configured by opts.cache_dir and
+    opts.cache_size. Caches are shared by all users in process
+    """
+    cache_dir = getattr(opts, 'cache_dir', None)
+
+    if not cache_dir:
+        return NullCache()
+
+    root = os.path.join(cache_dir, name)
+    if root not in caches:
+        max_size = getattr(opts, 'cache_size', None)
+        if max_size is None:
+            max_size = DEFAULT_MAX_SIZE
+        else:
+            max_size = int(max_size * 1024 * 1024)
+        caches[root] = DiskCache(root, max_size)
+    return caches[root]
+
+
+def cache_stats():
+    "{namespace : stats} for all caches, used in this process"
+    return dict((os.path.basename(root), cache.stats())
+                    for root, cache in caches.items())
+
+
+def reset_stats():
+    for cache in caches.values():
+        cache.hits = cache.misses = cache.evicted = 0
+
+
+def merge_stats(stats_list):
+    res = {}
+    for stats in stats_list:
+        for name, cstats in stats.items():
+            curr = res.setdefault(name, {'hits': 0, 'misses': 0, 'evicted': 0})
+            for key, val in cstats.items():
+                curr[key] += val
+    return res
@@ -0,0 +1,72 @@
+# -*- coding:utf8 -*-
+"""
+Thin client for nsr_daemon. Takes the same arguments, as notsorest2html.py
+and forwards them to the daemon, so conversion doesn't pay for imports.
+If daemon is not running, converts the post in this process.
+
+Socket path is taken from NSR_SOCKET environment variable.
+"""
+
+import os
+import sys
+import json
+import errno
+import socket
+import tempfile
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(),
+                              'nsr-{0}.sock'.format(os.getuid()))
+
+
+def socket_path():
+    return os.environ.get('NSR_SOCKET', DEFAULT_SOCKET)
+
+
+def send_request(path, argv):
+    """
+    execute argv in daemon, returns (exit code, output)
+    or None if daemon is not available
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    data = []
+    try:
+        sock.connect(path)
+        sock.sendall(json.dumps({'argv': argv, 'cwd': os.getcwd()}) + '\n')
+        sock.shutdown(socket.SHUT_WR)
+
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            data.append(chunk)
+    except socket.error as exc:
+        # no daemon, or it restarts, as converter was changed
+        if exc.errno in (errno.ENOENT, errno.ECONNREFUSED,
+                         errno.EPIPE, errno.ECONNRESET):
+            return None
+        raise
+    finally:
+        sock.close()
+
+    if len(data) == 0:
+        return None
+
+    res = json.loads("".join(data))
+    return res['code'], res['output']
+
+
+def main(argv=None):
+    argv = argv or sys.argv
+
+    res = send_request(socket_path(), argv)
+
+    if res is None:
+        import notsorest2html
+        return notsorest2html.main(argv)
+
+    code, output = res
+    sys.stdout.write(output.encode('utf8'))
+    return code
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,134 @@
+# -*- coding:utf8 -*-
+"""
+Render daemon for notsorest posts.
+
+Daemon imports pygments, pylint and converter once, warms them up on
+a small post and serves nsr_client requests on a unix socket. Every
+request is executed in a forked child, so it starts with warm state and
+can't break the daemon. If converter sources change, daemon restarts.
+
+Protocol - client sends one json line {"argv": [...], "cwd": "..."},
+daemon replies with json {"code": exit code, "output": "..."}.
+"""
+
+import os
+import sys
+import json
+import optparse
+import traceback
+import SocketServer
+from cStringIO import StringIO
+
+import nsr_lint
+import nsr_build
+import nsr_client
+import notsorest2html
+
+WARMUP_POST = u"""Warm up *text* with [ref]
+
+python:
+    def func(x):
+        return x + 1
+
+linklist:
+    ref http://example.com/
+"""
+
+
+def warm_up():
+    "import and initialize everything, which is used by conversion"
+    opts, _ = notsorest2html.get_option_parser().parse_args(['-c', ''])
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        notsorest2html.render_text(WARMUP_POST, opts,
+                                   notsorest2html.load_styles(opts))
+    finally:
+        sys.stdout = stdout
+
+    # lexers are loaded on first use
+    provider = notsorest2html.BlogspotHTMLProvider
+    for block in provider.highlighters_map:
+        provider.get_lexer(block)
+
+
+def sources_state():
+    res = {}
+    for fname in nsr_build.converter_files() + [nsr_lint.RCFILE]:
+        try:
+            res[fname] = os.stat(fname).st_mtime
+        except OSError:
+            res[fname] = None
+    return res
+
+
+class RenderHandler(SocketServer.StreamRequestHandler):
+    def handle(self):
+        request = json.loads(self.rfile.readline())
+
+        stdout, stderr = sys.stdout, sys.stderr
+        sys.stdout = sys.stderr = output = StringIO()
+        try:
+            os.chdir(request['cwd'])
+            code = notsorest2html.main(request['argv'])
+        except SystemExit as exc:
+            code = exc.code
+        except Exception:
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout, sys.stderr = stdout, stderr
+
+        self.wfile.write(json.dumps({
+                'code': code,
+                'output': output.getvalue().decode('utf8', 'replace')}))
+
+
+class RenderServer(SocketServer.ForkingMixIn, SocketServer.UnixStreamServer):
+    def __init__(self, path):
+        if os.path.exists(path):
+            os.unlink(path)
+        SocketServer.UnixStreamServer.__init__(self, path, RenderHandler)
+        self.path = path
+        self.sources = sources_state()
+
+    def verify_request(self, request, client_address):
+        # runs in daemon process, before fork
+        if sources_state() != self.sources:
+            request.close()
+            self.restart()
+        return True
+
+    def restart(self):
+        self.server_close()
+        os.unlink(self.path)
+        os.execv(sys.executable, [sys.executable] + sys.argv)
+
+
+def main(argv=None):
+    argv = argv or sys.argv
+
+    parser = optparse.OptionParser("%prog [options]")
+    parser.add_option("-s", "--socket", dest='socket',
+                      default=nsr_client.socket_path())
+    opts, _ = parser.parse_args(argv[1:])
+
+    warm_up()
+
+    server = RenderServer(opts.socket)
+    print "Serving on {0}".format(opts.socket)
+    sys.stdout.flush()
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(opts.socket):
+            os.unlink(opts.socket)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
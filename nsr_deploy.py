@@ -0,0 +1,266 @@
+# -*- coding:utf8 -*-
+"""
+Deploy stage of the site build.
+
+Files of the output dir are copied to deploy dir:
+
+    html      - comments (except <!--more--> cut) and whitespace are
+                removed, except in pre, textarea, script and style.
+                Inline scripts, styles and style attributes, like
+                pygments inline styles in code, are minified too
+    js, css   - minified
+    text files are also written precompressed as 'file.gz', for
+    servers, which can serve them as is (nginx gzip_static)
+
+Minifiers have no js or css tokenizer, so they are conservative - js is
+only stripped of indentation, empty lines and line comments, newlines
+are kept and automatic semicolon insertion is not affected.
+
+Deploy dir has nsr_deploy.json - {path : {hash, size, gzip, immutable}},
+for ETag and Cache-Control headers. Files with content hash in name,
+like images from asset stage, are immutable. Manifest also keeps key
+of every source, so unchanged files are not processed again. Files are
+processed by pool of processes.
+"""
+
+import os
+import re
+import sys
+import json
+import gzip
+import time
+import hashlib
+import optparse
+import multiprocessing
+from cStringIO import StringIO
+
+from nsr_assets import HASH_LEN
+from notsorest2html import write_if_changed
+
+MANIFEST_NAME = 'nsr_deploy.json'
+
+GZIP_LEVEL = 9
+
+# files, which are written precompressed
+COMPRESS_EXTS = ('.html', '.js', '.css', '.svg', '.xml', '.json', '.txt')
+
+re_html_raw = re.compile(r"(<(pre|textarea|script|style)\b[^>]*>)(.*?)(</\2\s*>)",
+                         re.S | re.I)
+# conditional comments and blogspot jump break are kept
+re_html_comment = re.compile(r"<!--(?!\[if|more-->).*?-->", re.S)
+re_space = re.compile(r"\s+")
+re_css_comment = re.compile(r"/\*.*?\*/", re.S)
+re_css_space = re.compile(r"\s*([{};,])\s*")
+re_style_attr = re.compile(r'(\sstyle=")([^"]*)(")')
+re_style_space = re.compile(r"\s*([:;])\s*")
+re_hashed_name = re.compile(r"\.[0-9a-f]{{{0}}}\.[^.]+$".format(HASH_LEN))
+
+
+def collapse_space(match):
+    "keep one newline or space, html source stays readable by lines"
+    return '\n' if '\n' in match.group(0) else ' '
+
+
+def minify_js(data):
+    lines = []
+    for line in data.split('\n'):
+        line = line.strip()
+        if line and not line.startswith('//'):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def minify_css(data):
+    data = re_space.sub(' ', re_css_comment.sub('', data))
+    return re_css_space.sub(r'\1', data).strip()
+
+
+def minify_style_attr(match):
+    style = re_style_space.sub(r'\1', match.group(2)).strip().rstrip(';')
+    return match.group(1) + style + match.group(3)
+
+
+def minify_html(data):
+    res = []
+    pos = 0
+
+    def add_text(text):
+        text = re_space.sub(collapse_space, re_html_comment.sub('', text))
+        res.append(re_style_attr.sub(minify_style_attr, text))
+
+    for match in re_html_raw.finditer(data):
+        add_text(data[pos:match.start()])
+        open_tag, tag, body, close_tag = match.groups()
+
+        tag = tag.lower()
+        if tag == 'script':
+            body = minify_js(body)
+        elif tag == 'style':
+            body = minify_css(body)
+        elif tag == 'pre':
+            # text of pre is escaped, so attributes are in tags only
+            body = re_style_attr.sub(minify_style_attr, body)
+
+        open_tag = re_style_attr.sub(minify_style_attr,
+                                     re_space.sub(' ', open_tag))
+        res.append(open_tag + body + close_tag)
+        pos = match.end()
+
+    add_text(data[pos:])
+    return ''.join(res).strip() + '\n'
+
+
+MINIFIERS = {'.html': minify_html, '.js': minify_js, '.css': minify_css}
+
+
+def gzip_data(data, level=GZIP_LEVEL):
+    "gzip without name and time in header, so equal data gives equal file"
+    buff = StringIO()
+    with gzip.GzipFile('', 'wb', level, buff, mtime=0) as fd:
+        fd.write(data)
+    return buff.getvalue()
+
+
+def sha1(data):
+    return hashlib.sha1(data).hexdigest()
+
+
+def deploy_file(task):
+    """
+    minify and compress one file, task is (src, dst, gzip level).
+    Returns (dst, manifest entry)
+    """
+    src, dst, level = task
+    with open(src, 'rb') as fd:
+        data = fd.read()
+
+    ext = os.path.splitext(src)[1].lower()
+    if ext in MINIFIERS:
+        data = MINIFIERS[ext](data)
+    write_if_changed(dst, data)
+
+    entry = {'hash': sha1(data),
+             'size': len(data),
+             'gzip': None,
+             'immutable': re_hashed_name.search(dst) is not None}
+
+    if ext in COMPRESS_EXTS:
+        gz_data = gzip_data(data, level)
+        write_if_changed(dst + '.gz', gz_data)
+        entry['gzip'] = len(gz_data)
+
+    return dst, entry
+
+
+def site_files(src_dir, deploy_dir):
+    "files of output dir, except hidden and deploy dir, if it's inside"
+    deploy_dir = os.path.abspath(deploy_dir)
+    res = []
+    for dname, dirs, fnames in os.walk(src_dir):
+        dirs[:] = sorted(name for name in dirs
+                            if not name.startswith('.') and
+                               os.path.abspath(os.path.join(dname, name)) !=
+                                                                deploy_dir)
+        res.extend(os.path.join(dname, fname) for fname in sorted(fnames)
+                        if not fname.startswith('.') and
+                           not fname.endswith('.tmp'))
+    return res
+
+
+def is_fresh(entry, key, dst):
+    if entry is None or entry.get('key') != key or not os.path.exists(dst):
+        return False
+
+    if entry['gzip'] is not None and not os.path.exists(dst + '.gz'):
+        return False
+
+    with open(dst, 'rb') as fd:
+        return sha1(fd.read()) == entry['hash']
+
+
+def deploy(src_dir, deploy_dir, jobs=1, level=GZIP_LEVEL, out=sys.stdout):
+    """
+    process changed files of src_dir to deploy_dir and write manifest.
+    Returns manifest
+    """
+    stime = time.time()
+    manifest_fname = os.path.join(deploy_dir, MANIFEST_NAME)
+    old_manifest = {}
+    if os.path.exists(manifest_fname):
+        with open(manifest_fname) as fd:
+            old_manifest = json.load(fd)
+
+    manifest = {}
+    tasks = []
+    keys = {}
+
+    for src in site_files(src_dir, deploy_dir):
+        path = os.path.relpath(src, src_dir).replace(os.sep, '/')
+        dst = os.path.join(deploy_dir, path)
+
+        with open(src, 'rb') as fd:
+            keys[dst] = sha1(fd.read() + str(level))
+
+        entry = old_manifest.get(path)
+        if is_fresh(entry, keys[dst], dst):
+            manifest[path] = entry
+        else:
+            if not os.path.isdir(os.path.dirname(dst)):
+                os.makedirs(os.path.dirname(dst))
+            tasks.append((src, dst, level))
+
+    jobs = max(1, min(jobs, len(tasks)))
+    if jobs == 1:
+        results = map(deploy_file, tasks)
+    else:
+        pool = multiprocessing.Pool(jobs)
+        try:
+            results = pool.map(deploy_file, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    for dst, entry in results:
+        entry['key'] = keys[dst]
+        path = os.path.relpath(dst, deploy_dir).replace(os.sep, '/')
+        manifest[path] = entry
+
+    # files, removed from site
+    for path in set(old_manifest) - set(manifest):
+        for fname in (path, path + '.gz'):
+            fname = os.path.join(deploy_dir, fname)
+            if os.path.exists(fname):
+                os.unlink(fname)
+
+    write_if_changed(manifest_fname, json.dumps(manifest, indent=1,
+                                                sort_keys=True))
+
+    src_size = sum(os.path.getsize(os.path.join(src_dir, path))
+                        for path in manifest)
+    size = sum(entry['size'] for entry in manifest.values())
+    gz_size = sum(entry['gzip'] or entry['size']
+                        for entry in manifest.values())
+
+    out.write(("Deploy: {0} files, {1} written, {2} skipped, {3} -> {4} " +
+               "bytes, {5} compressed, in {6:.2f}s\n").format(
+                    len(manifest), len(tasks), len(manifest) - len(tasks),
+                    src_size, size, gz_size, time.time() - stime))
+    return manifest
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog [options] SITE_DIR DEPLOY_DIR")
+    parser.add_option("-j", "--jobs", dest='jobs', type='int',
+                      default=multiprocessing.cpu_count())
+    parser.add_option("-l", "--level", dest='level', type='int',
+                      default=GZIP_LEVEL, help="gzip compression level")
+    opts, args = parser.parse_args(argv[1:])
+
+    if len(args) != 2:
+        parser.error("site and deploy dirs are required")
+
+    deploy(args[0], args[1], opts.jobs, opts.level)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
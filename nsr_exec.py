@@ -0,0 +1,172 @@
+# -*- coding:utf8 -*-
+"""
+Executes 'ut' python blocks in a pool of subprocesses.
+
+Every snippet runs in its own interpreter with memory limit and
+timeout, so broken or hanging snippet can't stall or crash the
+converter. Output is captured and traceback lines are mapped back to
+the post. Results are cached by snippet text.
+
+Running this module as a script executes snippet from stdin.
+"""
+
+import os
+import re
+import sys
+import json
+import signal
+import threading
+import traceback
+import subprocess
+
+from nsr_cache import NullCache, make_key
+
+DEFAULT_TIMEOUT = 10
+DEFAULT_MEM_LIMIT = 512
+
+# file name, used for snippet in subprocess
+SNIPPET_FNAME = '<snippet>'
+
+re_snippet_line = re.compile(r'File "{0}", line (\d+)'.format(SNIPPET_FNAME))
+
+
+class ExecResult(object):
+    def __init__(self, ok, output, timed_out=False):
+        self.ok = ok
+        self.output = output
+        self.timed_out = timed_out
+
+    def to_json(self):
+        return json.dumps([self.ok, self.output, self.timed_out])
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(*json.loads(data))
+
+    def report(self, fname, line):
+        """
+        text to show for block, which starts at line.
+        Snippet line N is a line 'line + N' of the post
+        """
+        output = re_snippet_line.sub(
+                    lambda mobj: 'File "{0}", line {1}'.format(
+                                        fname, line + int(mobj.group(1))),
+                    self.output)
+
+        if self.timed_out:
+            output += "Python block in line {0}: timeout\n".format(line + 1)
+        elif not self.ok:
+            output += "Python block in line {0}: failed\n".format(line + 1)
+
+        return output
+
+
+def run_in_subprocess(code, timeout, mem_limit):
+    "execute snippet in new interpreter, returns ExecResult"
+    def set_limits():
+        import resource
+        limit = mem_limit * 1024 * 1024
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        os.setsid()
+
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                            stdin=subprocess.PIPE,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            preexec_fn=set_limits,
+                            close_fds=True)
+
+    timed_out = []
+
+    def on_timeout():
+        timed_out.append(True)
+        try:
+            os.killpg(proc.pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+    timer = threading.Timer(timeout, on_timeout)
+    timer.start()
+    try:
+        output = proc.communicate(code.encode('utf8'))[0]
+    finally:
+        timer.cancel()
+
+    return ExecResult(proc.returncode == 0 and not timed_out,
+                      output.decode('utf8', 'replace'),
+                      bool(timed_out))
+
+
+class SnippetExecutor(object):
+    def __init__(self, jobs=None, timeout=DEFAULT_TIMEOUT,
+                 mem_limit=DEFAULT_MEM_LIMIT, cache=None):
+        self.jobs = jobs
+        self.timeout = timeout
+        self.mem_limit = mem_limit
+        self.cache = cache or NullCache()
+
+    def key(self, code):
+        return make_key('ut', code, sys.version, self.timeout, self.mem_limit)
+
+    def run_one(self, code):
+        key = self.key(code)
+        res = self.cache.get(key)
+
+        if res is not None:
+            return ExecResult.from_json(res)
+
+        res = run_in_subprocess(code, self.timeout, self.mem_limit)
+
+        # timeout depends on host load, so it's not cached
+        if not res.timed_out:
+            self.cache.put(key, res.to_json())
+        return res
+
+    def run(self, snippets):
+        """
+        snippets is a list of (snippet_id, code),
+        returns {snippet_id : ExecResult}
+        """
+        if len(snippets) == 0:
+            return {}
+
+        if len(snippets) == 1 or self.jobs == 1:
+            results = map(self.run_one, [code for _, code in snippets])
+        else:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(self.jobs, len(snippets))
+                                    if self.jobs else None)
+            try:
+                results = pool.map(self.run_one,
+                                   [code for _, code in snippets])
+            finally:
+                pool.close()
+                pool.join()
+
+        return dict(zip([snippet_id for snippet_id, _ in snippets], results))
+
+
+def get_executor(opts, cache=None):
+    return SnippetExecutor(getattr(opts, 'ut_jobs', None),
+                           getattr(opts, 'ut_timeout', DEFAULT_TIMEOUT),
+                           getattr(opts, 'ut_mem_limit', DEFAULT_MEM_LIMIT),
+                           cache)
+
+
+def run_snippet():
+    "subprocess side - execute snippet from stdin"
+    code = compile(sys.stdin.read().decode('utf8'), SNIPPET_FNAME, 'exec')
+
+    from oktest import ok
+
+    namespace = {'__name__': 'module', 'ok': ok}
+    try:
+        exec code in namespace
+    except:
+        # skip this function frame
+        tp, val, tb = sys.exc_info()
+        traceback.print_exception(tp, val, tb.tb_next)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_snippet()
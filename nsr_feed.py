@@ -0,0 +1,211 @@
+# -*- coding:utf8 -*-
+"""
+Atom feed and index page of the site from post excerpts.
+
+Only the part of every post before the cut is lexed and rendered,
+code below the cut is never linted or highlighted. Posts are ordered
+by update time, newest first - time of last git commit of post, so
+feed doesn't change on every checkout. Modification time is used for
+posts with uncommitted changes and outside of git.
+"""
+
+import os
+import sys
+import copy
+import time
+import subprocess
+from xml.sax.saxutils import escape, quoteattr
+
+import nsr_links
+import notsorest2html
+from notsorest2html import render_excerpt, toggle_scripts, write_if_changed, \
+                           JQUERY_TAG
+
+READ_MORE = u"Читать дальше"
+
+
+class Entry(object):
+    def __init__(self, fname, url, title, summary, updated):
+        self.fname = fname
+        self.url = url
+        self.title = title
+        self.summary = summary
+        self.updated = updated
+
+
+def atom_time(timestamp):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(timestamp))
+
+
+def git_output(args, cwd):
+    "output of git command or None, if git or repository is not found"
+    with open(os.devnull, 'w') as devnull:
+        try:
+            return subprocess.check_output(['git'] + args, cwd=cwd,
+                                           stderr=devnull)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+
+def git_dates(files):
+    "{fname : time of last commit} for committed files without changes"
+    dirs = {}
+    for fname in files:
+        dname = os.path.dirname(os.path.abspath(fname))
+        dirs.setdefault(dname, {})[os.path.basename(fname)] = fname
+
+    res = {}
+    for dname, names in dirs.items():
+        log = git_output(['log', '--format=COMMIT %ct', '--name-only',
+                          '--relative', '--'] + sorted(names), dname)
+        changed = git_output(['diff', '--name-only', '--relative', 'HEAD',
+                              '--'] + sorted(names), dname)
+        if log is None or changed is None:
+            continue
+
+        changed = set(changed.split('\n'))
+        commit_time = None
+        for line in log.split('\n'):
+            if line.startswith('COMMIT '):
+                commit_time = int(line.split()[1])
+            elif line in names and line not in changed:
+                # log is newest first
+                res.setdefault(names[line], commit_time)
+    return res
+
+
+def post_entries(files, opts, styles, url_func, links=None):
+    "Entry for every post, newest first. Posts with errors are skipped"
+    dates = git_dates(files)
+    res = []
+    for fname in files:
+        with open(fname) as fd:
+            text = fd.read().decode('utf8')
+
+        post_links = links.post_links(fname) if links is not None else None
+        try:
+            title, summary = render_excerpt(text, opts, styles, fname,
+                                            post_links)
+        except Exception as exc:
+            print "ERROR: {0}: excerpt failed: {1}".format(fname, exc)
+            continue
+
+        url = url_func(fname)
+        updated = dates.get(fname)
+        if updated is None:
+            updated = os.stat(fname).st_mtime
+        res.append(Entry(fname, url, title or url, summary, updated))
+
+    res.sort(key=lambda entry: (-entry.updated, entry.url))
+    return res
+
+
+def atom_feed(entries, opts):
+    site_url = opts.site_url
+    feed_url = site_url + os.path.basename(opts.feed)
+    updated = max([entry.updated for entry in entries] or [0])
+
+    res = [u'<?xml version="1.0" encoding="utf-8"?>',
+           u'<feed xmlns="http://www.w3.org/2005/Atom">',
+           u'<title>{0}</title>'.format(escape(opts.site_title)),
+           u'<id>{0}</id>'.format(escape(site_url or feed_url)),
+           u'<link href={0}/>'.format(quoteattr(site_url or feed_url)),
+           u'<link rel="self" href={0}/>'.format(quoteattr(feed_url)),
+           u'<updated>{0}</updated>'.format(atom_time(updated)),
+           u'<author><name>{0}</name></author>'.format(
+                                            escape(opts.site_author))]
+
+    for entry in entries:
+        url = site_url + entry.url
+        res.append(u'<entry>')
+        res.append(u'<title>{0}</title>'.format(escape(entry.title)))
+        res.append(u'<id>{0}</id>'.format(escape(url)))
+        res.append(u'<link href={0}/>'.format(quoteattr(url)))
+        res.append(u'<updated>{0}</updated>'.format(atom_time(entry.updated)))
+        res.append(u'<summary type="html">{0}</summary>'.format(
+                                                    escape(entry.summary)))
+        res.append(u'</entry>')
+
+    res.append(u'</feed>\n')
+    return u"\n".join(res)
+
+
+def index_page(entries, opts):
+    "page with excerpts of all posts, code toggle scripts are included once"
+    res = [u'<html><head>',
+           u'<meta http-equiv="Content-Type" ' +
+                u'content="text/html; charset=utf-8">',
+           u'<title>{0}</title>'.format(escape(opts.site_title))]
+
+    if getattr(opts, 'css_classes', False) and \
+            getattr(opts, 'stylesheet', None):
+        res.append(u'<link rel="stylesheet" type="text/css" ' +
+                   u'href={0}>'.format(quoteattr(opts.stylesheet)))
+
+    res.append(u'</head><body>')
+    res.append(u'<h1>{0}</h1>'.format(escape(opts.site_title)))
+
+    for entry in entries:
+        res.append(u'<div class="post">')
+        res.append(u'<h2><a href={0}>{1}</a></h2>'.format(
+                            quoteattr(entry.url), escape(entry.title)))
+        res.append(entry.summary)
+        res.append(u'<p><a href={0}>{1}</a></p>'.format(
+                            quoteattr(entry.url), READ_MORE))
+        res.append(u'</div>')
+
+    if not getattr(opts, 'compact_code', False):
+        res.append(JQUERY_TAG)
+    res.append(toggle_scripts(opts))
+    res.append(u'</body></html>\n')
+    return u"\n".join(res)
+
+
+def update_feed(files, opts, url_func, links=None):
+    "write opts.feed and opts.index_page, if set. Returns number of entries"
+    opts = copy.copy(opts)
+    for name in ('site_url', 'site_title', 'site_author'):
+        value = getattr(opts, name)
+        if isinstance(value, str):
+            setattr(opts, name, value.decode('utf8'))
+
+    styles = notsorest2html.load_styles(opts)
+    entries = post_entries(files, opts, styles, url_func, links)
+
+    if opts.feed:
+        write_if_changed(opts.feed, atom_feed(entries, opts).encode('utf8'))
+
+    if opts.index_page:
+        write_if_changed(opts.index_page,
+                         index_page(entries, opts).encode('utf8'))
+
+    return len(entries)
+
+
+def add_feed_options(parser):
+    parser.add_option("--feed", dest='feed', default=None, metavar="FILE",
+                        help="write atom feed of post excerpts to FILE")
+    parser.add_option("--index-page", dest='index_page', default=None,
+                        metavar="FILE",
+                        help="write page with post excerpts to FILE")
+    parser.add_option("--site-url", dest='site_url', default="",
+                        help="site url with trailing slash, for feed links")
+    parser.add_option("--site-title", dest='site_title',
+                        default=u"koder-ua.blogspot.com")
+    parser.add_option("--site-author", dest='site_author', default=u"koder")
+
+
+def main(argv):
+    parser = notsorest2html.get_option_parser()
+    parser.set_usage("%prog [options] POST...")
+    add_feed_options(parser)
+    opts, files = parser.parse_args(argv[1:])
+
+    if not files or not (opts.feed or opts.index_page):
+        parser.error("posts and --feed or --index-page are required")
+
+    update_feed(files, opts, nsr_links.page_url)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -59,11 +59,40 @@ class LexBlock(Struct):
 class Block(Struct):
     attrs = 'tp, line, opts, data[, style]'
 
+def iter_lines(fc):
+    """
+    the same as iter(fc.split('\\n')), but without list of all lines.
+    fc is text or iterable of lines with line ends, like file
+    """
+    if not isinstance(fc, basestring):
+        return iter_file_lines(fc)
+    return iter_text_lines(fc)
+
+def iter_file_lines(fd):
+    ends_with_newline = True
+    for line in fd:
+        ends_with_newline = line.endswith('\n')
+        yield line[:-1] if ends_with_newline else line
+
+    # split gives empty string after last newline
+    if ends_with_newline:
+        yield u""
+
+def iter_text_lines(fc):
+    pos = 0
+    while True:
+        end = fc.find('\n', pos)
+        if end == -1:
+            yield fc[pos:]
+            return
+        yield fc[pos:end]
+        pos = end + 1
+
 def lex(fc):
-    fc = fc.replace('\t', ' ' * 4)
     in_block = False
 
-    for line_num, line in enumerate(fc.split('\n')):
+    for line_num, line in enumerate(iter_lines(fc)):
+        line = line.replace('\t', ' ' * 4)
         try:
 
             if line.strip().startswith('##'):
@@ -155,11 +184,11 @@ def classify_para(data):
             return CUT, None
     return TEXT_PARA, data
 
-def _parse(fc):
+def _parse(lexems):
     curr_block = None
     lines_for_next_block = []
 
-    for line in lex(fc):
+    for line in lexems:
 
         #debug_prn(line_tp, data)
 
@@ -241,10 +270,13 @@ OUTPUT_TYPES = \
     ]
 
 def parse(fc):
+    return parse_lexems(lex(fc))
+
+def parse_lexems(lexems):
     list_items = []
     list_starts = None
 
-    for block in _parse(fc):
+    for block in _parse(lexems):
 
         if len(list_items) != 0 and LIST_ITEM != block.tp:
             yield Block(LIST, list_starts, {}, list_items)
@@ -0,0 +1,160 @@
+# -*- coding:utf8 -*-
+"""
+Site-wide link index.
+
+All posts are parsed once to collect link targets - named linklist
+items and headings - and backrefs. Backrefs, which have no target in
+the post itself, are resolved against other posts:
+
+    [name]          - named linklist item of any other post
+    [post.name]     - linklist item or heading of post 'post.txt'
+
+Heading 'Some text' is referenced as [post.Some_text].
+
+For every post index gives (site links, anchors) - {name : url} for
+backrefs, resolved to other posts, and anchors of post headings,
+referenced from the site. Both are a part of post build key, so post
+is rebuilt only when its resolved links change.
+"""
+
+import os
+import sys
+import json
+import hashlib
+
+from notsorest2html import re_backref, backref_name, heading_anchor, \
+                           linklist_items, typed_blocks
+
+HEADER_TYPES = ('text_h2', 'text_h3', 'text_h4')
+
+# blocks, where inline markup and backrefs are rendered
+INLINE_TYPES = ('text', 'list') + HEADER_TYPES
+
+
+def post_name(fname):
+    return os.path.splitext(os.path.basename(fname))[0]
+
+
+def page_url(fname):
+    "url of post page, relative to site root"
+    return post_name(fname) + '.html'
+
+
+class PostLinks(object):
+    "link targets and backrefs of one post"
+    def __init__(self, fname, text, styles):
+        self.fname = fname
+        self.name = post_name(fname)
+
+        # {linklist name : url}
+        self.targets = {}
+        self.headings = set()
+        self.backrefs = set()
+
+        for tp, block in typed_blocks(text, styles):
+            if tp == 'linklist':
+                for name, url in linklist_items(block.data):
+                    if name:
+                        self.targets[name] = url
+
+            elif tp in INLINE_TYPES:
+                items = block.data if tp == 'list' else [block.data]
+                for item in items:
+                    if item:
+                        self.backrefs.update(backref_name(ref)
+                                    for ref in re_backref.findall(item))
+
+                if tp in HEADER_TYPES:
+                    self.headings.add(heading_anchor(block.data))
+
+
+class LinkIndex(object):
+    def __init__(self, posts, url_func=page_url):
+        self.posts = dict((post.name, post) for post in posts)
+        self.url_func = url_func
+
+        # {linklist name : {url : [post names]}}
+        self.names = {}
+        for post in posts:
+            for name, url in post.targets.items():
+                self.names.setdefault(name, {})\
+                          .setdefault(url, []).append(post.name)
+
+        # {post name : ({backref : url}, referenced anchors)}
+        self.links = dict((name, ({}, set())) for name in self.posts)
+        self.dangling = {}
+        self.ambiguous = {}
+
+        for post in posts:
+            for name in sorted(post.backrefs - set(post.targets)):
+                url = self.resolve(post, name)
+                if url is None:
+                    self.dangling.setdefault(post.name, []).append(name)
+                else:
+                    self.links[post.name][0][name] = url
+
+    def resolve(self, post, name):
+        "url for backref name, used in post, or None"
+        if '.' in name:
+            stem, target = name.split('.', 1)
+            other = self.posts.get(stem)
+            if other is not None:
+                if target in other.targets:
+                    return other.targets[target]
+
+                if target in other.headings:
+                    self.links[other.name][1].add(target)
+                    if other is post:
+                        return '#' + target
+                    return self.url_func(other.fname) + '#' + target
+
+        urls = self.names.get(name)
+        if not urls:
+            return None
+
+        if len(urls) > 1:
+            self.ambiguous.setdefault(post.name, []).append(name)
+
+        # the same choice on every build - url from first post by name
+        return min(urls.items(), key=lambda item: min(item[1]))[0]
+
+    def post_links(self, fname):
+        "(site links, anchors) for post or None if post wasn't parsed"
+        res = self.links.get(post_name(fname))
+        if res is None:
+            return None
+        site_links, anchors = res
+        return site_links, frozenset(anchors)
+
+    def key(self, fname):
+        "hash of post resolved links, for build manifest"
+        site_links, anchors = self.post_links(fname) or ({}, ())
+        data = json.dumps([sorted(site_links.items()), sorted(anchors)])
+        return hashlib.sha1(data).hexdigest()
+
+    def report(self, out=sys.stdout):
+        for name in sorted(self.ambiguous):
+            out.write("WARNING: {0}: links {1} are defined in many posts\n"
+                        .format(name, ", ".join(self.ambiguous[name])
+                                            .encode('utf8')))
+
+        for name in sorted(self.dangling):
+            out.write("ERROR: {0}: backrefs {1} have no links on site\n"
+                        .format(name, ", ".join(self.dangling[name])
+                                            .encode('utf8')))
+
+
+def build_index(files, styles, url_func=page_url):
+    "parse files and build index. Posts, which can't be parsed, are skipped"
+    posts = []
+    for fname in files:
+        with open(fname) as fd:
+            text = fd.read().decode('utf8')
+
+        try:
+            posts.append(PostLinks(fname, text, styles))
+        except Exception:
+            # error is reported by post build
+            continue
+
+    return LinkIndex(posts, url_func)
@@ -0,0 +1,184 @@
+# -*- coding:utf8 -*-
+"""
+pylint checks for python blocks of notsorest posts
+
+Every block is parsed once into python ast. The same tree is used
+for syntax check, to build astng for pylint and to compile code for
+execution, so nothing is written to disk. pylint itself is imported
+only then the first snippet is linted, see nsr_pylint.
+"""
+
+import os
+import imp
+import json
+import hashlib
+import traceback
+from _ast import PyCF_ONLY_AST
+
+from pylint.__pkginfo__ import version as pylint_version
+
+from nsr_cache import NullCache, make_key
+
+
+# lines, added to the top of every snippet
+SNIPPET_PREFIX = "# -*- coding:utf8 -*-\nfrom oktest import ok\n"
+PREFIX_LINES = SNIPPET_PREFIX.count('\n')
+
+RCFILE = os.path.join(os.path.abspath(os.path.dirname(__file__)), "pylintrc")
+
+# messages, which are never shown
+IGNORED_MESSAGES = ('C0111',)
+
+# module name for all snippets
+SNIPPET_MODULE = 'module'
+
+
+class Snippet(object):
+    "python block of the post, parsed once"
+    def __init__(self, code, line):
+        self.line = line
+        self.code = SNIPPET_PREFIX + code.encode("utf8")
+        self._code_obj = None
+
+        try:
+            self.tree = compile(self.code, "<opt_file>", 'exec', PyCF_ONLY_AST)
+        except SyntaxError as err:
+            err.lineno += line - PREFIX_LINES
+            err.args = (err.args[0],
+                        (err.args[1][0],
+                        err.args[1][1] + line - PREFIX_LINES, err.args[1][2]))
+            raise err
+
+    def code_object(self):
+        if self._code_obj is None:
+            self._code_obj = compile(self.tree, "<opt_file>", 'exec')
+        return self._code_obj
+
+    def astng(self, modname=SNIPPET_MODULE, path=None):
+        "astng tree for pylint"
+        from nsr_pylint import build_astng
+        return build_astng(self, modname, path)
+
+    def execute(self):
+        "run snippet in fresh module namespace, print traceback on error"
+        module = imp.new_module(SNIPPET_MODULE)
+        module.__file__ = "<opt_file>"
+        try:
+            exec self.code_object() in module.__dict__
+        except:
+            traceback.print_exc()
+
+    def lint_key(self):
+        return make_key('lint', self.code, rcfile_hash(), pylint_version)
+
+
+_rcfile_hash = None
+
+
+def rcfile_hash():
+    global _rcfile_hash
+    if _rcfile_hash is None:
+        with open(RCFILE, 'rb') as fd:
+            _rcfile_hash = hashlib.sha1(fd.read()).hexdigest()
+    return _rcfile_hash
+
+
+_linter = None
+
+
+def get_linter():
+    global _linter
+    if _linter is None:
+        from nsr_pylint import MemoryLinter
+        _linter = MemoryLinter()
+    return _linter
+
+
+def reset_linter():
+    "forget linter and pylintrc hash, used then pylintrc changes"
+    global _linter, _rcfile_hash
+    _linter = None
+    _rcfile_hash = None
+
+
+def load_messages(data):
+    "cached messages, json gives unicode, but pylint messages are utf8 str"
+    return [tuple(item.encode('utf8') if isinstance(item, unicode) else item
+                        for item in msg)
+                for msg in json.loads(data)]
+
+
+def lint_messages(snippet, cache=None):
+    """
+    lint snippet, messages are cached by snippet, pylintrc and
+    pylint version, as they don't depend on snippet position in the post
+    """
+    cache = cache or NullCache()
+    key = snippet.lint_key()
+
+    messages = cache.get(key)
+    if messages is not None:
+        return load_messages(messages)
+
+    messages = get_linter().lint_snippets({'s0': snippet})['s0']
+    cache.put(key, json.dumps(messages))
+    return messages
+
+
+def lint_batch(snippets, cache=None):
+    """
+    lint many snippets in single pylint session.
+    snippets is a list of (snippet_id, (line, code)), returns
+    {snippet_id : messages} for all snippets, which compiles.
+    """
+    cache = cache or NullCache()
+    res = {}
+    source_map = {}
+
+    for snippet_id, (line, code) in snippets:
+        try:
+            snippet = Snippet(code, line)
+        except SyntaxError:
+            # will be reported, then block is rendered
+            continue
+
+        messages = cache.get(snippet.lint_key())
+
+        if messages is not None:
+            res[snippet_id] = load_messages(messages)
+        else:
+            source_map["s{0:05d}".format(len(source_map))] = \
+                                                    (snippet_id, snippet)
+
+    if len(source_map) == 0:
+        return res
+
+    messages = get_linter().lint_snippets(
+                    dict((mod_id, snippet)
+                            for mod_id, (_, snippet) in source_map.items()))
+
+    for mod_id, (snippet_id, snippet) in source_map.items():
+        res[snippet_id] = messages[mod_id]
+        cache.put(snippet.lint_key(), json.dumps(messages[mod_id]))
+
+    return res
+
+
+def report_messages(messages, line):
+    for tp, lnum, msg in messages:
+        if tp not in IGNORED_MESSAGES:
+            if tp == 'W0611' and msg == "Unused import ok":
+                continue
+            print "Python block in line {0}: {1} {2}".format(
+                    line + lnum - PREFIX_LINES, # we add two lines to the top og the file
+                    tp, msg)
+
+
+def check_python_code(code, line, use_lint=True, imp_mod=False, cache=None):
+    snippet = Snippet(code, line)
+
+    if use_lint:
+        report_messages(lint_messages(snippet, cache), line)
+
+    if imp_mod:
+        snippet.execute()
@@ -0,0 +1,142 @@
+# -*- coding:utf8 -*-
+"""
+Conversion profiler.
+
+Code marks interesting parts with 'with span(name, category, **args)'.
+If profiling is enabled, every span records wall and cpu time and
+allocations, and the whole run can be saved as a Chrome trace
+(chrome://tracing, Perfetto) and summarized. Disabled spans cost
+one function call.
+
+Python 2 has no allocation tracer, so allocations are estimated from gc
+counters - net number of gc tracked objects (containers, instances,
+closures), created during the span. Strings and numbers are not counted.
+"""
+
+import gc
+import os
+import sys
+import json
+import time
+import threading
+
+
+def alloc_count():
+    "approximate net number of gc tracked objects, created so far"
+    count0, count1, count2 = gc.get_count()
+    threshold0, threshold1, _ = gc.get_threshold()
+    return count0 + threshold0 * (count1 + threshold1 * count2)
+
+
+class Span(object):
+    def __init__(self, profiler, name, cat, args):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.time()
+        self.cpu_start = time.clock()
+        self.allocs_start = alloc_count()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.wall = time.time() - self.start
+        self.cpu = time.clock() - self.cpu_start
+        self.allocs = max(0, alloc_count() - self.allocs_start)
+        self.tid = threading.current_thread().ident
+        self.profiler.spans.append(self)
+        return False
+
+
+class NullSpan(object):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler(object):
+    def __init__(self):
+        self.spans = []
+        self.start = time.time()
+
+    def span(self, name, cat, **args):
+        return Span(self, name, cat, args)
+
+    def trace(self):
+        "Chrome trace event format"
+        events = []
+        pid = os.getpid()
+        for span in self.spans:
+            args = dict(span.args)
+            args['cpu_ms'] = round(span.cpu * 1000, 3)
+            args['allocs'] = span.allocs
+            events.append({'name': span.name,
+                           'cat': span.cat,
+                           'ph': 'X',
+                           'ts': int((span.start - self.start) * 1000000),
+                           'dur': int(span.wall * 1000000),
+                           'pid': pid,
+                           'tid': span.tid,
+                           'args': args})
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save(self, fname):
+        with open(fname, 'w') as fd:
+            json.dump(self.trace(), fd)
+
+    def summary(self, top=10, out=None):
+        "time per category and top slowest blocks"
+        out = out or sys.stderr
+        totals = {}
+        for span in self.spans:
+            total = totals.setdefault(span.cat, [0, 0.0, 0.0, 0])
+            total[0] += 1
+            total[1] += span.wall
+            total[2] += span.cpu
+            total[3] += span.allocs
+
+        out.write("{0:<12} {1:>6} {2:>10} {3:>10} {4:>10}\n".format(
+                        "stage", "count", "wall ms", "cpu ms", "allocs"))
+        for cat, (count, wall, cpu, allocs) in sorted(totals.items()):
+            out.write("{0:<12} {1:>6} {2:>10.1f} {3:>10.1f} {4:>10}\n".format(
+                            cat, count, wall * 1000, cpu * 1000, allocs))
+
+        blocks = [span for span in self.spans if span.cat == 'block']
+        blocks.sort(key=lambda span: -span.wall)
+
+        out.write("\nTop {0} slowest blocks:\n".format(min(top, len(blocks))))
+        for span in blocks[:top]:
+            out.write("{0:>10.1f} ms {1:>10.1f} ms cpu {2:>8} allocs  "
+                      "line {3:<6} {4}\n".format(
+                            span.wall * 1000, span.cpu * 1000, span.allocs,
+                            span.args.get('line', 0) + 1, span.name))
+
+
+profiler = None
+
+
+def enable():
+    global profiler
+    profiler = Profiler()
+    return profiler
+
+
+def disable():
+    global profiler
+    profiler = None
+
+
+def enabled():
+    return profiler is not None
+
+
+def span(name, cat, **args):
+    if profiler is None:
+        return NULL_SPAN
+    return profiler.span(name, cat, **args)
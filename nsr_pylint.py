@@ -0,0 +1,131 @@
+# -*- coding:utf8 -*-
+"""
+pylint bound part of nsr_lint. Importing pylint and astng takes
+a noticeable time, so this module is imported only when a snippet
+is actually linted
+"""
+
+import sys
+from cStringIO import StringIO
+
+from pylint import lint
+from logilab.astng import scoped_nodes
+from logilab.astng.builder import ASTNGBuilder, MANAGER
+
+from nsr_lint import RCFILE, SNIPPET_MODULE
+
+
+class Reporter(object):
+    def __init__(self):
+        self.messages = []
+
+    def add_message(self, tp, params, message):
+        #print "I get message", tp, message
+        self.messages.append((tp, params, message))
+
+    def on_set_current_module(self, module, filepath):
+        pass
+
+    def on_close(self, stats, previous_stats):
+        pass
+
+    def display_results(self, *dt, **mp):
+        pass
+
+
+class Stdout_replacer(object):
+    def write(self, data):
+        pass
+
+
+class Module(scoped_nodes.Module):
+    """
+    astng module, which source lives in memory. Class name is used by
+    pylint to find visitors, so it has to be 'Module'
+    """
+    source = None
+
+    @property
+    def file_stream(self):
+        return StringIO(self.source)
+
+
+def build_astng(snippet, modname=SNIPPET_MODULE, path=None):
+    """
+    build astng from parsed tree, just like ASTNGBuilder.string_build.
+    pylint reports path of the module with every message
+    """
+    # compile before astng rebuilder walks the tree
+    snippet.code_object()
+
+    builder = ASTNGBuilder(MANAGER)
+    builder.rebuilder.init()
+    module = builder.rebuilder.visit_module(snippet.tree, modname, False)
+    module.file = module.path = path or '<{0}>'.format(modname)
+    module.__class__ = Module
+    module.source = snippet.code
+    module.file_encoding = 'utf8'
+
+    MANAGER.astng_cache[modname] = module
+
+    for from_node in builder.rebuilder._from_nodes:
+        builder.add_from_names_to_locals(from_node)
+    for delayed in builder.rebuilder._delayed_assattr:
+        builder.delayed_assattr(delayed)
+    for transformer in MANAGER.transformers:
+        transformer(module)
+
+    return module
+
+
+class MemoryLinter(lint.PyLinter):
+    """
+    linter, which checks Snippet objects instead of files.
+    Checkers are loaded once and reused for all checks
+    """
+    def __init__(self):
+        lint.PyLinter.__init__(self, pylintrc=RCFILE)
+
+        # the same setup, as lint.Run does
+        self.load_default_plugins()
+        self.disable('W0704')
+        self.read_config_file()
+        self.load_config_file()
+
+        # duplicated code between snippets is not an error
+        self.disable('R0801')
+
+        self.snippets = {}
+
+    def expand_files(self, snippet_ids):
+        return [{'name': SNIPPET_MODULE, 'path': snippet_id,
+                 'basename': SNIPPET_MODULE, 'basepath': snippet_id}
+                        for snippet_id in snippet_ids]
+
+    def get_astng(self, snippet_id, modname):
+        return build_astng(self.snippets[snippet_id], modname, snippet_id)
+
+    def lint_snippets(self, snippets):
+        """
+        snippets is {snippet_id : Snippet}, snippet_id should be str.
+        Returns {snippet_id : [(msg_id, line, message)]}
+        """
+        rep = Reporter()
+        self.set_reporter(rep)
+        self.snippets = snippets
+
+        try:
+            stderr = sys.stderr
+            sys.stderr = Stdout_replacer()
+            MANAGER.astng_cache.clear()
+            self.check(sorted(snippets))
+        finally:
+            sys.stderr = stderr
+            self.snippets = {}
+            MANAGER.astng_cache.pop(SNIPPET_MODULE, None)
+
+        res = dict((snippet_id, []) for snippet_id in snippets)
+        for tp, data, msg in rep.messages:
+            if data[0] in res:
+                res[data[0]].append((tp, data[3], msg))
+        return res
@@ -0,0 +1,263 @@
+# -*- coding:utf8 -*-
+"""
+Search index for the site.
+
+Posts are tokenized from the parsed block stream - headings,
+paragraphs, lists and, optionally, code blocks. Index is written to
+a directory:
+
+    index.json      - {"shards": N, "docs": [[url, title], ...]}
+    shard_<i>.json  - {term : postings} for terms with term_hash % N == i
+
+term_hash is 'h = (h * 31 + char code) & 0xFFFFFFFF' over term chars,
+so client downloads index.json and one shard per query word.
+
+Postings of term are pairs (doc number, weight), sorted by doc number.
+Doc numbers are delta encoded and all numbers are written as base64 VLQ
+string, like in source maps - 5 bits per digit, 6th bit is continuation.
+
+Terms of every post are cached with post build key, so only rebuilt
+posts are tokenized again, and only changed shards are rewritten.
+"""
+
+import os
+import re
+import sys
+import json
+import optparse
+
+from notsorest2html import typed_blocks, deindent_snippet, write_if_changed, \
+                           BlogspotHTMLProvider
+
+INDEX_NAME = 'index.json'
+SHARD_NAME = 'shard_{0}.json'
+
+# term weight for block type, other text has weight 1
+HEADER_WEIGHT = 5
+HEADER_TYPES = ('text_h1', 'text_h2', 'text_h3', 'text_h4')
+
+re_token = re.compile(r"(?u)\w\w+")
+re_url = re.compile(r"https?://\S+")
+
+VLQ_DIGITS = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+VLQ_VALUES = dict((digit, num) for num, digit in enumerate(VLQ_DIGITS))
+
+
+def vlq_encode(numbers):
+    "non-negative numbers to base64 VLQ string"
+    res = []
+    for num in numbers:
+        while num >= 32:
+            res.append(VLQ_DIGITS[(num & 31) | 32])
+            num >>= 5
+        res.append(VLQ_DIGITS[num])
+    return "".join(res)
+
+
+def vlq_decode(text):
+    res = []
+    num = shift = 0
+    for digit in text:
+        value = VLQ_VALUES[digit]
+        num |= (value & 31) << shift
+        if value & 32:
+            shift += 5
+        else:
+            res.append(num)
+            num = shift = 0
+    return res
+
+
+def encode_postings(postings):
+    "[(doc, weight)] sorted by doc -> VLQ string of doc deltas and weights"
+    numbers = []
+    prev = 0
+    for doc, weight in postings:
+        numbers.append(doc - prev)
+        numbers.append(weight)
+        prev = doc
+    return vlq_encode(numbers)
+
+
+def decode_postings(text):
+    numbers = vlq_decode(text)
+    res = []
+    doc = 0
+    for pos in range(0, len(numbers), 2):
+        doc += numbers[pos]
+        res.append((doc, numbers[pos + 1]))
+    return res
+
+
+def term_hash(term):
+    res = 0
+    for char in term:
+        res = (res * 31 + ord(char)) & 0xFFFFFFFF
+    return res
+
+
+def tokenize(text):
+    return [token.lower() for token in re_token.findall(re_url.sub(" ", text))]
+
+
+def post_terms(text, styles, with_code=False):
+    "(title, {term : weight}) for post text"
+    terms = {}
+    title = None
+
+    def add(text, weight=1):
+        for token in tokenize(text):
+            terms[token] = terms.get(token, 0) + weight
+
+    for tp, block in typed_blocks(text, styles):
+        if tp in HEADER_TYPES:
+            if tp == 'text_h1' and title is None:
+                title = block.data.strip()
+            add(block.data, HEADER_WEIGHT)
+        elif tp == 'text':
+            if block.data:
+                add(block.data)
+        elif tp == 'list':
+            for item in block.data:
+                add(item)
+        elif with_code and tp in BlogspotHTMLProvider.highlighters_map:
+            add(deindent_snippet(block.data))
+
+    return title, terms
+
+
+class TermsCache(object):
+    "{source path : [build key, title, {term : weight}]} in json file"
+    def __init__(self, fname, with_code):
+        self.fname = fname
+        self.with_code = with_code
+        self.entries = {}
+
+        if os.path.exists(fname):
+            with open(fname) as fd:
+                data = json.load(fd)
+            if data.get('with_code') == with_code:
+                self.entries = data['posts']
+
+    def get(self, src, key):
+        entry = self.entries.get(os.path.abspath(src))
+        if entry is None or entry[0] != key:
+            return None
+        return entry[1], entry[2]
+
+    def put(self, src, key, title, terms):
+        self.entries[os.path.abspath(src)] = [key, title, terms]
+
+    def save(self, sources):
+        "save entries of sources only, so removed posts are dropped"
+        entries = dict((os.path.abspath(src), self.entries[os.path.abspath(src)])
+                            for src in sources
+                                if os.path.abspath(src) in self.entries)
+        tmp_fname = self.fname + '.tmp'
+        with open(tmp_fname, 'w') as fd:
+            json.dump({'with_code': self.with_code, 'posts': entries}, fd)
+        os.rename(tmp_fname, self.fname)
+
+
+def build_index(docs, shards):
+    """
+    docs is [(url, title, {term : weight})].
+    Returns (index, [shard]) - data of index.json and shard files
+    """
+    shard_data = [{} for _ in range(shards)]
+    postings = {}
+
+    for num, (_, _, terms) in enumerate(docs):
+        for term, weight in terms.items():
+            postings.setdefault(term, []).append((num, weight))
+
+    for term, term_postings in postings.items():
+        shard_data[term_hash(term) % shards][term] = \
+                                        encode_postings(term_postings)
+
+    index = {'shards': shards,
+             'docs': [[url, title] for url, title, _ in docs]}
+    return index, shard_data
+
+
+def write_index(index_dir, index, shard_data):
+    "write index files, which content changes. Returns number of written"
+    if not os.path.isdir(index_dir):
+        os.makedirs(index_dir)
+
+    written = 0
+    files = [(INDEX_NAME, index)] + [(SHARD_NAME.format(num), data)
+                                        for num, data in enumerate(shard_data)]
+    for fname, data in files:
+        text = json.dumps(data, sort_keys=True, separators=(',', ':'),
+                          ensure_ascii=False)
+        if write_if_changed(os.path.join(index_dir, fname),
+                            text.encode('utf8')):
+            written += 1
+    return written
+
+
+def update_index(sources, opts, styles, url_func, cache_fname):
+    """
+    tokenize changed sources and rewrite index in opts.search_index.
+    sources are (fname, build key). Returns (tokenized, written files)
+    """
+    cache = TermsCache(cache_fname, opts.search_code)
+    docs = []
+    tokenized = 0
+
+    for fname, key in sources:
+        cached = cache.get(fname, key)
+        if cached is None:
+            with open(fname) as fd:
+                text = fd.read().decode('utf8')
+            cached = post_terms(text, styles, opts.search_code)
+            cache.put(fname, key, *cached)
+            tokenized += 1
+
+        title, terms = cached
+        docs.append((url_func(fname), title or url_func(fname), terms))
+
+    cache.save([fname for fname, _ in sources])
+    index, shard_data = build_index(docs, opts.search_shards)
+    return tokenized, write_index(opts.search_index, index, shard_data)
+
+
+def search(index_dir, query):
+    "[(url, title, score)] of posts with all query words, best first"
+    with open(os.path.join(index_dir, INDEX_NAME)) as fd:
+        index = json.load(fd)
+
+    scores = None
+    for term in set(tokenize(query)):
+        shard = SHARD_NAME.format(term_hash(term) % index['shards'])
+        with open(os.path.join(index_dir, shard)) as fd:
+            postings = decode_postings(json.load(fd).get(term, ""))
+
+        term_scores = dict(postings)
+        if scores is None:
+            scores = term_scores
+        else:
+            scores = dict((doc, score + term_scores[doc])
+                            for doc, score in scores.items()
+                                if doc in term_scores)
+
+    res = [index['docs'][doc] + [score]
+                for doc, score in (scores or {}).items()]
+    res.sort(key=lambda item: -item[2])
+    return res
+
+
+def main(argv):
+    parser = optparse.OptionParser("%prog INDEX_DIR WORD...")
+    _, args = parser.parse_args(argv[1:])
+
+    if len(args) < 2:
+        parser.error("index dir and query are required")
+
+    for url, title, score in search(args[0], " ".join(args[1:]).decode('utf8')):
+        print u"{0:>6} {1:<40} {2}".format(score, url, title).encode('utf8')
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,233 @@
+# -*- coding:utf8 -*-
+"""
+Watch mode for site build.
+
+Post directories, their 'code' subdirectories, style files and pylintrc
+are watched with inotify, if pyinotify is installed, or polled otherwise.
+Changes are collected until no new events come for a debounce period,
+then stale posts are rebuilt in this process, so imported lexers and
+linter stay warm between rebuilds.
+"""
+
+import os
+import sys
+import time
+import stat
+
+try:
+    import pyinotify
+except ImportError:
+    pyinotify = None
+
+import nsr_lint
+import nsr_build
+import notsorest2html
+
+# seconds between directory scans for PollingWatcher
+POLL_INTERVAL = 0.2
+
+# subdirectory of posts dir with code, used by posts
+CODE_DIR = 'code'
+
+
+class PollingWatcher(object):
+    "finds changed files by comparing mtime and size"
+    def __init__(self, paths):
+        self.paths = [os.path.abspath(path) for path in paths]
+        self.state = self.snapshot()
+
+    def snapshot(self):
+        res = {}
+        for path in self.paths:
+            if os.path.isdir(path):
+                fnames = [os.path.join(path, fname)
+                                for fname in os.listdir(path)]
+            else:
+                fnames = [path]
+
+            for fname in fnames:
+                try:
+                    fstat = os.stat(fname)
+                except OSError:
+                    continue
+
+                if not stat.S_ISDIR(fstat.st_mode):
+                    res[fname] = (fstat.st_mtime, fstat.st_size)
+        return res
+
+    def wait(self, timeout=None):
+        "returns set of changed files, empty set if nothing changes in timeout"
+        end_time = None if timeout is None else time.time() + timeout
+
+        while True:
+            state = self.snapshot()
+            changed = set(fname for fname in set(state) | set(self.state)
+                            if state.get(fname) != self.state.get(fname))
+            self.state = state
+
+            if changed:
+                return changed
+
+            if end_time is None:
+                time.sleep(POLL_INTERVAL)
+            else:
+                left = end_time - time.time()
+                if left <= 0:
+                    return changed
+                time.sleep(min(POLL_INTERVAL, left))
+
+
+class InotifyWatcher(object):
+    """
+    the same interface, as PollingWatcher, with pyinotify.
+    Directories of files are watched, as editors often replace files
+    """
+    def __init__(self, paths):
+        self.paths = set(os.path.abspath(path) for path in paths)
+        self.changed = set()
+
+        mask = pyinotify.IN_CLOSE_WRITE | pyinotify.IN_MOVED_TO | \
+               pyinotify.IN_MOVED_FROM | pyinotify.IN_DELETE
+        self.wm = pyinotify.WatchManager()
+        self.notifier = pyinotify.Notifier(self.wm, self.on_event)
+
+        for dname in set(path if os.path.isdir(path) else os.path.dirname(path)
+                            for path in self.paths):
+            self.wm.add_watch(dname, mask)
+
+    def on_event(self, event):
+        path = os.path.abspath(event.pathname)
+        if not event.dir and (path in self.paths or
+                              os.path.dirname(path) in self.paths):
+            self.changed.add(path)
+
+    def wait(self, timeout=None):
+        end_time = None if timeout is None else time.time() + timeout
+
+        while not self.changed:
+            if end_time is None:
+                left = None
+            else:
+                left = int((end_time - time.time()) * 1000)
+                if left <= 0:
+                    break
+
+            if self.notifier.check_events(left):
+                self.notifier.read_events()
+                self.notifier.process_events()
+
+        changed, self.changed = self.changed, set()
+        return changed
+
+
+def get_watcher(paths):
+    if pyinotify is not None:
+        return InotifyWatcher(paths)
+    return PollingWatcher(paths)
+
+
+def watched_paths(patterns, opts):
+    "post directories with code subdirectories, style files and pylintrc"
+    dirs = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            dname = pattern
+        else:
+            dname = os.path.dirname(pattern) or '.'
+
+        dirs.add(os.path.abspath(dname))
+
+        code_dir = os.path.join(dname, CODE_DIR)
+        if os.path.isdir(code_dir):
+            dirs.add(os.path.abspath(code_dir))
+
+    files = notsorest2html.style_file_names(opts) + [nsr_lint.RCFILE]
+    return sorted(dirs) + [os.path.abspath(fname) for fname in files]
+
+
+def code_users(fname, files):
+    "posts, which use code file - post with the same name or mentioning it"
+    name = os.path.basename(fname)
+    stem = os.path.splitext(name)[0]
+
+    res = []
+    for post in files:
+        if os.path.splitext(os.path.basename(post))[0] == stem:
+            res.append(post)
+        else:
+            with open(post) as fd:
+                if name in fd.read():
+                    res.append(post)
+    return res
+
+
+def wait_changes(watcher, debounce):
+    "wait for changes, then collect them until debounce seconds are quiet"
+    changed = watcher.wait()
+
+    while True:
+        more = watcher.wait(debounce)
+        if not more:
+            return changed
+        changed |= more
+
+
+def rebuild(changed, patterns, opts, style_files):
+    "rebuild posts after changes, returns False if changes are irrelevant"
+    files = nsr_build.collect_sources(patterns)
+
+    forced = set()
+    relevant = False
+
+    for fname in changed:
+        if fname == nsr_lint.RCFILE:
+            nsr_lint.reset_linter()
+            relevant = True
+        elif fname in style_files:
+            relevant = True
+        elif os.path.basename(os.path.dirname(fname)) == CODE_DIR:
+            forced.update(code_users(fname, files))
+            relevant = True
+
+    # changes of posts and styles are found by manifest
+    relevant = relevant or any(os.path.abspath(fname) in changed
+                                    for fname in files)
+
+    if relevant:
+        nsr_build.build(files, opts, forced, list_skipped=False)
+    return relevant
+
+
+def watch(patterns, opts, watcher=None):
+    files = nsr_build.collect_sources(patterns)
+    nsr_build.build(files, opts)
+
+    watcher = watcher or get_watcher(watched_paths(patterns, opts))
+    style_files = set(os.path.abspath(fname)
+                        for fname in notsorest2html.style_file_names(opts))
+
+    print "Watching for changes ({0}), Ctrl-C to stop".format(
+                    watcher.__class__.__name__)
+
+    while True:
+        try:
+            changed = wait_changes(watcher, opts.debounce)
+        except KeyboardInterrupt:
+            return 0
+
+        stime = time.time()
+        try:
+            if not rebuild(changed, patterns, opts, style_files):
+                continue
+        except (OSError, IOError) as exc:
+            # post is removed or renamed while rebuild, next change
+            # event will come for it
+            print "ERROR: rebuild failed: {0}".format(exc)
+            sys.stdout.flush()
+            continue
+
+        print "Rebuilt in {0:.2f}s after change of {1}".format(
+                    time.time() - stime,
+                    ", ".join(sorted(os.path.basename(fname)
+                                        for fname in changed)))
+        sys.stdout.flush()
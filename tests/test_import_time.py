@@ -0,0 +1,85 @@
+import os
+import sys
+import json
+import subprocess
+
+from oktest import ok
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# modules, which should be imported only when used
+LAZY_MODULES = ('pylint.lint', 'logilab.astng', 'pygments.lexers.python',
+                'pygments.lexers.c_cpp', 'pygments.lexers.shell',
+                'multiprocessing')
+
+# records cumulative import time of every module, like -X importtime
+SCRIPT = r"""
+import sys
+import json
+import time
+import __builtin__
+
+times = {}
+orig_import = __builtin__.__import__
+
+def timed_import(name, *args, **kwargs):
+    if name in sys.modules:
+        return orig_import(name, *args, **kwargs)
+    stime = time.time()
+    try:
+        return orig_import(name, *args, **kwargs)
+    finally:
+        times.setdefault(name, time.time() - stime)
+
+__builtin__.__import__ = timed_import
+stime = time.time()
+%s
+total = time.time() - stime
+__builtin__.__import__ = orig_import
+
+print json.dumps({'total': total, 'times': times,
+                  'modules': sorted(sys.modules)})
+"""
+
+
+def import_report(code):
+    "run code in fresh interpreter, returns (total time, times, modules)"
+    output = subprocess.check_output([sys.executable, '-c', SCRIPT % code],
+                                     cwd=ROOT)
+    # code may print something before the report
+    res = json.loads(output.strip().split('\n')[-1])
+    return res['total'], res['times'], res['modules']
+
+
+def format_report(times, count=15):
+    return "\n".join("{0:8.1f} ms  {1}".format(elapsed * 1000, name)
+                        for name, elapsed in sorted(times.items(),
+                                                    key=lambda x: -x[1])[:count])
+
+
+def loaded(modules, lazy_modules=LAZY_MODULES):
+    return [name for name in modules
+                if any(name == lazy or name.startswith(lazy + '.')
+                            for lazy in lazy_modules)]
+
+
+def test_import_time():
+    total, times, modules = import_report("import notsorest2html")
+
+    print "import notsorest2html - {0:.1f} ms\n{1}".format(
+                total * 1000, format_report(times))
+
+    # wall time depends on machine load, it's only reported. Import is
+    # fast as long as heavy modules are not loaded
+    ok(loaded(modules)) == []
+
+
+def test_nolint_render_imports():
+    _, _, modules = import_report(
+                "import notsorest2html\n" +
+                "opts, _ = notsorest2html.get_option_parser()" +
+                ".parse_args(['-n', '-c', ''])\n" +
+                "notsorest2html.render_text(u'python:\\n    x = 1\\n', " +
+                "opts, notsorest2html.load_styles(opts))\n")
+
+    ok(loaded(modules)) == ['pygments.lexers.python']
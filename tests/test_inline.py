@@ -0,0 +1,113 @@
+# -*- coding:utf8 -*-
+import os
+import glob
+import optparse
+
+from oktest import ok
+
+from nsr_lexer import parse
+from notsorest2html import BlogspotHTMLProvider, escape_html
+
+POSTS_DIR = os.path.join(os.path.dirname(os.path.dirname(
+                                os.path.abspath(__file__))), 'posts')
+
+CASES = [
+    u"plain text",
+    u"*bold* ~it~ --striked-- ''code'' and <tag> & \"quotes\"",
+    u"*not\nbold* *a*b* ** *** ---- ----- ''''",
+    u"*~mixed* nesting~ --x ''y-- z''",
+    u"see [func] and [ name with spaces | text ] and [*no*]",
+    u"http://a.b/c, [link](bad) [ named ]http://x.org/y/. http://z/",
+    u"[x*y]http://a.b/*c* tail*",
+    u"http://a.b/[ref] and [ref]",
+    u"[a] [b|c] http://q.org/~user~/",
+]
+
+
+def make_provider(old_inline_support=False):
+    return BlogspotHTMLProvider(optparse.Values({
+                                'standalone': False,
+                                'old_inline_support': old_inline_support}))
+
+
+def post_texts():
+    for fname in sorted(glob.glob(os.path.join(POSTS_DIR, '*.txt'))):
+        try:
+            blocks = list(parse(open(fname).read().decode('utf8')))
+        except Exception:
+            continue
+
+        for block in blocks:
+            tp = block.tp.split('.')[-1]
+            if tp.startswith('text'):
+                yield block.data
+            elif tp == 'list':
+                for item in block.data:
+                    yield item
+
+
+def render(func, text):
+    # link with empty url breaks the regex chain, it should break
+    # the same way
+    try:
+        return func(text)
+    except IndexError as exc:
+        return exc.__class__
+
+
+def check_same(text):
+    new = make_provider()
+    old = make_provider()
+
+    ok(render(new.text_to_html, text)) == \
+            render(old.regex_inline, escape_html(text))
+    ok(new.backref_list) == old.backref_list
+    ok(new.refs) == old.refs
+
+
+def test_same_as_regex_chain():
+    for text in CASES:
+        check_same(text)
+
+
+def test_same_as_regex_chain_on_posts():
+    count = 0
+    for text in post_texts():
+        check_same(text)
+        count += 1
+    ok(count) > 0
+
+
+def test_pair_markers():
+    from notsorest2html import pair_markers
+    ok(list(pair_markers(u"*a* *b\nc* *d*", u"*"))) == [(0, 2), (8, 10)]
+    ok(list(pair_markers(u"-----", u"--"))) == [(0, 3)]
+
+
+def test_same_as_regex_chain_random():
+    import random
+    rand = random.Random(42)
+    parts = [u"*", u"~", u"--", u"''", u"[", u"]", u"|", u" ", u"\n",
+             u"a", u"b c", u"http://", u"https://x.y/", u".", u",", u"/"]
+
+    for _ in range(2000):
+        check_same(u"".join(rand.choice(parts)
+                                for _ in range(rand.randint(1, 14))))
+
+
+def render_post(text):
+    from notsorest2html import get_option_parser, load_styles, render_text
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    return render_text(text, opts, load_styles(opts))
+
+
+def test_backrefs_resolved():
+    res = render_post(u"See [foo], [foobar|this] and [missing]\n\n"
+                      u"linklist:\n"
+                      u"    foo http://foo.org/\n"
+                      u"    foobar http://bar.org/\n")
+
+    ok(res).contains(u'<a href="http://foo.org/">foo</a>')
+    ok(res).contains(u'<a href="http://bar.org/">this</a>')
+    ok(res).contains(u'<a href="_a_href_missing">missing</a>')
+    ok(res).not_contain(u'\x00')
@@ -0,0 +1,90 @@
+# -*- coding:utf8 -*-
+import os
+import shutil
+import struct
+import tempfile
+
+from oktest import ok
+
+import nsr_assets
+from nsr_assets import image_size, minify_svg, find_image, build_index
+from notsorest2html import get_option_parser, load_styles, render_text
+
+MEDIA = os.path.join(os.path.dirname(os.path.dirname(
+                        os.path.abspath(__file__))), 'posts', 'media')
+
+POST = u"""Diagram
+
+img:
+    https://example.com/raw/attribute.jpg
+
+center.img[with=400]:
+    https://example.com/remote.png
+"""
+
+
+def test_image_size():
+    ok(image_size(open(os.path.join(MEDIA, 'attribute.jpg'), 'rb').read())) \
+            == (1040, 1896)
+    ok(image_size(open(os.path.join(MEDIA, 'attribute.svg'), 'rb').read())) \
+            == (1040, 1896)
+
+    png = nsr_assets.PNG_SIGNATURE + '\0\0\0\rIHDR' + struct.pack('>II', 3, 5)
+    ok(image_size(png)) == (3, 5)
+    ok(image_size('GIF89a' + struct.pack('<HH', 7, 2))) == (7, 2)
+    ok(image_size('<svg viewBox="0 0 10 20"></svg>')) == (10, 20)
+    ok(image_size('plain text')) == None
+
+
+def test_minify_svg():
+    data = open(os.path.join(MEDIA, 'attribute.svg'), 'rb').read()
+    res = minify_svg(data)
+    ok(len(res)) < len(data)
+    ok(res.startswith('<svg')) == True
+    ok('<!--' in res) == False
+    ok(image_size(res)) == image_size(data)
+
+
+def test_find_image():
+    post_dir = os.path.dirname(MEDIA)
+    ok(find_image('http://example.com/x/attribute.jpg', post_dir)) == \
+            os.path.join(MEDIA, 'attribute.jpg')
+    ok(find_image('media/attribute.svg', post_dir)) == \
+            os.path.join(MEDIA, 'attribute.svg')
+    ok(find_image('http://example.com/missing.png', post_dir)) == None
+
+
+def test_assets_render():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        os.mkdir(os.path.join(tmp_dir, 'media'))
+        shutil.copy(os.path.join(MEDIA, 'attribute.jpg'),
+                    os.path.join(tmp_dir, 'media'))
+        post = os.path.join(tmp_dir, 'post.txt')
+        with open(post, 'w') as fd:
+            fd.write(POST.encode('utf8'))
+
+        opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+        opts.assets_dir = os.path.join(tmp_dir, 'out')
+        opts.assets_url = 'assets/'
+        styles = load_styles(opts)
+        cache_fname = os.path.join(tmp_dir, 'assets.json')
+
+        index = build_index([post], opts, styles, cache_fname)
+        ok((index.processed, index.cached)) == (1, 0)
+        assets = index.post_assets(post)
+        name = assets['https://example.com/raw/attribute.jpg']['url'][7:]
+        ok(os.listdir(opts.assets_dir)) == [name]
+
+        html = render_text(POST, opts, styles, assets=assets)
+        ok(html).contains('<img src="assets/{0}" width="700" height="1276" />'
+                            .format(name))
+        ok(html).contains('<img src="https://example.com/remote.png" '
+                          'width="400" />')
+
+        index = build_index([post], opts, styles, cache_fname)
+        ok((index.processed, index.cached)) == (0, 1)
+        ok(index.key(post)) == build_index([post], opts, styles,
+                                           cache_fname).key(post)
+    finally:
+        shutil.rmtree(tmp_dir)
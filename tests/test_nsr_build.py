@@ -0,0 +1,52 @@
+# -*- coding:utf8 -*-
+import os
+import sys
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from oktest import ok
+
+from nsr_build import Manifest, report, warm_lexers
+from notsorest2html import get_option_parser
+
+
+def test_skipped_output_replayed():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp_dir, 'post.txt')
+        res = os.path.join(tmp_dir, 'post.html')
+        for fname in (src, res):
+            with open(fname, 'w') as fd:
+                fd.write('data')
+
+        warning = u"Python block in line 3: W0511 FIXME: сделать\n"
+        manifest = Manifest(os.path.join(tmp_dir, 'manifest.json'))
+        manifest.update(src, 'key', res, warning.encode('utf8'))
+        manifest.save()
+
+        manifest = Manifest(os.path.join(tmp_dir, 'manifest.json'))
+        ok(manifest.is_fresh(src, 'key', res)) == True
+        ok(manifest.output(src)) == warning.encode('utf8')
+
+        out = StringIO()
+        report([], 0.0, [src], out=out,
+               skipped_output={src: manifest.output(src)})
+        ok(out.getvalue()).contains("     | " + warning.encode('utf8'))
+        ok(out.getvalue()).contains("1 skipped (1 with warnings)")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_warm_lexers():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        post = os.path.join(tmp_dir, 'post.txt')
+        with open(post, 'w') as fd:
+            fd.write("Text\n\nc:\n    int a;\n\nhaskell:\n    a = 1\n")
+
+        opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+        ok(warm_lexers([post], opts)) == set(['c', 'haskell'])
+        ok('pygments.lexers.haskell' in sys.modules) == True
+    finally:
+        shutil.rmtree(tmp_dir)
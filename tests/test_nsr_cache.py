@@ -0,0 +1,45 @@
+import os
+import time
+import shutil
+import tempfile
+
+from oktest import ok
+from nsr_cache import DiskCache, make_key
+
+
+def test_get_put():
+    root = tempfile.mkdtemp()
+    try:
+        cache = DiskCache(root)
+        key = make_key('python', u'x = 1')
+
+        ok(cache.get(key)) == None
+        cache.put(key, 'data')
+        ok(cache.get(key)) == 'data'
+        ok(cache.stats()) == {'hits': 1, 'misses': 1, 'evicted': 0}
+
+        ok(make_key('a', 'bc')) != make_key('ab', 'c')
+    finally:
+        shutil.rmtree(root)
+
+
+def test_lru_eviction():
+    root = tempfile.mkdtemp()
+    try:
+        cache = DiskCache(root, max_size=300)
+        keys = [make_key(i) for i in range(3)]
+
+        for pos, key in enumerate(keys):
+            cache.put(key, 'x' * 100)
+            os.utime(cache.path(key), (time.time() - 100 + pos,) * 2)
+
+        # first key becomes most recently used
+        ok(cache.get(keys[0])) == 'x' * 100
+
+        cache.put(make_key(3), 'x' * 100)
+
+        ok(cache.get(keys[0])) == 'x' * 100
+        ok(cache.get(keys[1])) == None
+        ok(cache.stats()['evicted']) == 2
+    finally:
+        shutil.rmtree(root)
@@ -0,0 +1,43 @@
+import os
+import sys
+import signal
+import shutil
+import tempfile
+import subprocess
+
+from oktest import ok
+from nsr_client import send_request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_no_daemon():
+    ok(send_request('/nonexistent/nsr.sock', ['nsr', 'post.txt'])) == None
+
+
+def test_render_in_daemon():
+    root = tempfile.mkdtemp()
+    sock = os.path.join(root, 'nsr.sock')
+    daemon = subprocess.Popen([sys.executable,
+                               os.path.join(ROOT, 'nsr_daemon.py'),
+                               '-s', sock], stdout=subprocess.PIPE)
+    try:
+        daemon.stdout.readline()
+
+        with open(os.path.join(root, 'post.txt'), 'w') as fd:
+            fd.write("<---->\n\nSome *text*\n")
+
+        code, output = send_request(sock, ['nsr', '-n', '-c', '',
+                                           os.path.join(root, 'post.txt')])
+        ok(code) == 0
+        ok(output) == u""
+        ok(open(os.path.join(root, 'post.html')).read()).contains(
+                                                        '<b>text</b>')
+
+        code, output = send_request(sock, ['nsr'])
+        ok(code) == 1
+        ok(output).contains("no template files")
+    finally:
+        daemon.send_signal(signal.SIGINT)
+        daemon.wait()
+        shutil.rmtree(root)
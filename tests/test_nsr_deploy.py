@@ -0,0 +1,81 @@
+# -*- coding:utf8 -*-
+import os
+import gzip
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from oktest import ok
+
+from nsr_deploy import minify_html, minify_js, minify_css, deploy, \
+                       MANIFEST_NAME
+
+PAGE = """<html>
+    <!-- comment -->
+    <p style="text-indent: 20px;">    Some
+        text</p>
+<pre><span style="color: #008000; font-weight: bold">def</span>  f():
+    return   1</pre>
+    <script  type="text/javascript">
+        // toggle
+        function f()
+        {
+            return 1;
+        }
+    </script>
+</html>
+"""
+
+
+def test_minify():
+    res = minify_html(PAGE)
+    ok(res) == ('<html>\n<p style="text-indent:20px"> Some\ntext</p>\n'
+                '<pre><span style="color:#008000;font-weight:bold">def</span>'
+                '  f():\n    return   1</pre>\n'
+                '<script type="text/javascript">function f()\n{\n'
+                'return 1;\n}</script>\n</html>\n')
+
+    ok(minify_html('<p>a</p>\n<!--more-->\n<!--[if IE]>x<![endif]-->\n'
+                   '<!-- c -->\n<p>b</p>')) == \
+            '<p>a</p>\n<!--more-->\n<!--[if IE]>x<![endif]-->\n<p>b</p>\n'
+
+    ok(minify_js("  a = 1;\n\n  // c\n  b = 2;\n")) == "a = 1;\nb = 2;"
+    ok(minify_css("/* c */\n.a .b {\n  color: red;\n}\n")) == \
+            ".a .b{color: red;}"
+
+
+def test_deploy():
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        site = os.path.join(tmp_dir, 'site')
+        dist = os.path.join(site, 'dist')
+        os.makedirs(os.path.join(site, 'media'))
+
+        with open(os.path.join(site, 'post.html'), 'w') as fd:
+            fd.write(PAGE)
+        with open(os.path.join(site, 'media', 'img.0123456789.jpg'), 'w') as fd:
+            fd.write('\xff\xd8')
+        with open(os.path.join(site, '.nsr_manifest.json'), 'w') as fd:
+            fd.write('{}')
+
+        manifest = deploy(site, dist, out=StringIO())
+        ok(sorted(manifest)) == ['media/img.0123456789.jpg', 'post.html']
+        ok(manifest['media/img.0123456789.jpg']['immutable']) == True
+        ok(manifest['media/img.0123456789.jpg']['gzip']) == None
+        ok(manifest['post.html']['immutable']) == False
+
+        html = open(os.path.join(dist, 'post.html')).read()
+        ok(html) == minify_html(PAGE)
+        ok(gzip.open(os.path.join(dist, 'post.html.gz')).read()) == html
+        ok(os.path.exists(os.path.join(dist, MANIFEST_NAME))) == True
+
+        out = StringIO()
+        deploy(site, dist, out=out)
+        ok(out.getvalue()).contains("0 written, 2 skipped")
+
+        os.unlink(os.path.join(site, 'post.html'))
+        ok(sorted(deploy(site, dist, out=StringIO()))) == \
+                ['media/img.0123456789.jpg']
+        ok(os.path.exists(os.path.join(dist, 'post.html.gz'))) == False
+    finally:
+        shutil.rmtree(tmp_dir)
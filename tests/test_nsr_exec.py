@@ -0,0 +1,27 @@
+import sys
+
+from oktest import ok
+from nsr_exec import SnippetExecutor
+
+
+def test_run_snippets():
+    executor = SnippetExecutor(timeout=2)
+    res = executor.run([(1, u"print 'hello'\nok(1) == 1\n"),
+                        (2, u"x = 1\n\nraise ValueError(x)\n"),
+                        (3, u"while True:\n    pass\n")])
+
+    ok(res[1].ok) == True
+    ok(res[1].output) == u"hello\n"
+
+    ok(res[2].ok) == False
+    ok(res[2].report("post.txt", 10)).contains('File "post.txt", line 13')
+
+    ok(res[3].ok) == False
+    ok(res[3].timed_out) == True
+
+
+def test_snippet_isolated():
+    executor = SnippetExecutor()
+    res = executor.run([(1, u"import sys\nsys.modules['module'] = 1\n")])
+    ok(res[1].ok) == True
+    ok(sys.modules).not_contain('module')
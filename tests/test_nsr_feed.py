@@ -0,0 +1,98 @@
+# -*- coding:utf8 -*-
+import os
+import shutil
+import tempfile
+import subprocess
+import xml.dom.minidom
+
+from oktest import ok, NOT
+
+from nsr_feed import Entry, atom_feed, index_page, git_dates
+from notsorest2html import get_option_parser, load_styles, render_excerpt, \
+                           render_text
+
+POST = u"""=====
+Title
+=====
+
+Intro with [ref]
+
+python:
+    x = 1
+
+<---->
+
+Below the cut, list item without empty line can't be parsed
+* item
+
+linklist:
+    ref http://example.com/ref
+"""
+
+
+def get_opts():
+    opts, _ = get_option_parser().parse_args(['-c', ''])
+    opts.feed = 'atom.xml'
+    opts.site_url = u'http://example.com/'
+    opts.site_title = u"Блог"
+    opts.site_author = u"koder"
+    return opts
+
+
+def test_render_excerpt():
+    opts = get_opts()
+    title, html = render_excerpt(POST, opts, load_styles(opts), 'post.txt')
+
+    ok(title) == u"Title"
+    ok(html).contains(u'<a href="http://example.com/ref">ref</a>')
+    ok(html).contains(u'x')
+    NOT(html).contains(u'Below the cut')
+    NOT(html).contains(u'<!--more-->')
+    NOT(html).contains(u'<script')
+
+    opts.nolint = True
+    ok(lambda: render_text(POST, opts, load_styles(opts))).raises(Exception)
+
+
+def test_feed_and_index():
+    opts = get_opts()
+    _, html = render_excerpt(POST, opts, load_styles(opts), 'post.txt')
+    entries = [Entry('post.txt', 'post.html', u"Title <1>", html, 0)]
+
+    feed = atom_feed(entries, opts)
+    dom = xml.dom.minidom.parseString(feed.encode('utf8'))
+    ok(len(dom.getElementsByTagName('entry'))) == 1
+    summary = dom.getElementsByTagName('summary')[0].firstChild.data
+    ok(summary) == html
+
+    page = index_page(entries, opts)
+    ok(page.count('<script')) == 2
+    ok(page).contains(u'<a href="post.html">Title &lt;1&gt;</a>')
+
+
+def test_git_dates():
+    root = tempfile.mkdtemp()
+    try:
+        def git(*args, **env):
+            environ = dict(os.environ, **env)
+            subprocess.check_call(['git', '-c', 'user.name=test',
+                                   '-c', 'user.email=test@example.com'] +
+                                  list(args), cwd=root, env=environ,
+                                  stdout=open(os.devnull, 'w'))
+
+        posts = [os.path.join(root, name)
+                    for name in ('old.txt', 'new.txt', 'edited.txt',
+                                 'untracked.txt')]
+        for fname in posts:
+            open(fname, 'w').write('text')
+
+        git('init', '-q')
+        git('add', 'old.txt', 'edited.txt')
+        git('commit', '-q', '-m', 'old', GIT_COMMITTER_DATE='1300000000 +0000')
+        git('add', 'new.txt')
+        git('commit', '-q', '-m', 'new', GIT_COMMITTER_DATE='1400000000 +0000')
+        open(posts[2], 'a').write(' more')
+
+        ok(git_dates(posts)) == {posts[0]: 1300000000, posts[1]: 1400000000}
+    finally:
+        shutil.rmtree(root)
@@ -49,49 +49,49 @@ Some text:
     * X3
 """
 
-test_data = { data1 : [(TEXT_H1, tuple(), "_h1_"), 
+test_data = { data1 : [(TEXT_H1, tuple(), "_h1_"),
                        (TEXT_H2, tuple(), "_h2_"),
                        (TEXT_H3, tuple(), "_h3_"),
                        (TEXT_H4, tuple(), "_h4_"),
                        (TEXT_PARA, tuple(), "    MyParax\nyyyy")],
-               data2 : [('raw', tuple(), "    some_data"), 
+               data2 : [('raw', tuple(), "    some_data"),
                         ('python', tuple(), "    with y:\n        pass"),
                         ('python', tuple(), "    with y:\n        pass\n\n    x = y + 1"),
-                        ('Autor', tuple(), "koder"),
+                        (TEXT_PARA, tuple(), "Autor: koder"),
                         (TEXT_PARA, tuple(), "rrrr : some data")]
              }
 
 def test():
     for bdata, data_list in test_data.items():
-        for (need_tp, opts, need_data),(get_tp, get_data) in zip(data_list, parse(bdata)):
-            ok(need_tp) == get_tp
-            ok(need_data) == get_data
+        blocks = list(parse(bdata))
+        ok(blocks).length(len(data_list))
+        for (need_tp, opts, need_data), block in zip(data_list, blocks):
+            ok(need_tp) == block.tp
+            ok(need_data) == block.data
 
-def test_lex():
-    data = "python:x"
-    lexems = list(lex(data))
-    ok(lexems).length(1)
-    ok(lexems[0]) == (BLOCK_SLINE, [], ('python', 'x'))
+def lexems(data):
+    return [(lexem.tp, lexem.opts, lexem.data) for lexem in lex(data)]
 
-    data = "python[1,2]:x"
-    lexems = list(lex(data))
-    ok(lexems).length(1)
-    ok(lexems[0]) == (BLOCK_SLINE, ['1', '2'], ('python', 'x'))
+def test_lex():
+    # single line blocks are not supported any more
+    ok(lexems("python:x")) == [(LINE, {}, 'python:x')]
 
-    data = "python[some_tag, ff, some_else_tag]:x"
-    lexems = list(lex(data))
-    ok(lexems).length(1)
-    ok(lexems[0]) == (BLOCK_SLINE, ['some_tag', 'ff', 'some_else_tag'], ('python', 'x'))
+    ok(lexems("python[1,2]:")) == [(BLOCK_BEGIN, {'1': True, '2': True}, 'python')]
 
     data = "python:\n    x = 1\n    y = 2"
-    lexems = list(lex(data))
-    ok(lexems).length(3)
-    ok(lexems[0]) == (BLOCK_BEGIN, [], 'python')
-
-    data = "python[1, some_tag, mmm ]:\n    x = 1\n    y = 2"
-    lexems = list(lex(data))
-    ok(lexems).length(3)
-    ok(lexems[0]) == (BLOCK_BEGIN, ['1', 'some_tag', 'mmm'], 'python')
+    ok(lexems(data)) == [(BLOCK_BEGIN, {}, 'python'),
+                         (LINE, {}, '    x = 1'),
+                         (LINE, {}, '    y = 2')]
+
+    data = "python[ut,-]:\n    x = 1"
+    ok(lexems(data)[0]) == (BLOCK_BEGIN, {'ut': True, '-': True}, 'python')
+
+    data = "* item\n    more\n\ntext"
+    ok(lexems(data)) == [(LIST_ITEM_BEGIN, {}, 'item'),
+                         (LINE, {}, '    more'),
+                         (EMPTY_LINE, {}, ''),
+                         (DEINDENT, {}, None),
+                         (LINE, {}, 'text')]
 
 if __name__ == "__main__":
     test()
@@ -0,0 +1,74 @@
+# -*- coding:utf8 -*-
+from oktest import ok
+
+from nsr_links import PostLinks, LinkIndex
+from notsorest2html import get_option_parser, load_styles, render_text
+
+LXC = u"""Intro [libvirt], see [cgroups.Настройка cgroups]
+
+<---->
+
+Установка
+---------
+
+text
+
+linklist:
+    libvirt http://libvirt.org
+"""
+
+CGROUPS = u"""Uses [libvirt|библиотеку], [lxc.Установка] and [missing]
+
+<---->
+
+Настройка cgroups
+-----------------
+
+text
+"""
+
+
+def make_index(lxc=LXC, cgroups=CGROUPS):
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+    index = LinkIndex([PostLinks('posts/lxc.txt', lxc, styles),
+                       PostLinks('posts/cgroups.txt', cgroups, styles)])
+    return index, opts, styles
+
+
+def test_link_index():
+    index, _, _ = make_index()
+
+    ok(index.post_links('posts/lxc.txt')) == (
+            {u'cgroups.Настройка_cgroups': u'cgroups.html#Настройка_cgroups'},
+            frozenset([u'Установка']))
+    ok(index.post_links('posts/cgroups.txt')) == (
+            {u'libvirt': u'http://libvirt.org',
+             u'lxc.Установка': u'lxc.html#Установка'},
+            frozenset([u'Настройка_cgroups']))
+    ok(index.dangling) == {'cgroups': [u'missing']}
+
+
+def test_link_index_keys():
+    index, _, _ = make_index()
+
+    # lxc has the same links, cgroups loses heading anchor
+    new_index, _, _ = make_index(cgroups=CGROUPS.replace(u"[lxc.Установка]",
+                                                         u""))
+    ok(new_index.key('posts/cgroups.txt')) != index.key('posts/cgroups.txt')
+    ok(new_index.key('posts/lxc.txt')) != index.key('posts/lxc.txt')
+
+    new_index, _, _ = make_index(cgroups=CGROUPS + u"\nmore text\n")
+    ok(new_index.key('posts/cgroups.txt')) == index.key('posts/cgroups.txt')
+    ok(new_index.key('posts/lxc.txt')) == index.key('posts/lxc.txt')
+
+
+def test_render_site_links():
+    index, opts, styles = make_index()
+
+    res = render_text(CGROUPS, opts, styles, 'posts/cgroups.txt',
+                      links=index.post_links('posts/cgroups.txt'))
+    ok(res).contains(u'<a href="http://libvirt.org">библиотеку</a>')
+    ok(res).contains(u'<a href="lxc.html#Установка">')
+    ok(res).contains(u'<a name="Настройка_cgroups"></a>')
+    ok(res).contains(u'href="_a_href_missing"')
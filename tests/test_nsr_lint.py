@@ -0,0 +1,86 @@
+# -*- coding:utf8 -*-
+import sys
+import json
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from oktest import ok
+from nsr_cache import DiskCache
+from nsr_lint import lint_messages, report_messages, check_python_code, \
+                     lint_batch, Snippet
+
+
+def test_cached_messages_remapped():
+    root = tempfile.mkdtemp()
+    stdout = sys.stdout
+    try:
+        cache = DiskCache(root)
+        snippet = Snippet(u"import os\n", 100)
+
+        messages = lint_messages(snippet, cache)
+        ok(messages).contains(('W0611', 3, 'Unused import os'))
+        ok(lint_messages(snippet, cache)) == messages
+        ok(cache.stats()['hits']) == 1
+
+        sys.stdout = StringIO()
+        report_messages(messages, 100)
+        ok(sys.stdout.getvalue()).contains(
+                    "Python block in line 101: W0611 Unused import os")
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(root)
+
+
+def test_syntax_error_line():
+    try:
+        check_python_code(u"x = 1\nx = = 2\n", 10, use_lint=False)
+    except SyntaxError as err:
+        ok(err.lineno) == 12
+    else:
+        assert False, "SyntaxError expected"
+
+
+def test_batch_lint_routing():
+    snippets = [(('a', 10), (10, u"import os\n")),
+                (('b', 20), (20, u"x = 1\nimport sys\n")),
+                (('c', 30), (30, u"x = = 1\n"))]
+
+    res = lint_batch(snippets)
+
+    ok(res).not_contain(('c', 30))
+    ok(res[('a', 10)]).contains(('W0611', 3, 'Unused import os'))
+    ok(res[('b', 20)]).contains(('W0611', 4, 'Unused import sys'))
+    ok(res[('a', 10)]) == lint_messages(Snippet(u"import os\n", 10))
+
+
+def test_execute_in_memory():
+    stdout = sys.stdout
+    try:
+        sys.stdout = StringIO()
+        check_python_code(u"import sys\nprint __name__\n", 1,
+                          use_lint=False, imp_mod=True)
+        ok(sys.stdout.getvalue()) == "module\n"
+        ok(sys.modules).not_contain('module')
+    finally:
+        sys.stdout = stdout
+
+
+def test_cached_non_ascii_messages():
+    root = tempfile.mkdtemp()
+    stdout = sys.stdout
+    try:
+        cache = DiskCache(root)
+        code = u"x = 1 # FIXME: сделать\n"
+
+        for _ in range(2):
+            sys.stdout = StringIO()
+            check_python_code(code, 10, cache=cache)
+            output = sys.stdout.getvalue()
+            sys.stdout = stdout
+            ok(output).contains("W0511 FIXME: сделать")
+
+        ok(cache.stats()['hits']) == 1
+    finally:
+        sys.stdout = stdout
+        shutil.rmtree(root)
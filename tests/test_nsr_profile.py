@@ -0,0 +1,44 @@
+from cStringIO import StringIO
+
+from oktest import ok
+
+import nsr_profile
+from notsorest2html import get_option_parser, load_styles, render_text
+
+POST = u"""Some *text*
+
+python:
+    x = 1
+
+shell:
+    $ ls
+"""
+
+
+def test_profile_render():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+
+    profiler = nsr_profile.enable()
+    try:
+        res = render_text(POST, opts, styles)
+    finally:
+        nsr_profile.disable()
+
+    ok(render_text(POST, opts, styles)) == res
+    ok(nsr_profile.span('x', 'y')).is_(nsr_profile.NULL_SPAN)
+
+    events = profiler.trace()['traceEvents']
+    names = [(event['cat'], event['name']) for event in events]
+    ok(names).contains(('lex', 'lex'))
+    ok(names).contains(('parse', 'parse'))
+    ok(names).contains(('highlight', 'PythonLexer'))
+    ok(names).contains(('block', 'shell'))
+
+    block = [event for event in events if event['name'] == 'python'][0]
+    ok(block['args']['line']) == 3
+    ok(block['ph']) == 'X'
+
+    out = StringIO()
+    profiler.summary(2, out)
+    ok(out.getvalue()).contains("Top 2 slowest blocks")
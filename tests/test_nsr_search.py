@@ -0,0 +1,69 @@
+# -*- coding:utf8 -*-
+import shutil
+import tempfile
+
+from oktest import ok
+
+from nsr_search import vlq_encode, vlq_decode, encode_postings, \
+                       decode_postings, post_terms, build_index, \
+                       write_index, search
+from notsorest2html import get_option_parser, load_styles
+
+POST = u"""=========
+LXC howto
+=========
+
+Intro about *containers* and http://lxc.org/containers
+
+<---->
+
+Containers
+----------
+
+* containers list
+
+python:
+    containers = []
+"""
+
+
+def test_vlq():
+    numbers = [0, 1, 31, 32, 1000, 2 ** 31]
+    ok(vlq_decode(vlq_encode(numbers))) == numbers
+    ok(vlq_encode([1, 31])) == "Bf"
+
+    postings = [(0, 3), (5, 1), (1000, 7)]
+    ok(decode_postings(encode_postings(postings))) == postings
+
+
+def test_post_terms():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+
+    title, terms = post_terms(POST, styles)
+    ok(title) == u"LXC howto"
+    # two headers with weight 5, paragraph and list item, url is skipped
+    ok(terms[u'containers']) == 7
+    ok(terms[u'lxc']) == 5
+
+    ok(post_terms(POST, styles, with_code=True)[1][u'containers']) == 8
+
+
+def test_search():
+    docs = [('a.html', u"A", {u'lxc': 1, u'python': 3}),
+            ('b.html', u"B", {u'python': 5}),
+            ('c.html', u"C", {u'lxc': 2})]
+    index, shards = build_index(docs, 4)
+    ok(len(shards)) == 4
+
+    root = tempfile.mkdtemp()
+    try:
+        ok(write_index(root, index, shards)) == 5
+        ok(write_index(root, index, shards)) == 0
+
+        ok(search(root, u"Python")) == [[u'b.html', u"B", 5],
+                                        [u'a.html', u"A", 3]]
+        ok(search(root, u"python lxc")) == [[u'a.html', u"A", 4]]
+        ok(search(root, u"missing")) == []
+    finally:
+        shutil.rmtree(root)
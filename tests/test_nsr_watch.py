@@ -0,0 +1,86 @@
+import os
+import sys
+import shutil
+import tempfile
+from cStringIO import StringIO
+
+from oktest import ok
+
+import nsr_build
+from nsr_watch import PollingWatcher, code_users, watch
+
+
+def test_polling_watcher():
+    root = tempfile.mkdtemp()
+    try:
+        post = os.path.join(root, 'post.txt')
+        new_post = os.path.join(root, 'new.txt')
+        open(post, 'w').write('text')
+
+        watcher = PollingWatcher([root])
+        ok(watcher.wait(0)) == set()
+
+        open(post, 'a').write(' more')
+        open(new_post, 'w').write('text')
+        ok(watcher.wait(1)) == set([post, new_post])
+
+        os.unlink(post)
+        ok(watcher.wait(1)) == set([post])
+    finally:
+        shutil.rmtree(root)
+
+
+def test_code_users():
+    root = tempfile.mkdtemp()
+    try:
+        posts = [os.path.join(root, name)
+                    for name in ('cgroups.txt', 'lxc.txt', 'other.txt')]
+        open(posts[0], 'w').write('text')
+        open(posts[1], 'w').write('see code/clear_cgroups')
+        open(posts[2], 'w').write('text')
+
+        ok(code_users('code/cgroups.py', posts)) == posts[:1]
+        ok(code_users('code/clear_cgroups', posts)) == posts[1:2]
+    finally:
+        shutil.rmtree(root)
+
+
+class ScriptedWatcher(object):
+    "returns changes from list, then stops watch with Ctrl-C"
+    def __init__(self, changes):
+        self.changes = list(changes)
+
+    def wait(self, timeout=None):
+        if timeout is not None:
+            return set()
+        if not self.changes:
+            raise KeyboardInterrupt()
+        return self.changes.pop(0)
+
+
+def test_watch_survives_removed_post():
+    root = tempfile.mkdtemp()
+    calls = []
+
+    def build(files, opts, forced=(), list_skipped=True):
+        calls.append(files)
+        if len(calls) == 2:
+            raise IOError(2, "No such file or directory", files[0])
+
+    orig_build = nsr_build.build
+    nsr_build.build = build
+    stdout = sys.stdout
+    sys.stdout = StringIO()
+    try:
+        post = os.path.join(root, 'post.txt')
+        open(post, 'w').write('text')
+        opts, _ = nsr_build.get_option_parser().parse_args(['-n', '-c', ''])
+
+        watcher = ScriptedWatcher([set([post]), set([post])])
+        ok(watch([root], opts, watcher)) == 0
+        ok(len(calls)) == 3
+        ok(sys.stdout.getvalue()).contains("ERROR: rebuild failed")
+    finally:
+        sys.stdout = stdout
+        nsr_build.build = orig_build
+        shutil.rmtree(root)
@@ -0,0 +1,203 @@
+# -*- coding:utf8 -*-
+import io
+import os
+import re
+import sys
+import tempfile
+from cStringIO import StringIO
+
+from oktest import ok, NOT
+
+from nsr_lexer import iter_lines, parse
+from notsorest2html import get_option_parser, load_styles, render_text, \
+                           BlogspotHTMLProvider, PostFile
+
+POST = u"""Intro with [ref] and *bold*
+
+<---->
+
+python:
+    def func(x):
+        return x
+
+* item [other|link]
+* http://example.com/item
+
+linklist:
+    ref http://example.com/ref
+    other http://example.com/other
+"""
+
+re_id = re.compile(r"[0-9a-f]{32}")
+
+
+def test_stream_same_as_memory():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+
+    res = render_text(POST, opts, styles).encode('utf8')
+
+    out = StringIO()
+    ok(render_text(POST, opts, styles, out=out)) == ""
+
+    ok(out.getvalue()) == res
+    ok(res).contains('<a href="http://example.com/other">link</a>')
+
+    fd, fname = tempfile.mkstemp(suffix='.txt')
+    try:
+        os.write(fd, POST.replace(u"    ", u"\t").encode('utf8'))
+        os.close(fd)
+        out = StringIO()
+        render_text(PostFile(fname), opts, styles, out=out)
+        ok(out.getvalue()) == res
+    finally:
+        os.unlink(fname)
+
+
+def test_stream_reports_dangling_backrefs():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+    text = POST + u"\nText with [nolink]\n"
+
+    for out in (None, StringIO()):
+        stdout = sys.stdout
+        sys.stdout = StringIO()
+        try:
+            render_text(text, opts, styles, out=out)
+            output = sys.stdout.getvalue()
+        finally:
+            sys.stdout = stdout
+        ok(output).contains("ERROR: backerfs nolink have no links")
+        NOT(output).contains("ref,")
+
+
+def test_iter_lines():
+    for text in (u"", u"a", u"a\n", u"\n\nb\nc"):
+        ok(list(iter_lines(text))) == text.split('\n')
+        ok(list(iter_lines(io.StringIO(text)))) == text.split('\n')
+
+
+def test_render_is_stable():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+    text = POST + u"\npython:\n    def func(x):\n        return x\n"
+
+    res = render_text(text, opts, styles, 'post.txt')
+    ok(render_text(text, opts, styles, 'post.txt')) == res
+
+    # two blocks with the same code get different ids
+    ok(len(set(re_id.findall(res)))) == 4
+    ok(render_text(text, opts, styles, 'other.txt')) != res
+
+
+def test_compact_code():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+    text = POST + u"\nhide.python:\n    x = 1\n    #----\n    y = x\n" + \
+                  u"    #----\n    z = y\n"
+
+    full = render_text(text, opts, styles)
+
+    opts.compact_code = True
+    compact = render_text(text, opts, styles)
+    NOT(compact).contains('jquery')
+    ok(compact).contains('(function () {')
+    ok(len(compact)) < len(full)
+
+    # raw copy is kept only for splitted block
+    ok(compact.count('<pre')) == 3
+    ok(compact.count('class="nsr-raw"')) == 1
+
+    opts.toggle_script = 'nsr_toggle.js'
+    ok(render_text(text, opts, styles)).contains(
+                    '<script type="text/javascript" src="nsr_toggle.js">')
+
+
+def test_register_block():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+
+    class Provider(BlogspotHTMLProvider):
+        pass
+
+    @Provider.register_block('note')
+    def on_note(self, data, line):
+        self.write_raw(u"<note line={0}>{1}</note>".format(line,
+                                                    u" ".join(data.split())))
+
+    Provider.register_wrapper('box', lambda self: self.write_raw(u"<box>"),
+                                     lambda self: self.write_raw(u"</box>"))
+    Provider.register_lexer('js', 'JavascriptLexer')
+
+    text = u"a\n\n<---->\n\nbox.note:\n    x\n    y\n\njs:\n    var x = 1;\n"
+    html = Provider(opts)
+    for block in parse(text):
+        html.process(block)
+
+    res = html.get_result()
+    ok(res).contains(u"<box><note line=5>x y</note></box>")
+    ok(res).contains(u'<span style="color: #008000; font-weight: bold">var')
+
+    # base class is not changed
+    ok('js' in BlogspotHTMLProvider.highlighters_map) == False
+    ok('note' in BlogspotHTMLProvider.dispatch_table()) == False
+
+
+def test_block_jobs_same_output():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', ''])
+    styles = load_styles(opts)
+    text = POST + u"\nshell:\n    $ ls\n\nhide.python:\n    x = 1\n" + \
+                  u"    #----\n    y = x\n    #----\n    z = y\n"
+
+    res = render_text(text, opts, styles)
+
+    opts.block_jobs = 2
+    ok(render_text(text, opts, styles)) == res
+
+
+def test_block_pool_started_on_cache_miss():
+    import shutil
+    import tempfile
+    from notsorest2html import typed_blocks
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        opts, _ = get_option_parser().parse_args(['-n', '-c', tmp_dir])
+        styles = load_styles(opts)
+
+        formatter = BlogspotHTMLProvider(opts)
+        formatter.prefetch_highlight(typed_blocks(POST, styles), 2)
+        ok(formatter.block_pool) != None
+        formatter.block_pool.close()
+
+        render_text(POST, opts, styles)
+        formatter = BlogspotHTMLProvider(opts)
+        formatter.prefetch_highlight(typed_blocks(POST, styles), 2)
+        ok(formatter.block_pool) == None
+        ok(len(formatter.prefetched)) == 1
+    finally:
+        shutil.rmtree(tmp_dir)
+
+
+def test_standalone_stylesheet_in_head():
+    opts, _ = get_option_parser().parse_args(['-n', '-c', '', '-a',
+                                              '--css-classes',
+                                              '--stylesheet', 'site.css'])
+    html = render_text(POST, opts, load_styles(opts))
+    ok(html.startswith('<html><head>')) == True
+    ok(html.index('<link rel="stylesheet"')) < html.index('</head><body>')
+
+
+def test_no_ut():
+    import notsorest2html
+
+    def get_executor(*args):
+        raise AssertionError("ut block executed")
+
+    opts, _ = get_option_parser().parse_args(['-n', '-c', '', '--no-ut'])
+    text = u"Intro\n\n<---->\n\npython[ut]:\n    x = 1\n"
+    orig_get_executor = notsorest2html.get_executor
+    notsorest2html.get_executor = get_executor
+    try:
+        ok(render_text(text, opts, load_styles(opts))).contains("x")
+    finally:
+        notsorest2html.get_executor = orig_get_executor